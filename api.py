@@ -1,101 +1,173 @@
-from fastapi import FastAPI, HTTPException, Query, Request
-from sqlalchemy import select, text
-from db import engine
-from model import characters, planets
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from starlette.routing import Match
+from pydantic import BaseModel, Field
+import export
+import queries
+import read_model
+import search_index
+import stats
+from queries import CHARACTER_FIELDS, PLANET_FIELDS
+from serialize import JSONBytesResponse, negotiate_encoding, compress, gzip_stream
 from logger_config import setup_logger
+from metrics import Counter, Gauge, Histogram, render as render_metrics
+from config import RESPONSE_CACHE_ENABLED, READ_MODEL_ENABLED, BATCH_MAX_ITEMS
+from generation import cached_generation, current_generation, on_generation_change
+from response_cache import ResponseCache, validator_headers, not_modified
+from db import get_engine
+from model import ensure_schema
+import base64
+import json
 import time
-import pandas as pd
-
-from main import (
-    char_info,
-    new_char_info,
-    LIMIT,
-    load_homeworld_cache,
-    HOMEWORLD_CACHE_FILE,
-    fetch_homeworld,
-    FINAL_CSV_FILE,
-    FINAL_JSON_FILE,
-    load_data,
-)
 
-app = FastAPI(title="Star Wars Character Registry")
+# Nothing here imports the ETL (main, pandas, the loader): a worker starts
+# on the read path alone, and connects to the database in lifespan, not at
+# import
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(ensure_schema, get_engine())
+    if READ_MODEL_ENABLED:
+        generation, _ = await run_in_threadpool(current_generation)
+        await run_in_threadpool(read_model.refresh, generation)
+        # Rebuild off the request path whenever a newer generation shows up
+        on_generation_change(read_model.refresh_in_background)
+    elif not queries.trigram_search():
+        # Name search indexes follow each load instead of the first search
+        on_generation_change(search_index.rebuild_in_background)
+    yield
+
+
+app = FastAPI(title="Star Wars Character Registry", lifespan=lifespan)
+
+
+# Reads go to the in-memory model when it is enabled and matches the
+# current generation; while a newer one is being loaded, SQL serves it
+def data():
+    if READ_MODEL_ENABLED:
+        model = read_model.current()
+        known = cached_generation()
+        if model is not None and known is not None and model.generation == known[0]:
+            return model
+    return queries
 
 # =========================
 # GET ALL CHARACTERS
 # =========================
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def parse_fields(fields):
+    if not fields:
+        return CHARACTER_FIELDS, PLANET_FIELDS
+
+    character_fields, planet_fields = ["id"], []
+    for field in (f.strip() for f in fields.split(",")):
+        if field == "planet":
+            planet_fields = list(PLANET_FIELDS)
+        elif field.startswith("planet.") and field[7:] in PLANET_FIELDS:
+            planet_fields.append(field[7:])
+        elif field in CHARACTER_FIELDS:
+            if field not in character_fields:
+                character_fields.append(field)
+        elif field:
+            raise HTTPException(status_code=400, detail=f"Unknown field: {field}")
+    return character_fields, planet_fields
+
+
+def encode_cursor(value, row_id):
+    raw = json.dumps([value, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+# substring (default), prefix, or fuzzy (typo tolerant, ranked by similarity)
+MATCH_PATTERN = "^(" + "|".join(search_index.MATCH_MODES) + ")$"
+
+
+def decode_cursor(cursor):
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return value, int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
 @app.get("/characters")
 def get_characters(
     name: str | None = Query(default=None),
+    match: str = Query(default="substring", pattern=MATCH_PATTERN),
     planet: str | None = Query(default=None),
+    after_id: int | None = Query(default=None),
+    cursor: str | None = Query(default=None),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    sort: str = Query(default="id"),
+    fields: str | None = Query(default=None),
+    include: str | None = Query(default=None, pattern="^planet$"),
+    min_height: float | None = Query(default=None),
+    max_height: float | None = Query(default=None),
+    min_mass: float | None = Query(default=None),
+    max_mass: float | None = Query(default=None),
+    min_population: int | None = Query(default=None),
+    max_population: int | None = Query(default=None),
 ):
-    with engine.connect() as conn:
-        query = """
-            SELECT
-                c.id,
-                c.name,
-                c.height,
-                c.mass,
-                c.gender,
-                c.birth_year,
-
-                p.name AS planet_name,
-                p.climate,
-                p.terrain,
-                p.population,
-                p.rotation_period,
-                p.orbital_period,
-                p.diameter,
-                p.gravity,
-                p.surface_water
-
-            FROM characters c
-            LEFT JOIN planets p
-                ON c.planet_id = p.id
-            WHERE 1=1
-        """
-
-        params = {}
-
-        if name:
-            query += " AND c.name ILIKE :name"
-            params["name"] = f"%{name}%"
-
-        if planet:
-            query += " AND p.name ILIKE :planet"
-            params["planet"] = f"%{planet}%"
-
-        query += " ORDER BY c.id"
-
-        result = conn.execute(text(query), params)
-        rows = result.fetchall()
-
-        output = []
-        for row in rows:
-            d = dict(row._mapping)
-
-            character = {
-                "id": d["id"],
-                "name": d["name"],
-                "height": d["height"],
-                "mass": d["mass"],
-                "gender": d["gender"],
-                "birth_year": d["birth_year"],
-                "planet": {
-                    "name": d["planet_name"],
-                    "climate": d["climate"],
-                    "terrain": d["terrain"],
-                    "population": d["population"],
-                    "rotation_period": d["rotation_period"],
-                    "orbital_period": d["orbital_period"],
-                    "diameter": d["diameter"],
-                    "gravity": d["gravity"],
-                    "surface_water": d["surface_water"],
-                },
-            }
-
-            output.append(character)
-
-        return output
+    character_fields, planet_fields = parse_fields(fields)
+
+    try:
+        items, next_cursor = data().list_characters(
+            character_fields,
+            planet_fields,
+            sort=sort,
+            name=name,
+            planet=planet,
+            after_id=after_id,
+            cursor=decode_cursor(cursor) if cursor else None,
+            limit=limit,
+            match=match,
+            include=include,
+            min_height=min_height,
+            max_height=max_height,
+            min_mass=min_mass,
+            max_mass=max_mass,
+            min_population=min_population,
+            max_population=max_population,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    response = JSONBytesResponse(items)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = encode_cursor(*next_cursor)
+    return response
+
+
+# =========================
+# BATCH LOOKUPS
+# =========================
+# One request and one query per chunk instead of a GET per item. Results
+# keep the request order; keys that matched nothing come back found=false.
+class BatchLookup(BaseModel):
+    ids: list[int] | None = Field(default=None, max_length=BATCH_MAX_ITEMS)
+    names: list[str] | None = Field(default=None, max_length=BATCH_MAX_ITEMS)
+
+
+def batch_response(lookup, by_ids, by_names):
+    if (lookup.ids is None) == (lookup.names is None):
+        raise HTTPException(status_code=400, detail="Send either ids or names")
+    keys = lookup.ids if lookup.ids is not None else lookup.names
+    items = by_ids(keys) if lookup.ids is not None else by_names(keys)
+    return JSONBytesResponse(
+        [{"key": k, "found": item is not None, "data": item} for k, item in zip(keys, items)]
+    )
+
+
+@app.post("/characters/batch")
+def get_characters_batch(lookup: BatchLookup):
+    source = data()
+    return batch_response(lookup, source.characters_by_ids, source.characters_by_names)
 
 
 # =========================
@@ -103,60 +175,10 @@ def get_characters(
 # =========================
 @app.get("/characters/name/{name}")
 def get_character_by_name(name: str):
-    with engine.connect() as conn:
-        result = conn.execute(
-            select(
-                characters.c.id,
-                characters.c.name,
-                characters.c.height,
-                characters.c.mass,
-                characters.c.gender,
-                characters.c.birth_year,
-
-                planets.c.name.label("planet_name"),
-                planets.c.climate,
-                planets.c.terrain,
-                planets.c.population,
-                planets.c.rotation_period,
-                planets.c.orbital_period,
-                planets.c.diameter,
-                planets.c.gravity,
-                planets.c.surface_water,
-            )
-            .select_from(
-                characters.join(
-                    planets,
-                    characters.c.planet_id == planets.c.id,
-                    isouter=True,
-                )
-            )
-            .where(characters.c.name.ilike(name))
-        ).fetchone()
-
-        if not result:
-            raise HTTPException(status_code=404, detail="Character not found")
-
-        d = dict(result._mapping)
-
-        return {
-            "id": d["id"],
-            "name": d["name"],
-            "height": d["height"],
-            "mass": d["mass"],
-            "gender": d["gender"],
-            "birth_year": d["birth_year"],
-            "planet": {
-                "name": d["planet_name"],
-                "climate": d["climate"],
-                "terrain": d["terrain"],
-                "population": d["population"],
-                "rotation_period": d["rotation_period"],
-                "orbital_period": d["orbital_period"],
-                "diameter": d["diameter"],
-                "gravity": d["gravity"],
-                "surface_water": d["surface_water"],
-            },
-        }
+    character = data().character_by_name(name)
+    if not character:
+        raise HTTPException(status_code=404, detail="Character not found")
+    return JSONBytesResponse(character)
 
 
 # =========================
@@ -164,167 +186,243 @@ def get_character_by_name(name: str):
 # =========================
 @app.get("/characters/{character_id}")
 def get_character_by_id(character_id: int):
-    with engine.connect() as conn:
-        result = conn.execute(
-            select(
-                characters.c.id,
-                characters.c.name,
-                characters.c.height,
-                characters.c.mass,
-                characters.c.gender,
-                characters.c.birth_year,
-
-                planets.c.name.label("planet_name"),
-                planets.c.climate,
-                planets.c.terrain,
-                planets.c.population,
-                planets.c.rotation_period,
-                planets.c.orbital_period,
-                planets.c.diameter,
-                planets.c.gravity,
-                planets.c.surface_water,
-            )
-            .select_from(
-                characters.join(
-                    planets,
-                    characters.c.planet_id == planets.c.id,
-                    isouter=True,
-                )
-            )
-            .where(characters.c.id == character_id)
-        ).fetchone()
-
-        if not result:
-            raise HTTPException(status_code=404, detail="Character not found")
-
-        d = dict(result._mapping)
-
-        return {
-            "id": d["id"],
-            "name": d["name"],
-            "height": d["height"],
-            "mass": d["mass"],
-            "gender": d["gender"],
-            "birth_year": d["birth_year"],
-            "planet": {
-                "name": d["planet_name"],
-                "climate": d["climate"],
-                "terrain": d["terrain"],
-                "population": d["population"],
-                "rotation_period": d["rotation_period"],
-                "orbital_period": d["orbital_period"],
-                "diameter": d["diameter"],
-                "gravity": d["gravity"],
-                "surface_water": d["surface_water"],
-            },
-        }
+    character = data().character_by_id(character_id)
+    if not character:
+        raise HTTPException(status_code=404, detail="Character not found")
+    return JSONBytesResponse(character)
 
 
 
 # GET ALL PLANETS
 
 @app.get("/planets")
-def get_planets(name: str | None = Query(default=None)):
-    with engine.connect() as conn:
-        query = select(planets)
-        if name:
-            query = query.where(planets.c.name.ilike(f"%{name}%"))
+def get_planets(
+    name: str | None = Query(default=None),
+    match: str = Query(default="substring", pattern=MATCH_PATTERN),
+    include: str | None = Query(default=None, pattern="^characters$"),
+    after_id: int | None = Query(default=None),
+    cursor: str | None = Query(default=None),
+    limit: int | None = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+):
+    # Planets are few, so paging is opt-in; ordered by id, the cursor is the id
+    if cursor:
+        after_id = decode_cursor(cursor)[1]
+    try:
+        items = data().list_planets(name, match, include, after_id=after_id, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    response = JSONBytesResponse(items)
+    if limit is not None and len(items) == limit and not (name and match == "fuzzy"):
+        last_id = items[-1]["id"]
+        response.headers["X-Next-Cursor"] = encode_cursor(last_id, last_id)
+    return response
+
 
-        result = conn.execute(query.order_by(planets.c.id))
-        return [dict(row._mapping) for row in result]
+@app.post("/planets/batch")
+def get_planets_batch(lookup: BatchLookup):
+    source = data()
+    return batch_response(lookup, source.planets_by_ids, source.planets_by_names)
 
 
 # GET PLANET BY NAME
 @app.get("/planets/name/{name}")
 def get_planet_by_name(name: str):
-    with engine.connect() as conn:
-        result = conn.execute(
-            select(planets).where(planets.c.name.ilike(name))
-        ).fetchone()
-
-        if not result:
-            raise HTTPException(status_code=404, detail="Planet not found")
-
-        return dict(result._mapping)
+    planet = data().planet_by_name(name)
+    if not planet:
+        raise HTTPException(status_code=404, detail="Planet not found")
+    return JSONBytesResponse(planet)
     
 # GET PLANET BY ID
 @app.get("/planets/id/{planet_id}")
 def get_planet_by_id(planet_id: int):
-    with engine.connect() as conn:
-        result = conn.execute(
-            select(planets).where(planets.c.id == planet_id)
-        ).fetchone()
-
-        if not result:
-            raise HTTPException(status_code=404, detail="Planet not found")
-
-        return dict(result._mapping)
+    planet = data().planet_by_id(planet_id)
+    if not planet:
+        raise HTTPException(status_code=404, detail="Planet not found")
+    return JSONBytesResponse(planet)
     
  # GET PLANET WITH CHARACTERS   
 @app.get("/planets/name/{planet_name}/characters")
 def get_planet_with_characters(planet_name: str):
-    with engine.connect() as conn:
-        rows = conn.execute(
-            select(
-                planets.c.id.label("planet_id"),
-                planets.c.name.label("planet_name"),
-                planets.c.climate,
-                planets.c.terrain,
-                planets.c.population,
-                planets.c.rotation_period,
-                planets.c.orbital_period,
-                planets.c.diameter,
-                planets.c.gravity,
-                planets.c.surface_water,
-
-                characters.c.id.label("character_id"),
-                characters.c.name.label("character_name"),
-                characters.c.height,
-                characters.c.mass,
-                characters.c.gender,
-                characters.c.birth_year,
-            )
-            .select_from(
-                planets.join(
-                    characters,
-                    planets.c.id == characters.c.planet_id,
-                    isouter=True,
-                )
+    planet = data().planet_with_characters(planet_name)
+    if not planet:
+        raise HTTPException(status_code=404, detail="Planet not found")
+    return JSONBytesResponse(planet)
+
+# STATS
+
+# Aggregates precomputed by run_etl, one summary_stats row each
+@app.get("/stats")
+def get_stats():
+    return JSONBytesResponse(stats.list_stats())
+
+
+@app.get("/stats/group-by")
+def get_stats_group_by(
+    by: str = Query(),
+    agg: str = Query(default="count"),
+    field: str | None = Query(default=None),
+):
+    try:
+        body = stats.group_by(by, agg, field)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=body, media_type="application/json")
+
+
+@app.get("/stats/{name}")
+def get_stat(name: str):
+    body = stats.stat(name)
+    if body is None:
+        raise HTTPException(status_code=404, detail="Statistic not found")
+    return Response(content=body, media_type="application/json")
+
+
+# EXPORTS
+
+# Full dumps streamed from a server-side cursor in constant memory,
+# gzip-encoded on the fly when accepted (Parquet is compressed already)
+EXPORT_FORMAT_PATTERN = "^(" + "|".join(export.MEDIA_TYPES) + ")$"
+
+
+def export_response(request, fmt, name, export_body):
+    try:
+        body = export_body()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+
+    headers = {"Content-Disposition": f'attachment; filename="{name}.{fmt}"'}
+    if fmt != "parquet":
+        headers["Vary"] = "Accept-Encoding"
+        accept = request.headers.get("accept-encoding")
+        if negotiate_encoding(accept, allow_br=False) == "gzip":
+            body = gzip_stream(body)
+            headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(body, media_type=export.MEDIA_TYPES[fmt], headers=headers)
+
+
+@app.get("/export/characters")
+def export_characters(
+    request: Request,
+    format: str = Query(default="ndjson", pattern=EXPORT_FORMAT_PATTERN),
+    name: str | None = Query(default=None),
+    match: str = Query(default="substring", pattern=MATCH_PATTERN),
+    planet: str | None = Query(default=None),
+    sort: str = Query(default="id"),
+    fields: str | None = Query(default=None),
+    min_height: float | None = Query(default=None),
+    max_height: float | None = Query(default=None),
+    min_mass: float | None = Query(default=None),
+    max_mass: float | None = Query(default=None),
+    min_population: int | None = Query(default=None),
+    max_population: int | None = Query(default=None),
+):
+    character_fields, planet_fields = parse_fields(fields)
+    return export_response(
+        request,
+        format,
+        "characters",
+        lambda: export.export_characters(
+            format,
+            character_fields,
+            planet_fields,
+            sort=sort,
+            name=name,
+            planet=planet,
+            match=match,
+            min_height=min_height,
+            max_height=max_height,
+            min_mass=min_mass,
+            max_mass=max_mass,
+            min_population=min_population,
+            max_population=max_population,
+        ),
+    )
+
+
+@app.get("/export/planets")
+def export_planets(
+    request: Request,
+    format: str = Query(default="ndjson", pattern=EXPORT_FORMAT_PATTERN),
+    name: str | None = Query(default=None),
+    match: str = Query(default="substring", pattern=MATCH_PATTERN),
+):
+    return export_response(
+        request, format, "planets", lambda: export.export_planets(format, name, match)
+    )
+
+
+# RESPONSE CACHE
+
+# Read endpoints whose responses only change when a load commits
+CACHED_PREFIXES = ("/characters", "/planets", "/stats")
+response_cache = ResponseCache()
+
+
+@app.get("/cache/stats")
+def get_cache_stats():
+    return response_cache.stats()
+
+
+@app.middleware("http")
+async def cache_responses(request: Request, call_next):
+    if request.method not in ("GET", "HEAD") or not request.url.path.startswith(
+        CACHED_PREFIXES
+    ):
+        return await call_next(request)
+
+    generation, loaded_at = cached_generation() or await run_in_threadpool(
+        current_generation
+    )
+    # Each content-encoding is its own representation (and ETag)
+    encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    key = ResponseCache.make_key(
+        request.url.path, request.query_params.multi_items(), encoding
+    )
+    validators = validator_headers(key, generation, loaded_at)
+
+    # Revalidation of a known ETag is answered from the generation alone
+    if not_modified(request.headers, validators, exists=False):
+        return Response(status_code=304, headers=validators)
+
+    if RESPONSE_CACHE_ENABLED:
+        cached = response_cache.get(key, generation)
+        if cached is not None:
+            if not_modified(request.headers, validators):
+                return Response(status_code=304, headers=validators)
+            status, headers, body = cached
+            return Response(
+                content=body, status_code=status, headers={**headers, "X-Cache": "HIT"}
             )
-            .where(planets.c.name.ilike(planet_name))
-        ).fetchall()
-
-        if not rows:
-            raise HTTPException(status_code=404, detail="Planet not found")
-
-        planet = {
-            "id": rows[0].planet_id,
-            "name": rows[0].planet_name,
-            "climate": rows[0].climate,
-            "terrain": rows[0].terrain,
-            "population": rows[0].population,
-            "rotation_period": rows[0].rotation_period,
-            "orbital_period": rows[0].orbital_period,
-            "diameter": rows[0].diameter,
-            "gravity": rows[0].gravity,
-            "surface_water": rows[0].surface_water,
-            "characters": [],
-        }
-
-        for row in rows:
-            if row.character_id:
-                planet["characters"].append(
-                    {
-                        "id": row.character_id,
-                        "name": row.character_name,
-                        "height": row.height,
-                        "mass": row.mass,
-                        "gender": row.gender,
-                        "birth_year": row.birth_year,
-                    }
-                )
-
-        return planet
+
+    response = await call_next(request)
+    if response.status_code != 200:
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    body, used = compress(body, encoding)
+
+    headers = {
+        k: v for k, v in response.headers.items() if k.lower() != "content-length"
+    }
+    headers.update(validators)
+    headers["Vary"] = "Accept-Encoding"
+    if used != "identity":
+        headers["Content-Encoding"] = used
+
+    if RESPONSE_CACHE_ENABLED:
+        response_cache.put(key, generation, response.status_code, headers, body)
+    # The resource exists: "*" and If-Modified-Since can match now
+    if not_modified(request.headers, validators):
+        return Response(status_code=304, headers=validators)
+    return Response(
+        content=body,
+        status_code=response.status_code,
+        headers={**headers, "X-Cache": "MISS"},
+    )
+
 
 # LOGGING
 
@@ -348,3 +446,65 @@ async def log_requests(request: Request, call_next):
             f"duration_ms={duration_ms:.2f} error={str(e)}"
         )
         raise
+
+
+# METRICS
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time until the response starts, per route",
+    ["method", "route"],
+)
+REQUESTS = Counter("http_requests_total", "Requests answered", ["method", "route", "status"])
+IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being handled", ["route"])
+
+
+def cache_values(field):
+    return lambda: {(): response_cache.stats()[field]}
+
+
+Counter("response_cache_hits_total", "Responses served from the cache", collect=cache_values("hits"))
+Counter("response_cache_misses_total", "Cache lookups that missed", collect=cache_values("misses"))
+Counter(
+    "response_cache_evictions_total", "Entries evicted for space", collect=cache_values("evictions")
+)
+Gauge("response_cache_hit_ratio", "Hits over lookups since start", collect=cache_values("hit_ratio"))
+Gauge("response_cache_entries", "Cached responses", collect=cache_values("entries"))
+Gauge("response_cache_bytes", "Bytes of cached responses", collect=cache_values("bytes"))
+
+
+# Route template for the labels ("/characters/{character_id}"), so series
+# stay one per endpoint; resolved once per distinct method and path
+@lru_cache(maxsize=4096)
+def route_template(method, path):
+    scope = {"type": "http", "method": method, "path": path, "root_path": ""}
+    partial = None
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and partial is None:
+            partial = route.path
+    return partial or "unmatched"
+
+
+@app.get("/metrics")
+def get_metrics():
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# Outermost, so cache hits and 304s are timed too
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    route = route_template(request.method, request.url.path)
+    IN_FLIGHT.inc(route=route)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        IN_FLIGHT.dec(route=route)
+        REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, route=route)
+        REQUESTS.inc(method=request.method, route=route, status=status)
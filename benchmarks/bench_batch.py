@@ -0,0 +1,54 @@
+# Fan-out cost of fetching many characters through the API: one GET per id
+# (what consumers do today) against a single POST /characters/batch.
+# Runs in-process through TestClient, so it measures per-request server
+# overhead only; real network round trips widen the gap further.
+#
+#   python -m benchmarks.bench_batch [characters] [ids]
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+import queries
+from benchmarks.synthetic import make_final_df
+from load_to_db import load_data
+from model import metadata
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def main(n, k):
+    db_engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+    metadata.create_all(db_engine)
+    load_data(make_final_df(n), db_engine=db_engine, mode="full")
+    queries.engine = db_engine
+
+    from api import app
+
+    client = TestClient(app)
+    ids = np.random.default_rng(0).integers(1, n + 1, k).tolist()
+    # Distinct query strings keep the response cache out of the loop
+    single, singles = timed(
+        lambda: [client.get(f"/characters/{i}", params={"r": r}).json() for r, i in enumerate(ids)]
+    )
+    batch, response = timed(lambda: client.post("/characters/batch", json={"ids": ids}).json())
+    assert [r["data"] for r in response] == singles
+
+    print(f"{k:,} ids out of {n:,} characters")
+    print(f"{'GET per id':<16}{single * 1000:>10.1f} ms")
+    print(f"{'POST batch':<16}{batch * 1000:>10.1f} ms{single / batch:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if sys.argv[1:] else 100_000,
+        int(sys.argv[2]) if sys.argv[2:] else 500,
+    )
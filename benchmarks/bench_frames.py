@@ -0,0 +1,121 @@
+# Memory and wall time of run_etl's batch frames: the object-dtype frames
+# and two merges it used to build, against the typed frames and in-place
+# planet join of frames.py. Both then go through the same downstream work
+# (Parquet/Arrow outputs, the load frames and /stats), so differences there
+# come from the dtypes alone. The SQLite load itself is left out: its cost
+# is per inserted row either way.
+#
+# Memory is read from /proc/self/status (Linux): the high-water mark while
+# building (the extracted records are alive then in both variants), what
+# stays resident once the records are gone, and the high-water mark of the
+# downstream stages. Each variant runs in its own process.
+#
+#   python -m benchmarks.bench_frames [characters] [planets]
+import gc
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import new_pages, old_pages, synthetic_resolve
+from frames import add_planets, merge_sources
+from load_to_db import character_frame, planet_frame, with_planet_ids
+from outputs import write_outputs
+from precompute import compute_stats
+
+PAGE_ROWS = 100
+
+
+def status_mb(field):
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1]) / 1024
+
+
+# Restarts the VmHWM high-water mark from the current RSS
+def reset_peak():
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+# run_batch before frames.py (pandas 2 infers object columns from records;
+# pandas 3 would infer strings, so object is asked for explicitly)
+def object_frames(old, new):
+    df_old = pd.DataFrame(old, dtype=object)
+    df_new = pd.DataFrame(new, dtype=object)
+    merge_df = pd.merge(df_old, df_new, on="name", how="outer")
+    planet_df = synthetic_resolve(merge_df["homeworld"]).astype(object)
+    return merge_df.merge(planet_df, left_on="homeworld", right_index=True, how="left")
+
+
+def typed_frames(old, new):
+    merge_df = merge_sources(old, new)
+    return add_planets(merge_df, synthetic_resolve(merge_df["homeworld"]))
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def run(variant, n, n_planets):
+    os.chdir(tempfile.mkdtemp())
+    baseline = status_mb("VmRSS")
+    old = [c for page in old_pages(n, PAGE_ROWS) for c in page]
+    new = [c for page in new_pages(n, n_planets, PAGE_ROWS) for c in page]
+
+    build = object_frames if variant == "object" else typed_frames
+    start = time.perf_counter()
+    final_df = build(old, new)
+    build_s = time.perf_counter() - start
+    build_peak = status_mb("VmHWM") - baseline
+
+    del old, new
+    gc.collect()
+    held = status_mb("VmRSS") - baseline
+    reset_peak()
+
+    def load_frames():
+        planet_ids = dict(zip(planet_frame(final_df)["url"], range(1, n_planets + 1)))
+        with_planet_ids(character_frame(final_df), planet_ids)
+
+    downstream = [
+        timed(lambda: write_outputs(final_df, ["parquet", "arrow"])),
+        timed(load_frames),
+        timed(lambda: compute_stats(final_df)),
+    ]
+    downstream_peak = status_mb("VmHWM") - baseline
+    print(
+        variant,
+        *(f"{t:.2f}" for t in [build_s, *downstream]),
+        *(f"{mb:.0f}" for mb in [build_peak, held, downstream_peak]),
+    )
+
+
+def main(n, n_planets):
+    print(f"{n:,} characters, {n_planets:,} planets")
+    columns = ["build s", "outputs s", "load df s", "stats s", "build MB", "held MB", "after MB"]
+    print(f"{'frames':<8}" + "".join(f"{c:>11}" for c in columns))
+    for variant in ("object", "typed"):
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_frames", "--run", variant, str(n), str(n_planets)],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        print(f"{variant:<8}" + "".join(f"{v:>11}" for v in out[-len(columns) :]))
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--run"]:
+        run(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+    else:
+        main(
+            int(sys.argv[1]) if sys.argv[1:] else 1_000_000,
+            int(sys.argv[2]) if sys.argv[2:] else 500,
+        )
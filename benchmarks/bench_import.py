@@ -0,0 +1,97 @@
+# Import time of the API against the ETL entry point, each in a fresh
+# interpreter started in an empty directory: wall time of `import <module>`
+# and the heaviest top-level imports as `python -X importtime` reports them.
+# Exits non-zero if importing the API pulls in any of the ETL, or connects
+# to (or creates) a database.
+#
+#   python -m benchmarks.bench_import [runs]
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules only the ETL needs; none of them may load with the API
+ETL_MODULES = [
+    "main",
+    "jobs",
+    "extract",
+    "pipeline",
+    "load_to_db",
+    "precompute",
+    "frames",
+    "outputs",
+    "fetch_homeworld",
+    "http_client",
+    "apscheduler",
+    "pandas",
+    "httpx",
+]
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = [m for m in {etl_modules!r} if m in sys.modules]
+print("RESULT", elapsed, ",".join(loaded) or "-", file=sys.stderr)
+"""
+
+
+def probe(module, importtime=False):
+    cwd = tempfile.mkdtemp()
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    args = [sys.executable, *(["-X", "importtime"] if importtime else [])]
+    result = subprocess.run(
+        [*args, "-c", PROBE.format(module=module, etl_modules=ETL_MODULES)],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    created = os.listdir(cwd)
+    lines = result.stderr.splitlines()
+    _, elapsed, loaded = next(line for line in lines if line.startswith("RESULT")).split()
+    return float(elapsed), loaded.split(",") if loaded != "-" else [], result.stdout, created, lines
+
+
+# Cumulative microseconds of each module the probed one imports directly,
+# as -X importtime prints them (one space, then two per nesting level)
+def heaviest(lines, n=8):
+    rows = []
+    for line in lines:
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if name.startswith("   ") and not name.startswith("    "):
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:n]
+
+
+def main(runs):
+    failures = []
+    for module in ("api", "main"):
+        times = [probe(module)[0] for _ in range(runs)]
+        _, loaded, stdout, created, lines = probe(module, importtime=True)
+        print(f"import {module}: median {statistics.median(times) * 1000:.0f} ms over {runs} runs")
+        for cumulative, name in heaviest(lines):
+            print(f"  {cumulative / 1000:>8.1f} ms  {name}")
+
+        if module == "api":
+            if loaded:
+                failures.append(f"api imports ETL modules: {', '.join(loaded)}")
+            if stdout:
+                failures.append(f"api prints at import: {stdout.strip()!r}")
+            if any(name.endswith(".db") for name in created):
+                failures.append(f"api creates a database at import: {created}")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if sys.argv[1:] else 5))
@@ -0,0 +1,50 @@
+# Load-time benchmark for load_to_db.load_data.
+#
+#   python -m benchmarks.bench_load [sizes...]
+#
+# SQLite always runs (temp file); PostgreSQL runs when db.create_db_engine
+# resolves to PostgreSQL (DB_USER/DB_PASSWORD/DB_NAME set and reachable).
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+
+from benchmarks.synthetic import make_final_df
+from db import create_db_engine
+from load_to_db import load_data
+from model import metadata
+
+DEFAULT_SIZES = [1_000, 100_000, 1_000_000]
+
+
+def engines():
+    tmp = tempfile.mkdtemp()
+    yield "sqlite", create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+
+    pg = create_db_engine()
+    if pg.dialect.name == "postgresql":
+        yield "postgresql", pg
+
+
+def main(sizes):
+    frames = {n: make_final_df(n) for n in sizes}
+
+    print(f"{'engine':<12}{'characters':>12}{'full (s)':>10}{'rows/s':>14}{'no-op refresh (s)':>19}")
+    for label, db_engine in engines():
+        metadata.create_all(db_engine)
+        for n, final_df in frames.items():
+            start = time.perf_counter()
+            load_data(final_df, db_engine=db_engine, mode="full")
+            elapsed = time.perf_counter() - start
+
+            # Same data again through the change-detecting path
+            start = time.perf_counter()
+            load_data(final_df, db_engine=db_engine, mode="incremental")
+            noop = time.perf_counter() - start
+            print(f"{label:<12}{n:>12,}{elapsed:>10.2f}{n / elapsed:>14,.0f}{noop:>19.2f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,40 @@
+# Cost of the in-process metrics (metrics.py): one counter increment and
+# one histogram observation on the request path, a route label lookup, the
+# whole record_metrics middleware per request, and rendering /metrics.
+#
+#   python -m benchmarks.bench_metrics [operations]
+import sys
+import time
+
+from fastapi.testclient import TestClient
+
+from api import REQUEST_SECONDS, REQUESTS, app, route_template
+from metrics import render
+
+
+def per_op(fn, n):
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return (time.perf_counter() - start) / n
+
+
+def main(n):
+    client = TestClient(app)
+    rows = [
+        ("counter inc", per_op(lambda i: REQUESTS.inc(method="GET", route="/bench", status=200), n)),
+        (
+            "histogram observe",
+            per_op(lambda i: REQUEST_SECONDS.observe(0.003, method="GET", route="/bench"), n),
+        ),
+        ("route label (cached)", per_op(lambda i: route_template("GET", f"/characters/{i % 100}"), n)),
+        # /cache/stats touches no database; the middleware stack is the cost
+        ("request via TestClient", per_op(lambda i: client.get("/cache/stats"), n // 100)),
+        ("render /metrics", per_op(lambda i: render(), n // 1000)),
+    ]
+    for name, seconds in rows:
+        print(f"{name:<26}{seconds * 1e6:>10.2f} us")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if sys.argv[1:] else 100_000)
@@ -0,0 +1,78 @@
+# Write time, read time and on-disk size of run_etl's outputs: the legacy
+# CSV and indented JSON against typed Parquet (single file and partitioned
+# by homeworld) and memory-mapped Arrow IPC.
+#
+#   python -m benchmarks.bench_outputs [characters]
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+import outputs
+from benchmarks.synthetic import make_final_df
+
+
+def size_of(path):
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files
+        )
+    return os.path.getsize(path)
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(n):
+    os.chdir(tempfile.mkdtemp())
+    # About as many homeworlds as SWAPI has planets
+    final_df = make_final_df(n, n_planets=60)
+    typed = outputs.typed_frame(final_df)
+
+    cases = {
+        "csv": (
+            lambda: final_df.to_csv(outputs.FINAL_CSV_FILE, index=False),
+            lambda: pd.read_csv(outputs.FINAL_CSV_FILE),
+            outputs.FINAL_CSV_FILE,
+        ),
+        "json indent=2": (
+            lambda: final_df.to_json(outputs.FINAL_JSON_FILE, orient="records", indent=2),
+            lambda: pd.read_json(outputs.FINAL_JSON_FILE, orient="records"),
+            outputs.FINAL_JSON_FILE,
+        ),
+        "parquet": (
+            lambda: outputs.write_parquet(typed, "single.parquet", partitioned=False),
+            lambda: pq.read_table("single.parquet").to_pandas(),
+            "single.parquet",
+        ),
+        "parquet/homeworld": (
+            lambda: outputs.write_parquet(typed, "partitioned.parquet", partitioned=True),
+            lambda: pq.read_table("partitioned.parquet").to_pandas(),
+            "partitioned.parquet",
+        ),
+        "arrow (mmap)": (
+            lambda: outputs.write_arrow(typed),
+            lambda: outputs.read_arrow(),
+            outputs.FINAL_ARROW_FILE,
+        ),
+    }
+
+    print(f"{n:,} characters, parquet compression: {outputs.PARQUET_COMPRESSION}")
+    print(f"{'format':<20}{'write s':>10}{'read s':>10}{'size MB':>10}")
+    for name, (write, read, path) in cases.items():
+        write_s = timed(write)
+        read_s = timed(read)
+        print(f"{name:<20}{write_s:>10.3f}{read_s:>10.3f}{size_of(path) / 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if sys.argv[1:] else 200_000)
@@ -0,0 +1,93 @@
+# Peak memory and wall time of run_etl's batch path against the streaming
+# pipeline (pipeline.py) on synthetic sources: extract, merge, homeworld
+# enrichment, Parquet/Arrow outputs, the SQLite load and the /stats
+# aggregates. Each mode runs in its own process so ru_maxrss is its own.
+#
+#   python -m benchmarks.bench_pipeline [characters] [planets]
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+from sqlalchemy import create_engine
+
+from benchmarks.synthetic import new_pages, old_pages, synthetic_resolve, synthetic_sources
+from load_to_db import load_data
+from model import metadata
+from outputs import OutputWriter, write_outputs
+from pipeline import stream_final
+from precompute import compute_stats, stats_from_conn, store_stats
+
+PAGE_ROWS = 100
+
+
+def peak_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_batch(n, n_planets, db_engine):
+    old = pd.DataFrame([c for page in old_pages(n, PAGE_ROWS) for c in page])
+    new = pd.DataFrame([c for page in new_pages(n, n_planets, PAGE_ROWS) for c in page])
+    merge_df = pd.merge(old, new, on="name", how="outer")
+    planet_df = synthetic_resolve(merge_df["homeworld"])
+    final_df = merge_df.merge(planet_df, left_on="homeworld", right_index=True, how="left")
+    write_outputs(final_df)
+    stats = compute_stats(final_df)
+    load_data(
+        final_df,
+        db_engine=db_engine,
+        mode="incremental",
+        after_load=lambda conn: store_stats(conn, stats),
+    )
+
+
+def run_streaming(n, n_planets, db_engine):
+    writer = OutputWriter()
+    chunks = stream_final(
+        None, None, sources=synthetic_sources(n, n_planets, PAGE_ROWS), resolve=synthetic_resolve
+    )
+    load_data(
+        map(writer.write, chunks),
+        db_engine=db_engine,
+        mode="stream",
+        after_load=lambda conn: store_stats(conn, stats_from_conn(conn)),
+    )
+    writer.close()
+
+
+def run(mode, n, n_planets):
+    os.chdir(tempfile.mkdtemp())
+    db_engine = create_engine("sqlite:///bench.db")
+    metadata.create_all(db_engine)
+
+    baseline = peak_mb()
+    start = time.perf_counter()
+    (run_batch if mode == "batch" else run_streaming)(n, n_planets, db_engine)
+    print(f"{mode} {time.perf_counter() - start:.2f} {baseline:.0f} {peak_mb():.0f}")
+
+
+def main(n, n_planets):
+    print(f"{n:,} characters, {n_planets:,} planets")
+    print(f"{'mode':<11}{'seconds':>9}{'peak MB':>10}{'growth MB':>11}")
+    for mode in ("batch", "streaming"):
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_pipeline", "--run", mode, str(n), str(n_planets)],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        seconds, baseline, peak = map(float, out[-3:])
+        print(f"{mode:<11}{seconds:>9.2f}{peak:>10.0f}{peak - baseline:>11.0f}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--run"]:
+        run(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+    else:
+        main(
+            int(sys.argv[1]) if sys.argv[1:] else 1_000_000,
+            int(sys.argv[2]) if sys.argv[2:] else 500,
+        )
@@ -0,0 +1,73 @@
+# Lookup latency of the in-process name search index (search_index.py)
+# against a linear scan over the same lower-cased names.
+#
+#   python -m benchmarks.bench_search [names]
+import sys
+import time
+
+import numpy as np
+
+from search_index import NgramIndex
+
+SYLLABLES = [
+    "an", "ar", "ba", "bo", "da", "dar", "ek", "fa", "ga", "ha", "ja", "ka",
+    "ke", "lo", "lu", "ma", "mon", "na", "no", "ob", "pa", "qui", "ra", "rey",
+    "sa", "sky", "so", "ta", "th", "to", "va", "wa", "wal", "xi", "ya", "zor",
+]
+
+
+def make_names(n, seed=0):
+    rng = np.random.default_rng(seed)
+    syllables = np.array(SYLLABLES)
+
+    def words(count, low, high):
+        lengths = rng.integers(low, high + 1, count)
+        picks = rng.choice(syllables, (count, high))
+        return ["".join(row[:k]).capitalize() for row, k in zip(picks, lengths)]
+
+    return [f"{a} {b}" for a, b in zip(words(n, 1, 3), words(n, 2, 4))]
+
+
+def typo(name, rng):
+    i = int(rng.integers(1, len(name) - 1))
+    return name[:i] + name[i + 1 :]
+
+
+def timed(fn, queries):
+    samples = []
+    for q in queries:
+        start = time.perf_counter()
+        fn(q)
+        samples.append(time.perf_counter() - start)
+    samples = np.array(samples) * 1000
+    return np.median(samples), np.percentile(samples, 99)
+
+
+def main(n):
+    rng = np.random.default_rng(1)
+    names = make_names(n)
+
+    start = time.perf_counter()
+    index = NgramIndex(np.arange(1, n + 1), names)
+    print(f"{n} names indexed in {time.perf_counter() - start:.1f}s")
+
+    sample = [names[i] for i in rng.integers(0, n, 200)]
+    workloads = {
+        "substring": [s[2:8].lower() for s in sample],
+        "prefix": [s.split()[0] for s in sample],
+        "fuzzy": [typo(s, rng) for s in sample],
+    }
+    lowered = index.names
+
+    print(f"{'match':>10} {'p50 ms':>9} {'p99 ms':>9} {'hits':>8}")
+    for match, queries in workloads.items():
+        p50, p99 = timed(lambda q: index.search(q, match), queries)
+        hits = np.mean([len(index.search(q, match)) for q in queries[:20]])
+        print(f"{match:>10} {p50:9.3f} {p99:9.3f} {hits:8.0f}")
+
+    p50, p99 = timed(lambda q: [i for i, s in enumerate(lowered) if q in s], workloads["substring"][:10])
+    print(f"{'scan':>10} {p50:9.3f} {p99:9.3f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,122 @@
+# Rows/sec for turning the /characters join into response bytes, comparing
+# the per-request select + dict(row._mapping) + jsonable_encoder path the
+# API used to take with queries.CompiledQuery + character_shape + dumps.
+#
+#   python -m benchmarks.bench_serialize [characters]
+import json
+import os
+import sys
+import tempfile
+import time
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine, select
+
+from benchmarks.synthetic import make_final_df
+from load_to_db import load_data
+from model import metadata, characters, planets
+from queries import CHARACTER_WITH_PLANET, character_list_query, character_shape
+from queries import CHARACTER_FIELDS, PLANET_FIELDS
+from serialize import dumps, orjson
+
+
+def legacy_query():
+    return (
+        select(
+            characters.c.id,
+            characters.c.name,
+            characters.c.height,
+            characters.c.mass,
+            characters.c.gender,
+            characters.c.birth_year,
+            planets.c.name.label("planet_name"),
+            planets.c.climate,
+            planets.c.terrain,
+            planets.c.population,
+            planets.c.rotation_period,
+            planets.c.orbital_period,
+            planets.c.diameter,
+            planets.c.gravity,
+            planets.c.surface_water,
+        )
+        .select_from(CHARACTER_WITH_PLANET)
+        .order_by(characters.c.id)
+    )
+
+
+def legacy_serialize(rows):
+    output = []
+    for row in rows:
+        d = dict(row._mapping)
+        output.append(
+            {
+                "id": d["id"],
+                "name": d["name"],
+                "height": d["height"],
+                "mass": d["mass"],
+                "gender": d["gender"],
+                "birth_year": d["birth_year"],
+                "planet": {
+                    "name": d["planet_name"],
+                    "climate": d["climate"],
+                    "terrain": d["terrain"],
+                    "population": d["population"],
+                    "rotation_period": d["rotation_period"],
+                    "orbital_period": d["orbital_period"],
+                    "diameter": d["diameter"],
+                    "gravity": d["gravity"],
+                    "surface_water": d["surface_water"],
+                },
+            }
+        )
+    # What FastAPI's JSONResponse does with a returned list
+    return json.dumps(
+        jsonable_encoder(output), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode()
+
+
+def new_serialize(rows):
+    return dumps([character_shape(row._mapping) for row in rows])
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(n):
+    db_engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+    metadata.create_all(db_engine)
+    load_data(make_final_df(n), db_engine=db_engine, mode="full")
+
+    query = character_list_query(
+        tuple(CHARACTER_FIELDS), tuple(PLANET_FIELDS), "id", False, (), None
+    )
+
+    with db_engine.connect() as conn:
+        legacy_rows = conn.execute(legacy_query()).fetchall()
+        rows = query.execute(conn, limit=n).fetchall()
+
+        fetch_old, _ = timed(lambda: conn.execute(legacy_query()).fetchall())
+        fetch_new, _ = timed(lambda: query.execute(conn, limit=n).fetchall())
+
+    ser_old, old_bytes = timed(lambda: legacy_serialize(legacy_rows))
+    ser_new, new_bytes = timed(lambda: new_serialize(rows))
+    assert json.loads(old_bytes) == json.loads(new_bytes)
+
+    print(f"{n:,} characters, encoder: {'orjson' if orjson else 'json'}")
+    print(f"{'stage':<14}{'before rows/s':>16}{'after rows/s':>16}{'speedup':>10}")
+    for stage, old, new in (
+        ("fetch", fetch_old, fetch_new),
+        ("serialize", ser_old, ser_new),
+        ("total", fetch_old + ser_old, fetch_new + ser_new),
+    ):
+        print(f"{stage:<14}{n / old:>16,.0f}{n / new:>16,.0f}{old / new:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if sys.argv[1:] else 100_000)
@@ -0,0 +1,127 @@
+# API read latency on SQLite while the loader reloads the tables: the plain
+# engine (rollback journal, one pool for reads and writes) against db.py's
+# tuned backend (WAL and pragmas, a read-only pool beside the single
+# writer). Reader threads issue the queries behind GET /characters and
+# GET /characters/{id} while a writer runs full reloads back to back.
+# Each backend runs in its own process on its own copy of the data.
+# Readers and writer share that process, as main.py's scheduler and API
+# do, so with readers no longer blocked the reload competes with them for
+# the GIL and takes longer.
+#
+#   python -m benchmarks.bench_sqlite [characters] [readers] [seconds]
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import create_engine
+
+import queries
+from benchmarks.synthetic import make_final_df
+from db import sqlite_engine
+from load_to_db import load_data
+from model import metadata
+
+
+def engines(backend, path):
+    if backend == "plain":
+        db_engine = create_engine(f"sqlite:///{path}")
+        return db_engine, db_engine
+    return sqlite_engine(path), sqlite_engine(path, readonly=True)
+
+
+def read_loop(n, stop, latencies, errors, seed):
+    rng = np.random.default_rng(seed)
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            if rng.random() < 0.5:
+                queries.list_characters(after_id=int(rng.integers(0, n)), limit=100)
+            else:
+                queries.character_by_id(int(rng.integers(1, n + 1)))
+            latencies.append(time.perf_counter() - start)
+        except Exception as exc:
+            errors.append(type(exc).__name__)
+
+
+def run(backend, n, readers, seconds):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    writer, reader = engines(backend, path)
+    metadata.create_all(writer)
+    final_df = make_final_df(n)
+    load_data(final_df, db_engine=writer, mode="full")
+    queries.engine = reader
+
+    def phase(reloading):
+        stop = threading.Event()
+        latencies, errors, reloads = [], [], []
+        threads = [
+            threading.Thread(target=read_loop, args=(n, stop, latencies, errors, seed))
+            for seed in range(readers)
+        ]
+        for thread in threads:
+            thread.start()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            if reloading:
+                start = time.perf_counter()
+                load_data(final_df, db_engine=writer, mode="full")
+                reloads.append(time.perf_counter() - start)
+            else:
+                time.sleep(0.05)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        ms = np.array(latencies) * 1000
+        print(
+            backend,
+            "reload" if reloading else "idle",
+            f"{len(ms) / seconds:.0f}",
+            *(f"{np.percentile(ms, p):.1f}" for p in (50, 99)),
+            f"{ms.max():.1f}",
+            len(errors),
+            f"{np.mean(reloads):.2f}" if reloads else "-",
+        )
+
+    phase(reloading=False)
+    phase(reloading=True)
+
+
+def main(n, readers, seconds):
+    print(f"{n:,} characters, {readers} reader threads, {seconds}s per phase")
+    columns = ["reads/s", "p50 ms", "p99 ms", "max ms", "errors", "reload s"]
+    print(f"{'backend':<9}{'phase':<8}" + "".join(f"{c:>10}" for c in columns))
+    for backend in ("plain", "tuned"):
+        out = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.bench_sqlite",
+                "--run",
+                backend,
+                str(n),
+                str(readers),
+                str(seconds),
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.splitlines()
+        for line in out[-2:]:
+            name, phase, *values = line.split()
+            print(f"{name:<9}{phase:<8}" + "".join(f"{v:>10}" for v in values))
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--run"]:
+        run(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]), float(sys.argv[5]))
+    else:
+        main(
+            int(sys.argv[1]) if sys.argv[1:] else 100_000,
+            int(sys.argv[2]) if sys.argv[2:] else 4,
+            float(sys.argv[3]) if sys.argv[3:] else 10,
+        )
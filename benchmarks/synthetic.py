@@ -0,0 +1,143 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import numpy as np
+import pandas as pd
+
+GENDERS = ["male", "female", "n/a", "hermaphrodite", "none"]
+CLIMATES = ["arid", "temperate", "frozen", "murky", "tropical", "unknown"]
+TERRAINS = ["desert", "grasslands, mountains", "jungle, rainforests", "tundra, ice caves"]
+EYE_COLORS = ["blue", "brown", "yellow", "red", "black", "unknown"]
+
+
+# Synthetic final_df shaped like run_etl's output
+def make_final_df(n_characters, n_planets=None, seed=0):
+    rng = np.random.default_rng(seed)
+    n_planets = n_planets or max(1, min(n_characters // 20, 10_000))
+
+    planet_ids = np.arange(1, n_planets + 1)
+    planet_df = pd.DataFrame(
+        {
+            "homeworld": [f"https://swapi.info/api/planets/{i}" for i in planet_ids],
+            "homeworld_name": [f"Planet {i}" for i in planet_ids],
+            "rotation_period": rng.integers(10, 40, n_planets).astype(str),
+            "orbital_period": rng.integers(200, 600, n_planets).astype(str),
+            "diameter": rng.integers(4_000, 20_000, n_planets).astype(str),
+            "climate": rng.choice(CLIMATES, n_planets),
+            "gravity": "1 standard",
+            "terrain": rng.choice(TERRAINS, n_planets),
+            "surface_water": rng.integers(0, 100, n_planets).astype(str),
+            "population": rng.integers(1_000, 10**12, n_planets).astype(str),
+        }
+    )
+
+    uids = np.arange(1, n_characters + 1)
+    characters = pd.DataFrame(
+        {
+            "uid": uids.astype(str),
+            "name": [f"Character {i}" for i in uids],
+            "url": [f"https://www.swapi.tech/api/people/{i}" for i in uids],
+            "height": rng.integers(60, 250, n_characters).astype(str),
+            "mass": rng.integers(20, 200, n_characters).astype(str),
+            "hair_color": "brown",
+            "skin_color": "fair",
+            "eye_color": rng.choice(EYE_COLORS, n_characters),
+            "birth_year": "19BBY",
+            "gender": rng.choice(GENDERS, n_characters),
+            "homeworld": [
+                f"https://swapi.info/api/planets/{i}"
+                for i in rng.integers(1, n_planets + 1, n_characters)
+            ],
+        }
+    )
+
+    return characters.merge(planet_df, on="homeworld", how="left")
+
+
+# =========================
+# SYNTHETIC SOURCES (pipeline.py)
+# =========================
+# The two SWAPI people sources as lazily generated pages, for runs far
+# larger than the real catalog. New republic pages come in reverse order,
+# so the name join never sees matching pages side by side.
+def synthetic_planet(i):
+    return {
+        "homeworld_name": f"Planet {i}",
+        "rotation_period": str(10 + i % 30),
+        "orbital_period": str(200 + i % 400),
+        "diameter": str(4_000 + i * 37 % 16_000),
+        "climate": CLIMATES[i % len(CLIMATES)],
+        "gravity": "1 standard",
+        "terrain": TERRAINS[i % len(TERRAINS)],
+        "surface_water": str(i % 100),
+        "population": str(1_000 + i * 7_919),
+    }
+
+
+def old_pages(n_characters, page_rows):
+    for start in range(1, n_characters + 1, page_rows):
+        yield [
+            {
+                "uid": str(i),
+                "name": f"Character {i}",
+                "url": f"https://www.swapi.tech/api/people/{i}",
+            }
+            for i in range(start, min(start + page_rows, n_characters + 1))
+        ]
+
+
+def new_pages(n_characters, n_planets, page_rows, seed=0):
+    for end in range(n_characters, 0, -page_rows):
+        ids = range(end, max(end - page_rows, 0), -1)
+        rng = np.random.default_rng([seed, end])
+        heights = rng.integers(60, 250, len(ids))
+        masses = rng.integers(20, 200, len(ids))
+        homeworlds = rng.integers(1, n_planets + 1, len(ids))
+        yield [
+            {
+                "name": f"Character {i}",
+                "height": str(h),
+                "mass": str(m),
+                "hair_color": "brown",
+                "skin_color": "fair",
+                "eye_color": EYE_COLORS[i % len(EYE_COLORS)],
+                "birth_year": "19BBY",
+                "gender": GENDERS[i % len(GENDERS)],
+                "homeworld": f"https://swapi.info/api/planets/{p}",
+            }
+            for i, h, m, p in zip(ids, heights, masses, homeworlds)
+        ]
+
+
+async def as_async(pages, limit):
+    taken = 0
+    for page in pages:
+        if limit is not None:
+            page = page[: limit - taken]
+        taken += len(page)
+        yield page
+        await asyncio.sleep(0)
+        if limit is not None and taken >= limit:
+            return
+
+
+# A stand-in for extract.open_sources
+def synthetic_sources(n_characters, n_planets, page_rows=100, seed=0):
+    @asynccontextmanager
+    async def sources(limit):
+        yield (
+            as_async(old_pages(n_characters, page_rows), limit),
+            as_async(new_pages(n_characters, n_planets, page_rows, seed), limit),
+        )
+
+    return sources
+
+
+# A stand-in for fetch_homeworld.resolve_homeworlds
+def synthetic_resolve(homeworld_urls, planet_cache=None):
+    urls = pd.Series(homeworld_urls).dropna().unique()
+    planet_df = pd.DataFrame.from_dict(
+        {url: synthetic_planet(int(url.rsplit("/", 1)[1])) for url in urls}, orient="index"
+    )
+    planet_df.index.name = "homeworld"
+    return planet_df
@@ -0,0 +1,249 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from config import (
+    HOMEWORLD_CACHE_BACKEND,
+    HOMEWORLD_CACHE_TTL,
+    HOMEWORLD_CACHE_MAX_ENTRIES,
+    HOMEWORLD_CACHE_FLUSH_EVERY,
+)
+
+
+# Key/value cache with per-entry TTL, an LRU size bound and hit/miss counters.
+# Backends implement get, set and __len__; the rest is shared.
+class CacheStore(ABC):
+    def __init__(self, ttl=HOMEWORLD_CACHE_TTL, max_entries=HOMEWORLD_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+
+    def _expires_at(self, ttl):
+        ttl = self.ttl if ttl is None else ttl
+        return time.time() + ttl if ttl else None
+
+    # count=False: a lookup that does not touch the hit/miss counters
+    @abstractmethod
+    def get(self, key, default=None, count=True): ...
+
+    @abstractmethod
+    def set(self, key, value, ttl=None): ...
+
+    @abstractmethod
+    def __len__(self): ...
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+    # dict-style access so existing callers keep working
+    def __contains__(self, key):
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+        }
+
+    def _count(self, hit, count):
+        if count:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+_MISSING = object()
+
+
+# =========================
+# IN-MEMORY BACKEND
+# =========================
+class MemoryCacheStore(CacheStore):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._data = OrderedDict()
+
+    def get(self, key, default=None, count=True):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.time():
+                del self._data[key]
+                entry = None
+            self._count(entry is not None, count)
+            if entry is None:
+                return default
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, self._expires_at(ttl))
+            self._data.move_to_end(key)
+            while self.max_entries and len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+# =========================
+# SQLITE BACKEND
+# =========================
+# Writes are buffered and flushed as one transaction, so a miss costs an
+# O(1) upsert instead of rewriting the whole cache; WAL keeps it crash-safe.
+class SQLiteCacheStore(CacheStore):
+    def __init__(self, path, flush_every=HOMEWORLD_CACHE_FLUSH_EVERY, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.flush_every = flush_every
+        self._pending = {}
+        self._touched = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_cache_accessed_at ON cache (accessed_at)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+        )
+
+    def get(self, key, default=None, count=True):
+        now = time.time()
+        with self._lock:
+            if key in self._pending:
+                value, expires_at = self._pending[key]
+            else:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+                ).fetchone()
+                value, expires_at = (json.loads(row[0]), row[1]) if row else (_MISSING, None)
+
+            if value is not _MISSING and expires_at is not None and expires_at <= now:
+                self._pending.pop(key, None)
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                value = _MISSING
+
+            self._count(value is not _MISSING, count)
+            if value is _MISSING:
+                return default
+            self._touched[key] = now
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._pending[key] = (value, self._expires_at(ttl))
+            if len(self._pending) >= self.flush_every:
+                self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._pending and not self._touched:
+                return
+            now = time.time()
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at)"
+                    " VALUES (?, ?, ?, ?)",
+                    [
+                        (k, json.dumps(v, ensure_ascii=False), exp, now)
+                        for k, (v, exp) in self._pending.items()
+                    ],
+                )
+                conn.executemany(
+                    "UPDATE cache SET accessed_at = ? WHERE key = ?",
+                    [(t, k) for k, t in self._touched.items() if k not in self._pending],
+                )
+                if self.max_entries:
+                    conn.execute(
+                        "DELETE FROM cache WHERE key IN ("
+                        " SELECT key FROM cache ORDER BY accessed_at"
+                        " LIMIT max(0, (SELECT count(*) FROM cache) - ?))",
+                        (self.max_entries,),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._pending.clear()
+            self._touched.clear()
+
+    def __len__(self):
+        with self._lock:
+            self.flush()
+            return self._conn.execute("SELECT count(*) FROM cache").fetchone()[0]
+
+    def migrate_json(self, json_file):
+        # One-time import of the legacy rewrite-everything JSON cache
+        with self._lock:
+            done = self._conn.execute(
+                "SELECT 1 FROM meta WHERE key = 'migrated_json'"
+            ).fetchone()
+            if done or not os.path.exists(json_file):
+                return 0
+
+            with open(json_file, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+
+            for key, value in legacy.items():
+                self._pending[key] = (value, self._expires_at(None))
+            self.flush()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_json', ?)",
+                (json_file,),
+            )
+            return len(legacy)
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._conn.close()
+
+
+def open_cache_store(path, backend=HOMEWORLD_CACHE_BACKEND, legacy_json=None, **kwargs):
+    if backend == "memory":
+        store = MemoryCacheStore(**kwargs)
+        if legacy_json and os.path.exists(legacy_json):
+            with open(legacy_json, "r", encoding="utf-8") as f:
+                for key, value in json.load(f).items():
+                    store.set(key, value)
+        return store
+
+    if backend == "sqlite":
+        store = SQLiteCacheStore(path, **kwargs)
+        if legacy_json:
+            store.migrate_json(legacy_json)
+        return store
+
+    raise ValueError(f"Unknown cache backend: {backend}")
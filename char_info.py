@@ -1,27 +1,15 @@
-import pandas as pd
-from config import Old_Republic_DB
-import requests
+import asyncio
 
-def char_info(limit):
-    characters = []
-    url = Old_Republic_DB
-    while url and len(characters) < limit:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        results = data["results"][:limit]
+from config import EXTRACT_CONCURRENCY
+from extract import extract_old_republic
+from http_client import AsyncHTTPClient
 
-        for item in results:
-            if len(characters) >= limit:
-                break
-            character_dict = {
-                "uid": item["uid"],
-                "name": item["name"],
-                "url": item["url"],
-                
-            }
 
-            characters.append(character_dict)
-        url = data["next"]
-        
-    return characters 
\ No newline at end of file
+async def _char_info(limit, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    async with AsyncHTTPClient() as client:
+        return await extract_old_republic(client, semaphore, limit)
+
+
+def char_info(limit, concurrency=EXTRACT_CONCURRENCY):
+    return asyncio.run(_char_info(limit, concurrency))
@@ -1,3 +1,122 @@
+import os
+
 Old_Republic_DB = "https://swapi.tech/api/people"
 
 New_Republic_DB = "https://swapi.info/api/people"
+
+New_Republic_Planets = "https://swapi.info/api/planets"
+
+# Extraction tuning
+EXTRACT_CONCURRENCY = int(os.getenv("EXTRACT_CONCURRENCY", "8"))
+OLD_REPUBLIC_PAGE_SIZE = int(os.getenv("OLD_REPUBLIC_PAGE_SIZE", "10"))
+# Pages requested ahead of the consumer when the page count is known
+EXTRACT_WINDOW = int(os.getenv("EXTRACT_WINDOW", "16"))
+
+# Shared HTTP client (http_client.py)
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "8"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "4"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "10"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Homeworld cache store (cache_store.py)
+HOMEWORLD_CACHE_BACKEND = os.getenv("HOMEWORLD_CACHE_BACKEND", "sqlite")
+HOMEWORLD_CACHE_TTL = float(os.getenv("HOMEWORLD_CACHE_TTL", str(7 * 24 * 3600)))
+HOMEWORLD_CACHE_MAX_ENTRIES = int(os.getenv("HOMEWORLD_CACHE_MAX_ENTRIES", "10000"))
+HOMEWORLD_CACHE_FLUSH_EVERY = int(os.getenv("HOMEWORLD_CACHE_FLUSH_EVERY", "50"))
+
+# Homeworld resolution: above this many cache misses, list every planet in
+# bulk instead of fetching the misses one URL at a time
+BULK_PLANET_THRESHOLD = int(os.getenv("BULK_PLANET_THRESHOLD", "10"))
+
+# Loader: "incremental" upserts changed rows by SWAPI identity,
+# "stream" does the same one chunk at a time (ETL_PIPELINE=streaming),
+# "snapshot" builds a new generation and swaps it in atomically,
+# "full" deletes and reloads both tables
+LOAD_MODE = os.getenv("LOAD_MODE", "incremental")
+
+# Snapshot loads: previous generations kept for rollback, and the smallest
+# new/live character ratio accepted before a swap
+SNAPSHOT_KEEP_GENERATIONS = int(os.getenv("SNAPSHOT_KEEP_GENERATIONS", "2"))
+SNAPSHOT_MIN_RATIO = float(os.getenv("SNAPSHOT_MIN_RATIO", "0.5"))
+
+# Read-side caching (generation.py, response_cache.py)
+GENERATION_POLL_SECONDS = float(os.getenv("GENERATION_POLL_SECONDS", "1"))
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Cache-Control for read endpoints: browsers revalidate with the ETag,
+# shared caches (CDN / reverse proxy) may serve for HTTP_CACHE_S_MAXAGE
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "0"))
+HTTP_CACHE_S_MAXAGE = int(os.getenv("HTTP_CACHE_S_MAXAGE", "30"))
+
+# Responses at least this large are gzip/brotli encoded when the client accepts it
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+
+# Serve GET endpoints from the in-memory read model (read_model.py)
+READ_MODEL_ENABLED = os.getenv("READ_MODEL", "0") == "1"
+
+# Name search (search_index.py): smallest trigram similarity for
+# match=fuzzy (pg_trgm's default), and the most ranked ids one lookup returns
+FUZZY_MIN_SIMILARITY = float(os.getenv("FUZZY_MIN_SIMILARITY", "0.3"))
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "1000"))
+
+# Batch lookups: most ids/names per request, and per key-list query
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "500"))
+
+# Exports: rows fetched from the server-side cursor (and written per
+# CSV/NDJSON chunk or Parquet row group) at a time
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+
+# run_etl outputs (outputs.py): any of parquet, arrow, csv, json. The
+# Parquet dataset can be split into one directory per homeworld.
+OUTPUT_FORMATS = [
+    f.strip() for f in os.getenv("OUTPUT_FORMATS", "parquet,arrow").split(",") if f.strip()
+]
+OUTPUT_PARTITION_BY_HOMEWORLD = os.getenv("OUTPUT_PARTITION_BY_HOMEWORLD", "0") == "1"
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+
+# run_etl: ETL_LIMIT caps the characters taken from each source (unset or
+# empty: the whole catalog). ETL_PIPELINE=streaming runs extract, enrich and
+# load as overlapping stages over chunks of PIPELINE_CHUNK_ROWS, with at most
+# PIPELINE_QUEUE_CHUNKS chunks waiting between two stages.
+ETL_LIMIT = os.getenv("ETL_LIMIT", "30").strip()
+ETL_LIMIT = int(ETL_LIMIT) if ETL_LIMIT else None
+ETL_PIPELINE = os.getenv("ETL_PIPELINE", "batch")
+PIPELINE_CHUNK_ROWS = int(os.getenv("PIPELINE_CHUNK_ROWS", "5000"))
+PIPELINE_QUEUE_CHUNKS = int(os.getenv("PIPELINE_QUEUE_CHUNKS", "4"))
+
+# ETL job runner (jobs.py): runs start ETL_INTERVAL_SECONDS apart, never
+# sooner than ETL_RUNTIME_FACTOR times the last run's duration; each run
+# that changed nothing (or failed) multiplies the wait by ETL_IDLE_BACKOFF,
+# up to ETL_MAX_INTERVAL_SECONDS. On SQLite the cross-process lock row
+# expires ETL_LOCK_TTL_SECONDS after its holder's last heartbeat.
+ETL_INTERVAL_SECONDS = float(os.getenv("ETL_INTERVAL_SECONDS", "60"))
+ETL_MAX_INTERVAL_SECONDS = float(os.getenv("ETL_MAX_INTERVAL_SECONDS", "3600"))
+ETL_RUNTIME_FACTOR = float(os.getenv("ETL_RUNTIME_FACTOR", "4"))
+ETL_IDLE_BACKOFF = float(os.getenv("ETL_IDLE_BACKOFF", "2"))
+ETL_LOCK_TTL_SECONDS = float(os.getenv("ETL_LOCK_TTL_SECONDS", "900"))
+
+# Startup (model.ensure_schema): characters/planets tables whose columns no
+# longer match the model are dropped and recreated only with
+# SCHEMA_REBUILD_STALE=1 (or `python init_db.py --rebuild`); otherwise
+# startup stops with an error naming them. The next ETL run reloads them.
+SCHEMA_REBUILD_STALE = os.getenv("SCHEMA_REBUILD_STALE", "0") == "1"
+
+# SQLite fallback (db.py): WAL journaling, so API reads never wait for a
+# load to commit; synchronous=NORMAL (with WAL a power cut may lose the
+# last commits but never corrupts the file); page cache and memory map
+# sizes per connection. Connections wait up to SQLITE_BUSY_TIMEOUT_MS for
+# a lock held by another process before giving up. The loader writes
+# through one connection, the API reads through a read-only pool.
+SQLITE_PATH = os.getenv("SQLITE_PATH", "starwars.db")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "65536"))
+SQLITE_MMAP_BYTES = int(os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", "8"))
@@ -0,0 +1,81 @@
+import os
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine
+
+import db
+import generation
+import logger_config
+import queries
+from benchmarks.synthetic import make_final_df
+from load_to_db import load_data
+from model import ensure_schema, metadata
+
+
+# The suite never writes to tracked files: the log goes to a temporary
+# directory, set before anything (api, jobs) calls setup_logger
+def pytest_configure(config):
+    logger_config.LOG_DIR = tempfile.mkdtemp(prefix="logs-")
+    logger_config.LOG_FILE = os.path.join(logger_config.LOG_DIR, "mission.log")
+
+
+# Synthetic catalog with a few of the names the API tests look up
+def app_frame():
+    final_df = make_final_df(300, n_planets=20, seed=7)
+    first, second = final_df["homeworld"].iloc[0], final_df["homeworld"].iloc[1]
+    if second == first:
+        second = final_df.loc[final_df["homeworld"] != first, "homeworld"].iloc[0]
+    final_df.loc[final_df["homeworld"] == first, "homeworld_name"] = "Tatooine"
+    final_df.loc[final_df["homeworld"] == second, "homeworld_name"] = "Bespin"
+    final_df.loc[0, "name"] = "Luke Skywalker"
+    return final_df
+
+
+# The app's engine (db.get_engine) is a temporary SQLite file seeded from
+# app_frame, never the tracked starwars.db
+@pytest.fixture(scope="session", autouse=True)
+def app_engine(tmp_path_factory):
+    engine = db.sqlite_engine(str(tmp_path_factory.mktemp("app") / "app.db"))
+    ensure_schema(engine)
+    load_data(app_frame(), db_engine=engine, mode="full")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(db, "_engine", engine)
+        mp.setattr(db, "_read_engine", None)
+        yield engine
+
+
+# Imported late: api sets up the logger at import
+def clear_response_cache():
+    from api import response_cache
+
+    response_cache.clear()
+
+
+# A fresh SQLite database on the read path (queries.engine), final_df
+# loaded into it when given. Generation numbers restart with every
+# database, so the process-wide generation and the response cache are
+# reset as well, and the cache again when the test is done with it.
+def serve(mp, path, final_df=None, mode="full"):
+    engine = create_engine(f"sqlite:///{path}")
+    metadata.create_all(engine)
+    mp.setattr(generation, "_state", {"generation": None, "loaded_at": None, "checked_at": 0.0})
+    mp.setattr(queries, "engine", engine)
+    clear_response_cache()
+    if final_df is not None:
+        load_data(final_df, db_engine=engine, mode=mode)
+    return engine
+
+
+@pytest.fixture
+def served(monkeypatch, tmp_path):
+    yield lambda final_df=None, mode="full": serve(monkeypatch, tmp_path / "served.db", final_df, mode)
+    clear_response_cache()
+
+
+@pytest.fixture(scope="module")
+def served_module(tmp_path_factory):
+    path = tmp_path_factory.mktemp("served") / "served.db"
+    with pytest.MonkeyPatch.context() as mp:
+        yield lambda final_df=None, mode="full": serve(mp, path, final_df, mode)
+    clear_response_cache()
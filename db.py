@@ -1,26 +1,94 @@
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import NullPool, QueuePool
+
+from config import (
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_CACHE_KB,
+    SQLITE_MMAP_BYTES,
+    SQLITE_PATH,
+    SQLITE_READ_POOL_SIZE,
+    SQLITE_SYNCHRONOUS,
+)
+from metrics import Gauge, Histogram
 
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_NAME = os.getenv("DB_NAME")
 DB_PORT = os.getenv("DB_PORT")
+# Seconds a PostgreSQL connection attempt may take, so an unreachable
+# server costs at most this long before the SQLite fallback
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "3"))
 
 IN_DOCKER = os.path.exists("/.dockerenv")
 DB_HOST = "db" if IN_DOCKER else "localhost"
 
-print(" Runtime environment:")
-print(f"   IN_DOCKER = {IN_DOCKER}")
-print(f"   DB_HOST   = {DB_HOST}")
+# =========================
+# POOL METRICS
+# =========================
+POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time to check a connection out of the pool, opening it included",
+    ["pool"],
+    buckets=(0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+
+# QueuePool that records how long each checkout waited; the label is the
+# engine's pool_logging_name, which survives pool recreation
+class TimedQueuePool(QueuePool):
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_WAIT.observe(time.perf_counter() - start, pool=self._orig_logging_name)
+
+# Read off the pools at scrape time
+def pool_values(measure):
+    engines = {"main": _engine}
+    if _read_engine is not None and _read_engine is not _engine:
+        engines["read"] = _read_engine
+    return {(name,): measure(e.pool) for name, e in engines.items() if e is not None}
+
+Gauge(
+    "db_pool_connections_in_use",
+    "Connections checked out of the pool",
+    ["pool"],
+    collect=lambda: pool_values(lambda pool: pool.checkedout()),
+)
+Gauge(
+    "db_pool_connections_idle",
+    "Open connections waiting in the pool",
+    ["pool"],
+    collect=lambda: pool_values(lambda pool: pool.checkedin()),
+)
+Gauge(
+    "db_pool_size",
+    "Connections the pool keeps open",
+    ["pool"],
+    collect=lambda: pool_values(lambda pool: pool.size()),
+)
 
 def create_db_engine():
+    print(" Runtime environment:")
+    print(f"   IN_DOCKER = {IN_DOCKER}")
+    print(f"   DB_HOST   = {DB_HOST}")
+
     if DB_USER and DB_PASSWORD and DB_NAME:
         try:
             url = (
                 f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}"
                 f"@{DB_HOST}:{DB_PORT}/{DB_NAME}"
             )
-            engine = create_engine(url, pool_pre_ping=True)
+            engine = create_engine(
+                url,
+                pool_pre_ping=True,
+                poolclass=TimedQueuePool,
+                pool_logging_name="main",
+                connect_args={"connect_timeout": DB_CONNECT_TIMEOUT},
+            )
 
             with engine.connect():
                 pass
@@ -33,6 +101,89 @@ def create_db_engine():
             print(f"   Reason: {e}")
 
     print(" Using SQLite (local fallback)")
-    return create_engine("sqlite:///starwars.db", echo=False)
+    return sqlite_engine(SQLITE_PATH)
+
+# =========================
+# SQLITE
+# =========================
+# Applied to every new connection. journal_mode=WAL is stored in the file,
+# so only the writer sets it; the rest are per connection.
+def sqlite_pragmas(readonly):
+    pragmas = [
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA cache_size=-{SQLITE_CACHE_KB}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_BYTES}",
+    ]
+    if not readonly:
+        pragmas = ["PRAGMA journal_mode=WAL", f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}", *pragmas]
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return on_connect
+
+# The writer is a single connection: SQLite takes one writer at a time
+# anyway, and callers queue on the pool instead of on busy retries.
+# Readers open the file read-only (mode=ro), several at once; under WAL
+# they see the last commit while a load is writing.
+def sqlite_engine(path, readonly=False):
+    if readonly:
+        engine = create_engine(
+            f"sqlite:///file:{path}?mode=ro&uri=true",
+            poolclass=TimedQueuePool,
+            pool_logging_name="read",
+            pool_size=SQLITE_READ_POOL_SIZE,
+        )
+    else:
+        engine = create_engine(
+            f"sqlite:///{path}",
+            poolclass=TimedQueuePool,
+            pool_logging_name="main",
+            pool_size=1,
+            max_overflow=0,
+        )
+    event.listen(engine, "connect", sqlite_pragmas(readonly))
+    return engine
+
+# Job locks (jobs.py) are kept on connections of their own, opened per use:
+# the writer's single connection is busy for as long as a load runs
+def lock_engine(db_engine):
+    if db_engine.dialect.name != "sqlite":
+        return db_engine
+    return create_engine(
+        db_engine.url,
+        poolclass=NullPool,
+        connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+    )
+
+# Created on first use, not at import: importing the API, the tests or a
+# CLI connects to nothing until something actually queries
+_engine = None
+_engine_lock = threading.Lock()
+
+_read_engine = None
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_db_engine()
+    return _engine
 
-engine = create_db_engine()
+# For the read path (api.py): a read-only pool on the same file on SQLite,
+# the one engine on PostgreSQL
+def get_read_engine():
+    global _read_engine
+    engine = get_engine()
+    if _read_engine is None:
+        with _engine_lock:
+            if _read_engine is None:
+                if engine.dialect.name == "sqlite":
+                    _read_engine = sqlite_engine(engine.url.database, readonly=True)
+                else:
+                    _read_engine = engine
+    return _read_engine
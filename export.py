@@ -0,0 +1,129 @@
+import csv
+import io
+
+import queries
+from config import EXPORT_CHUNK_ROWS
+from model import characters, planets
+from queries import PLANET_FIELDS, character_shape, planet_shape
+from serialize import dumps
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: Parquet exports are unavailable without it
+    pa = pq = None
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+# =========================
+# STREAMING
+# =========================
+# yield_per turns on stream_results: PostgreSQL reads through a named
+# server-side cursor, sqlite3 steps lazily, so only one chunk of rows is
+# ever held no matter how large the table is
+def stream_chunks(query, params, chunk_rows=EXPORT_CHUNK_ROWS):
+    with queries.current_engine().connect() as conn:
+        conn = conn.execution_options(yield_per=chunk_rows)
+        yield from query.execute(conn, **params).partitions(chunk_rows)
+
+
+def ndjson(chunks, shape):
+    for rows in chunks:
+        yield b"".join(dumps(shape(row._mapping)) + b"\n" for row in rows)
+
+
+def csv_rows(chunks, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue().encode()
+
+    for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(row[: len(columns)] for row in rows)
+        yield buffer.getvalue().encode()
+
+
+# Collects what ParquetWriter writes so each row group can be sent on
+class ChunkSink(io.RawIOBase):
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def arrow_type(column):
+    return {int: pa.int64(), float: pa.float64()}.get(column.type.python_type, pa.string())
+
+
+def parquet(chunks, columns, types):
+    schema = pa.schema([(c, arrow_type(types[c])) for c in columns])
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in chunks:
+            values = list(zip(*(row[: len(columns)] for row in rows)))
+            arrays = [pa.array(v, type=f.type) for v, f in zip(values, schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def render(fmt, chunks, columns, types, shape):
+    if fmt == "ndjson":
+        return ndjson(chunks, shape)
+    if fmt == "csv":
+        return csv_rows(chunks, columns)
+    if fmt == "parquet":
+        if pa is None:
+            raise RuntimeError("Parquet export requires pyarrow")
+        return parquet(chunks, columns, types)
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+# =========================
+# EXPORTS
+# =========================
+# CSV and Parquet are flat: planet columns come out as planet_<field>
+def export_characters(fmt, character_fields, planet_fields, **filters):
+    query, params = queries.character_export_query(character_fields, planet_fields, **filters)
+    columns = [*character_fields, *(f"planet_{f}" for f in planet_fields)]
+    types = {f: characters.c[f] for f in character_fields}
+    types.update((f"planet_{f}", planets.c[f]) for f in planet_fields)
+    return render(
+        fmt,
+        stream_chunks(query, params),
+        columns,
+        types,
+        lambda m: character_shape(m, character_fields, planet_fields),
+    )
+
+
+def export_planets(fmt, name=None, match="substring"):
+    query, params = queries.planet_export_query(name, match)
+    columns = ["id", *PLANET_FIELDS]
+    types = {f: planets.c[f] for f in columns}
+    return render(fmt, stream_chunks(query, params), columns, types, planet_shape)
@@ -0,0 +1,206 @@
+import asyncio
+import math
+from collections import deque
+from contextlib import asynccontextmanager
+
+from config import (
+    Old_Republic_DB,
+    New_Republic_DB,
+    EXTRACT_CONCURRENCY,
+    EXTRACT_WINDOW,
+    OLD_REPUBLIC_PAGE_SIZE,
+)
+from http_client import AsyncHTTPClient
+from metrics import SLOW_BUCKETS, Histogram
+
+
+async def fetch_json(client, url, semaphore, params=None):
+    async with semaphore:
+        return await client.get_json(url, params=params)
+
+
+def parse_old_character(item):
+    return {
+        "uid": item["uid"],
+        "name": item["name"],
+        "url": item["url"],
+    }
+
+
+def parse_new_character(item):
+    return {
+        "name": item["name"],
+        "height": item["height"],
+        "mass": item["mass"],
+        "hair_color": item["hair_color"],
+        "skin_color": item["skin_color"],
+        "eye_color": item["eye_color"],
+        "birth_year": item["birth_year"],
+        "gender": item["gender"],
+        "homeworld": item["homeworld"],
+    }
+
+
+# Runs at most `window` requests ahead of the consumer and yields their
+# results in order, so a slow consumer holds back the fetching
+async def windowed(requests, window):
+    pending = deque()
+    try:
+        for request in requests:
+            pending.append(asyncio.ensure_future(request))
+            if len(pending) >= window:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+# Caps the characters taken from successive pages at `limit` (None: all)
+class Cap:
+    def __init__(self, limit):
+        self.limit = limit
+        self.taken = 0
+
+    @property
+    def reached(self):
+        return self.limit is not None and self.taken >= self.limit
+
+    def take(self, items):
+        if self.limit is not None:
+            items = items[: max(0, self.limit - self.taken)]
+        self.taken += len(items)
+        return items
+
+
+# OLD REPUBLIC (swapi.tech): paginated, reports total_records on every page.
+# Yields one list of parsed characters per page.
+async def iter_old_republic(client, semaphore, limit, window=EXTRACT_WINDOW):
+    page_size = OLD_REPUBLIC_PAGE_SIZE
+    if limit is not None:
+        page_size = max(1, min(limit, page_size))
+    cap = Cap(limit)
+    first = await fetch_json(
+        client, Old_Republic_DB, semaphore, params={"page": 1, "limit": page_size}
+    )
+    yield [parse_old_character(item) for item in cap.take(first["results"])]
+
+    total = first.get("total_records")
+    if total is not None:
+        # Total is known: every remaining page is requested up front, a
+        # window at a time, with the semaphore bounding what is in flight
+        wanted = int(total) if limit is None else min(limit, int(total))
+        pages = math.ceil(wanted / page_size)
+        requests = (
+            fetch_json(
+                client, Old_Republic_DB, semaphore, params={"page": page, "limit": page_size}
+            )
+            for page in range(2, pages + 1)
+        )
+        async for data in windowed(requests, window):
+            yield [parse_old_character(item) for item in cap.take(data["results"])]
+    else:
+        url = first.get("next")
+        while url and not cap.reached:
+            data = await fetch_json(client, url, semaphore)
+            yield [parse_old_character(item) for item in cap.take(data["results"])]
+            url = data.get("next")
+
+
+# NEW REPUBLIC (swapi.info): one list with the whole catalog, or a
+# SWAPI.dev style page ({"count", "next", "results"})
+async def iter_new_republic(client, semaphore, limit, window=EXTRACT_WINDOW):
+    cap = Cap(limit)
+    first = await fetch_json(client, New_Republic_DB, semaphore)
+
+    if isinstance(first, list):
+        yield [parse_new_character(item) for item in cap.take(first)]
+        return
+
+    items = first["results"]
+    yield [parse_new_character(item) for item in cap.take(items)]
+    count = first.get("count")
+    if count is not None and items and first.get("next"):
+        wanted = int(count) if limit is None else min(limit, int(count))
+        pages = math.ceil(wanted / len(items))
+        requests = (
+            fetch_json(client, New_Republic_DB, semaphore, params={"page": page})
+            for page in range(2, pages + 1)
+        )
+        async for data in windowed(requests, window):
+            yield [parse_new_character(item) for item in cap.take(data["results"])]
+    else:
+        url = first.get("next")
+        while url and not cap.reached:
+            data = await fetch_json(client, url, semaphore)
+            yield [parse_new_character(item) for item in cap.take(data["results"])]
+            url = data.get("next")
+
+
+SOURCE_SECONDS = Histogram(
+    "etl_extract_duration_seconds",
+    "Time from a source's first request until its last page was taken",
+    ["source"],
+    buckets=SLOW_BUCKETS,
+)
+
+
+# A source's pages as they come, timing the source end to end
+async def timed(source, pages):
+    with SOURCE_SECONDS.time(source=source):
+        async for page in pages:
+            yield page
+
+
+async def collect(pages):
+    return [character async for page in pages for character in page]
+
+
+async def extract_old_republic(client, semaphore, limit):
+    return await collect(timed("old_republic", iter_old_republic(client, semaphore, limit)))
+
+
+async def extract_new_republic(client, semaphore, limit):
+    return await collect(timed("new_republic", iter_new_republic(client, semaphore, limit)))
+
+
+# Both sources as page iterators on one client, for the streaming pipeline
+@asynccontextmanager
+async def open_sources(limit, concurrency=EXTRACT_CONCURRENCY, client=None):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def sources(c):
+        return (
+            timed("old_republic", iter_old_republic(c, semaphore, limit)),
+            timed("new_republic", iter_new_republic(c, semaphore, limit)),
+        )
+
+    if client is not None:
+        yield sources(client)
+        return
+    async with AsyncHTTPClient() as c:
+        yield sources(c)
+
+
+async def extract_all(limit, concurrency=EXTRACT_CONCURRENCY, client=None):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(c):
+        return await asyncio.gather(
+            extract_old_republic(c, semaphore, limit),
+            extract_new_republic(c, semaphore, limit),
+        )
+
+    if client is not None:
+        old, new = await run(client)
+    else:
+        async with AsyncHTTPClient() as c:
+            old, new = await run(c)
+    return old, new
+
+
+# Sync entry point for run_etl: returns (old_characters, new_characters);
+# limit=None takes the whole catalog
+def extract_characters(limit, concurrency=EXTRACT_CONCURRENCY):
+    return asyncio.run(extract_all(limit, concurrency))
@@ -1,32 +1,35 @@
-import requests
+import asyncio
+
 import pandas as pd
-import json
-import os
 
-def load_homeworld_cache(cache_file):
-    if os.path.exists(cache_file):
-        with open(cache_file, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
+from cache_store import open_cache_store
+from config import New_Republic_Planets, BULK_PLANET_THRESHOLD, EXTRACT_CONCURRENCY
+from http_client import get_json, AsyncHTTPClient
 
-def save_homeworld_cache(cache, cache_file):
-    with open(cache_file, "w", encoding="utf-8") as f:
-        json.dump(cache, f, indent=2, ensure_ascii=False)
+LEGACY_HOMEWORLD_CACHE_FILE = "homeworld_cache.json"
 
-def fetch_homeworld(homeworld_url, planet_cache, cache_file):
-    if pd.isna(homeworld_url) or not homeworld_url:
-        return {}
+PLANET_COLUMNS = [
+    "homeworld_name",
+    "rotation_period",
+    "orbital_period",
+    "diameter",
+    "climate",
+    "gravity",
+    "terrain",
+    "surface_water",
+    "population",
+]
 
-    if homeworld_url in planet_cache:
-        return planet_cache[homeworld_url]
+def load_homeworld_cache(cache_file, legacy_file=LEGACY_HOMEWORLD_CACHE_FILE):
+    return open_cache_store(cache_file, legacy_json=legacy_file)
 
-    response = requests.get(homeworld_url)
-    response.raise_for_status()
-    data = response.json()
+def save_homeworld_cache(cache):
+    cache.flush()
 
+def parse_planet(data):
     planet = data.get("result", {}).get("properties", data)
 
-    planet_data = {
+    return {
         "homeworld_name": planet.get("name"),
         "rotation_period": planet.get("rotation_period"),
         "orbital_period": planet.get("orbital_period"),
@@ -38,7 +41,83 @@ def fetch_homeworld(homeworld_url, planet_cache, cache_file):
         "population": planet.get("population"),
     }
 
-    planet_cache[homeworld_url] = planet_data
-    save_homeworld_cache(planet_cache, cache_file)
+def fetch_homeworld(homeworld_url, planet_cache):
+    if pd.isna(homeworld_url) or not homeworld_url:
+        return {}
+
+    cached = planet_cache.get(homeworld_url)
+    if cached is not None:
+        return cached
+
+    planet_data = parse_planet(get_json(homeworld_url))
+
+    # Buffered point write; the store flushes in batches
+    planet_cache.set(homeworld_url, planet_data)
 
     return planet_data
+
+
+# =========================
+# BULK RESOLUTION
+# =========================
+async def _fetch_planets(urls, concurrency, client=None):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(c, url):
+        async with semaphore:
+            return url, parse_planet(await c.get_json(url))
+
+    async def run(c):
+        return dict(await asyncio.gather(*(fetch(c, url) for url in urls)))
+
+    if client is not None:
+        return await run(client)
+    async with AsyncHTTPClient() as c:
+        return await run(c)
+
+def fetch_planets(urls, concurrency=EXTRACT_CONCURRENCY):
+    return asyncio.run(_fetch_planets(urls, concurrency))
+
+# SWAPI.info answers with one list; SWAPI.dev style pages ({"next",
+# "results"}) are followed until "next" runs out
+def fetch_all_planets(planets_url=New_Republic_Planets):
+    planets = {}
+    url = planets_url
+    while url:
+        data = get_json(url)
+        if isinstance(data, list):
+            items, url = data, None
+        else:
+            items, url = data.get("results", []), data.get("next")
+        planets.update((item["url"], parse_planet(item)) for item in items if item.get("url"))
+    return planets
+
+def resolve_homeworlds(homeworld_urls, planet_cache, bulk_threshold=BULK_PLANET_THRESHOLD):
+    urls = pd.Series(homeworld_urls).dropna()
+    urls = urls[urls != ""].unique()
+
+    resolved = {}
+    misses = set()
+    for url in urls:
+        planet = planet_cache.get(url)
+        if planet is None:
+            misses.add(url)
+        else:
+            resolved[url] = planet
+
+    if len(misses) >= bulk_threshold:
+        # A handful of list calls covers every planet SWAPI knows about
+        for url, planet in fetch_all_planets().items():
+            planet_cache.set(url, planet)
+            if url in misses:
+                resolved[url] = planet
+        misses -= resolved.keys()
+
+    if misses:
+        for url, planet in fetch_planets(sorted(misses)).items():
+            planet_cache.set(url, planet)
+            resolved[url] = planet
+
+    planet_df = pd.DataFrame.from_dict(resolved, orient="index", columns=PLANET_COLUMNS)
+    planet_df.index.name = "homeworld"
+    return planet_df
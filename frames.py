@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+from fetch_homeworld import PLANET_COLUMNS
+
+try:
+    import pyarrow  # noqa: F401
+
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:  # optional: NumPy-backed strings instead
+    STRING_DTYPE = "string"
+
+OLD_COLUMNS = ["uid", "name", "url"]
+NEW_COLUMNS = [
+    "name",
+    "height",
+    "mass",
+    "hair_color",
+    "skin_color",
+    "eye_color",
+    "birth_year",
+    "gender",
+    "homeworld",
+]
+# run_etl's final_df columns, in the order the outer merge produces them
+FINAL_COLUMNS = [*OLD_COLUMNS, *NEW_COLUMNS[1:], *PLANET_COLUMNS]
+
+# A few distinct values repeated on every row (measures included: there are
+# only so many heights) are stored once per frame with small integer codes
+# per row. Everything else is an Arrow-backed string.
+CATEGORY_COLUMNS = {
+    "height",
+    "mass",
+    "hair_color",
+    "skin_color",
+    "eye_color",
+    "birth_year",
+    "gender",
+    "homeworld",
+    *PLANET_COLUMNS,
+}
+
+
+def dtype_for(column):
+    return "category" if column in CATEGORY_COLUMNS else STRING_DTYPE
+
+
+# Built column by column from the parsed records, so no object-dtype frame
+# exists in between
+def source_frame(records, columns) -> pd.DataFrame:
+    return pd.DataFrame(
+        {c: pd.array([r.get(c) for r in records], dtype=dtype_for(c)) for c in columns},
+        columns=columns,
+    )
+
+
+# The outer join on name run_etl has always done, over typed frames
+def merge_sources(old_characters, new_characters) -> pd.DataFrame:
+    return pd.merge(
+        source_frame(old_characters, OLD_COLUMNS),
+        source_frame(new_characters, NEW_COLUMNS),
+        on="name",
+        how="outer",
+    )
+
+
+# Adds the planet columns to merge_df in place instead of merging a second
+# copy of it: each homeworld category is mapped to its planet row once, and
+# every planet column becomes a categorical taken through those codes
+def add_planets(merge_df: pd.DataFrame, planet_df: pd.DataFrame) -> pd.DataFrame:
+    homeworld = merge_df["homeworld"]
+    if not isinstance(homeworld.dtype, pd.CategoricalDtype):
+        homeworld = homeworld.astype("category")
+
+    # -1 (no homeworld, or an unresolved one) indexes the appended -1
+    positions = np.append(planet_df.index.get_indexer(homeworld.cat.categories), -1)
+    rows = positions[homeworld.cat.codes.to_numpy()]
+
+    for column in PLANET_COLUMNS:
+        values = pd.Categorical(planet_df[column])
+        codes = np.append(values.codes, -1)
+        merge_df[column] = pd.Categorical.from_codes(codes[rows], dtype=values.dtype)
+    return merge_df
@@ -0,0 +1,65 @@
+import threading
+import time
+
+from sqlalchemy import select, func
+
+from config import GENERATION_POLL_SECONDS
+from db import get_read_engine
+from model import load_runs
+
+# The data generation is the id of the last load_runs row that changed
+# anything. Readers poll it at most every GENERATION_POLL_SECONDS; a loader
+# in the same process pushes new generations immediately.
+_lock = threading.Lock()
+_state = {"generation": None, "loaded_at": None, "checked_at": 0.0}
+_listeners = []
+
+
+def read_generation(conn):
+    changed = load_runs.c.inserted + load_runs.c.updated + load_runs.c.deleted
+    last = (
+        select(func.max(load_runs.c.id))
+        .where(load_runs.c.finished_at.is_not(None), changed > 0)
+        .scalar_subquery()
+    )
+    row = conn.execute(
+        select(load_runs.c.id, load_runs.c.finished_at).where(load_runs.c.id == last)
+    ).first()
+    return (row.id, row.finished_at) if row else (0, None)
+
+
+# Non-blocking: the known generation if it was confirmed recently, else None
+def cached_generation():
+    with _lock:
+        fresh = time.monotonic() - _state["checked_at"] < GENERATION_POLL_SECONDS
+        if fresh and _state["generation"] is not None:
+            return _state["generation"], _state["loaded_at"]
+    return None
+
+
+def current_generation(db_engine=None):
+    cached = cached_generation()
+    if cached is not None:
+        return cached
+
+    with (db_engine or get_read_engine()).connect() as conn:
+        generation, loaded_at = read_generation(conn)
+
+    bump_generation(generation, loaded_at)
+    return generation, loaded_at
+
+
+def bump_generation(generation, loaded_at):
+    with _lock:
+        changed = generation != _state["generation"]
+        _state.update(generation=generation, loaded_at=loaded_at, checked_at=time.monotonic())
+        listeners = list(_listeners) if changed else []
+
+    for listener in listeners:
+        listener(generation)
+
+
+def on_generation_change(listener):
+    with _lock:
+        _listeners.append(listener)
+    return listener
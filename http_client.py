@@ -0,0 +1,289 @@
+import asyncio
+import random
+import threading
+import time
+from collections import defaultdict
+
+import httpx
+
+from config import (
+    HTTP_TIMEOUT,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_PER_HOST,
+    HTTP_MAX_RETRIES,
+    HTTP_BACKOFF_BASE,
+    HTTP_BACKOFF_MAX,
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_SECONDS,
+)
+from metrics import Counter, Gauge, Histogram
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+TIMEOUT = httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+LIMITS = httpx.Limits(
+    max_connections=HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+    keepalive_expiry=30,
+)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+# =========================
+# CIRCUIT BREAKER
+# =========================
+class CircuitBreaker:
+    def __init__(self, threshold=CIRCUIT_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def before_request(self, host):
+        with self._lock:
+            state = self.state
+            # Half-open lets exactly one probe through
+            if state == "open" or (state == "half-open" and self._probing):
+                raise CircuitOpenError(f"circuit open for {host}")
+            if state == "half-open":
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            # A failed half-open probe re-opens immediately
+            if self.failures >= self.threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+
+# =========================
+# PER-HOST STATS
+# =========================
+_stats_lock = threading.Lock()
+_stats = defaultdict(
+    lambda: {"requests": 0, "retries": 0, "failures": 0, "total_ms": 0.0, "max_ms": 0.0}
+)
+_breakers = defaultdict(CircuitBreaker)
+
+
+UPSTREAM_SECONDS = Histogram(
+    "upstream_request_duration_seconds", "Latency of each upstream HTTP attempt", ["host"]
+)
+
+
+def _record(host, elapsed_ms, failed):
+    UPSTREAM_SECONDS.observe(elapsed_ms / 1000, host=host)
+    with _stats_lock:
+        s = _stats[host]
+        s["requests"] += 1
+        s["total_ms"] += elapsed_ms
+        s["max_ms"] = max(s["max_ms"], elapsed_ms)
+        if failed:
+            s["failures"] += 1
+
+
+def _record_retry(host):
+    with _stats_lock:
+        _stats[host]["retries"] += 1
+
+
+def host_stats():
+    with _stats_lock:
+        out = {}
+        for host, s in _stats.items():
+            out[host] = dict(s)
+            out[host]["avg_ms"] = s["total_ms"] / s["requests"] if s["requests"] else 0.0
+            out[host]["circuit"] = _breakers[host].state
+        return out
+
+
+# The per-host counters above, read at scrape time
+def host_values(field):
+    return lambda: {(host,): s[field] for host, s in host_stats().items()}
+
+
+Counter("upstream_requests_total", "Upstream HTTP attempts", ["host"], collect=host_values("requests"))
+Counter("upstream_retries_total", "Upstream HTTP retries", ["host"], collect=host_values("retries"))
+Counter(
+    "upstream_failures_total", "Upstream HTTP attempts that failed", ["host"], collect=host_values("failures")
+)
+Gauge(
+    "upstream_circuit_open",
+    "1 while the host's circuit breaker is open or half-open",
+    ["host"],
+    collect=lambda: {(host,): int(s["circuit"] != "closed") for host, s in host_stats().items()},
+)
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+        _breakers.clear()
+
+
+def _retry_delay(attempt, response=None):
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), HTTP_BACKOFF_MAX)
+    # Full jitter exponential backoff
+    return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2**attempt))
+
+
+def _is_failure(response):
+    return response.status_code in RETRY_STATUSES
+
+
+# =========================
+# SYNC CLIENT
+# =========================
+class HTTPClient:
+    def __init__(self, transport=None, max_per_host=HTTP_MAX_PER_HOST):
+        self._client = httpx.Client(
+            timeout=TIMEOUT,
+            limits=LIMITS,
+            transport=transport,
+            follow_redirects=True,
+        )
+        self._slots = defaultdict(lambda: threading.BoundedSemaphore(max_per_host))
+        self._slots_lock = threading.Lock()
+
+    def _slot(self, host):
+        with self._slots_lock:
+            return self._slots[host]
+
+    def get(self, url, params=None):
+        host = httpx.URL(url).host
+        breaker = _breakers[host]
+
+        for attempt in range(HTTP_MAX_RETRIES + 1):
+            breaker.before_request(host)
+            start = time.perf_counter()
+            try:
+                with self._slot(host):
+                    response = self._client.get(url, params=params)
+            except httpx.TransportError:
+                _record(host, (time.perf_counter() - start) * 1000, failed=True)
+                breaker.record_failure()
+                if attempt == HTTP_MAX_RETRIES:
+                    raise
+                _record_retry(host)
+                time.sleep(_retry_delay(attempt))
+                continue
+
+            failed = _is_failure(response)
+            _record(host, (time.perf_counter() - start) * 1000, failed=failed)
+            if not failed:
+                breaker.record_success()
+                return response
+
+            breaker.record_failure()
+            if attempt == HTTP_MAX_RETRIES:
+                return response
+            _record_retry(host)
+            time.sleep(_retry_delay(attempt, response))
+
+    def get_json(self, url, params=None):
+        response = self.get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    def close(self):
+        self._client.close()
+
+
+# =========================
+# ASYNC CLIENT
+# =========================
+class AsyncHTTPClient:
+    def __init__(self, transport=None, max_per_host=HTTP_MAX_PER_HOST):
+        self._client = httpx.AsyncClient(
+            timeout=TIMEOUT,
+            limits=LIMITS,
+            transport=transport,
+            follow_redirects=True,
+        )
+        self._slots = defaultdict(lambda: asyncio.Semaphore(max_per_host))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def get(self, url, params=None):
+        host = httpx.URL(url).host
+        breaker = _breakers[host]
+
+        for attempt in range(HTTP_MAX_RETRIES + 1):
+            breaker.before_request(host)
+            start = time.perf_counter()
+            try:
+                async with self._slots[host]:
+                    response = await self._client.get(url, params=params)
+            except httpx.TransportError:
+                _record(host, (time.perf_counter() - start) * 1000, failed=True)
+                breaker.record_failure()
+                if attempt == HTTP_MAX_RETRIES:
+                    raise
+                _record_retry(host)
+                await asyncio.sleep(_retry_delay(attempt))
+                continue
+
+            failed = _is_failure(response)
+            _record(host, (time.perf_counter() - start) * 1000, failed=failed)
+            if not failed:
+                breaker.record_success()
+                return response
+
+            breaker.record_failure()
+            if attempt == HTTP_MAX_RETRIES:
+                return response
+            _record_retry(host)
+            await asyncio.sleep(_retry_delay(attempt, response))
+
+    async def get_json(self, url, params=None):
+        response = await self.get(url, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+# Process-wide keep-alive client for synchronous callers (fetch_homeworld)
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HTTPClient()
+        return _client
+
+
+def get_json(url, params=None):
+    return get_client().get_json(url, params=params)
@@ -1,6 +1,10 @@
-from db import engine
-from model import metadata
+import sys
 
+from db import get_engine
+from model import ensure_schema
+
+# `python init_db.py --rebuild` also drops characters/planets tables whose
+# layout is outdated, so they can be recreated and reloaded
 if __name__ == "__main__":
-    metadata.create_all(engine)
+    ensure_schema(get_engine(), rebuild_stale=sys.argv[1:] == ["--rebuild"])
     print("Database tables created successfully")
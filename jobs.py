@@ -0,0 +1,339 @@
+import json
+import os
+import socket
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, insert, text, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from config import (
+    ETL_IDLE_BACKOFF,
+    ETL_INTERVAL_SECONDS,
+    ETL_LOCK_TTL_SECONDS,
+    ETL_MAX_INTERVAL_SECONDS,
+    ETL_RUNTIME_FACTOR,
+)
+from db import get_engine, lock_engine
+from logger_config import setup_logger
+from metrics import SLOW_BUCKETS, Counter, Gauge, Histogram
+from model import etl_runs, job_locks
+
+ETL_LOCK = "etl"
+ROW_COUNTS = ["characters", "planets", "inserted", "updated", "unchanged", "deleted"]
+
+STAGE_SECONDS = Histogram(
+    "etl_stage_duration_seconds", "Duration of each run_etl stage", ["stage"], buckets=SLOW_BUCKETS
+)
+ROWS = Counter("etl_rows_total", "Rows processed by run_etl, by kind", ["kind"])
+RUN_SECONDS = Histogram(
+    "etl_run_duration_seconds", "Duration of whole ETL runs", ["status"], buckets=SLOW_BUCKETS
+)
+RUNS = Counter("etl_runs_total", "ETL triggers, by outcome", ["status"])
+LAST_SUCCESS = Gauge("etl_last_success_timestamp_seconds", "Unix time the last ETL run succeeded")
+NEXT_INTERVAL = Gauge("etl_next_interval_seconds", "Wait the job runner settled on")
+
+logger = setup_logger()
+
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
+
+def owner_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# =========================
+# CROSS-PROCESS LOCK
+# =========================
+# PostgreSQL: a session advisory lock on a connection kept for the run. The
+# server drops it with the session, so a killed loader never leaves it held.
+class AdvisoryLock:
+    def __init__(self, db_engine, name):
+        self.db_engine = db_engine
+        self.key = zlib.crc32(name.encode())
+        self.conn = None
+
+    def acquire(self):
+        # Autocommit: the connection must not sit idle in a transaction
+        conn = self.db_engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            acquired = conn.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key}
+            ).scalar()
+        except BaseException:
+            conn.close()
+            raise
+        if not acquired:
+            conn.close()
+            return False
+        self.conn = conn
+        return True
+
+    def heartbeat(self, conn=None):
+        return True
+
+    def release(self):
+        try:
+            self.conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": self.key})
+        except Exception:
+            # Ending the session releases it as well
+            self.conn.invalidate()
+        finally:
+            self.conn.close()
+            self.conn = None
+
+
+# Elsewhere (SQLite): a job_locks row. A holder that dies without releasing
+# it loses it ttl seconds after its last heartbeat. While a load holds
+# SQLite's write lock no heartbeat can commit, but no other process can
+# take the row either; the load renews it before committing (RunRecord).
+class RowLock:
+    def __init__(self, db_engine, name, owner, ttl=ETL_LOCK_TTL_SECONDS):
+        self.db_engine = db_engine
+        self.name = name
+        self.owner = owner
+        self.ttl = timedelta(seconds=ttl)
+
+    def acquire(self):
+        now = utcnow()
+        try:
+            with self.db_engine.begin() as conn:
+                conn.execute(
+                    delete(job_locks).where(
+                        job_locks.c.name == self.name, job_locks.c.expires_at < now
+                    )
+                )
+                conn.execute(
+                    insert(job_locks).values(
+                        name=self.name, owner=self.owner, acquired_at=now, expires_at=now + self.ttl
+                    )
+                )
+        except IntegrityError:
+            return False
+        except OperationalError as exc:
+            # Another process is mid-load and holds the database write lock
+            if "locked" in str(exc.orig):
+                return False
+            raise
+        return True
+
+    # False once the lock expired and another process took it over. conn:
+    # renew inside that connection's transaction instead of a new one
+    def heartbeat(self, conn=None):
+        if conn is None:
+            with self.db_engine.begin() as conn:
+                return self.heartbeat(conn)
+        return (
+            conn.execute(
+                update(job_locks)
+                .where(job_locks.c.name == self.name, job_locks.c.owner == self.owner)
+                .values(expires_at=utcnow() + self.ttl)
+            ).rowcount
+            == 1
+        )
+
+    def release(self):
+        with self.db_engine.begin() as conn:
+            conn.execute(
+                delete(job_locks).where(
+                    job_locks.c.name == self.name, job_locks.c.owner == self.owner
+                )
+            )
+
+
+def db_lock(db_engine, name, owner):
+    if db_engine.dialect.name == "postgresql":
+        return AdvisoryLock(db_engine, name)
+    return RowLock(lock_engine(db_engine), name, owner)
+
+
+# Keeps a RowLock alive while the job runs
+@contextmanager
+def heartbeat(lock, every=ETL_LOCK_TTL_SECONDS / 3):
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(every):
+            try:
+                if not lock.heartbeat():
+                    logger.error("ETL lock expired and was taken over by another process")
+            except OperationalError as exc:
+                # Busy database, on SQLite a load holding the write lock: the
+                # next beat tries again
+                logger.warning(f"ETL lock heartbeat failed: {exc}")
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+# =========================
+# RUN HISTORY
+# =========================
+# Handed to the job, which times its stages and counts its rows here; both
+# end up in the run's etl_runs row. A stage opened inside another (stats
+# inside the streaming pipeline's load) is taken out of the outer one's
+# time, so the stages never overlap and add up to at most the runtime.
+class RunRecord:
+    def __init__(self, lock=None):
+        self.stages = {}
+        self.rows = {}
+        self.failed_stage = None
+        self.lock = lock
+        # Seconds spent in nested stages, one entry per open stage
+        self._nested = []
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        self._nested.append(0.0)
+        try:
+            yield
+        except BaseException:
+            # The innermost stage is the one that failed
+            self.failed_stage = self.failed_stage or name
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            own = elapsed - self._nested.pop()
+            if self._nested:
+                self._nested[-1] += elapsed
+            self.stages[name] = self.stages.get(name, 0.0) + own
+            STAGE_SECONDS.observe(own, stage=name)
+
+    def count(self, **rows):
+        for name, n in rows.items():
+            self.rows[name] = self.rows.get(name, 0) + int(n)
+            ROWS.inc(int(n), kind=name)
+
+    # Called by the job inside a long write transaction, just before it
+    # commits; a lock lost in the meantime rolls the transaction back
+    def renew_lock(self, conn):
+        if self.lock is not None and not self.lock.heartbeat(conn):
+            raise RuntimeError("ETL lock was taken over by another process")
+
+    @property
+    def changed(self):
+        return any(self.rows.get(name) for name in ("inserted", "updated", "deleted"))
+
+    def error(self, exc):
+        message = f"{type(exc).__name__}: {exc}"
+        return f"{self.failed_stage}: {message}" if self.failed_stage else message
+
+
+# Seconds until the next run: back to the base interval when the data
+# changed, multiplied by backoff while nothing changes (or the runs fail),
+# and never less than factor times the last runtime, so a slow run is not
+# followed straight away by the next one
+def next_interval(
+    previous,
+    runtime,
+    changed,
+    base=ETL_INTERVAL_SECONDS,
+    maximum=ETL_MAX_INTERVAL_SECONDS,
+    factor=ETL_RUNTIME_FACTOR,
+    backoff=ETL_IDLE_BACKOFF,
+):
+    interval = base if changed else previous * backoff
+    return min(max(interval, runtime * factor, base), maximum)
+
+
+# =========================
+# JOB RUNNER
+# =========================
+# Runs job(record) once at a time: a trigger that fires while this process
+# is still running is skipped, and other processes (the scheduler container,
+# someone running main.py) are kept out by the database lock. Only runs
+# that held the lock are written to etl_runs. After each one the interval
+# adapts and on_interval is told, so the scheduler can move the next trigger.
+class JobRunner:
+    def __init__(
+        self,
+        job,
+        name=ETL_LOCK,
+        pipeline=None,
+        db_engine=None,
+        interval=ETL_INTERVAL_SECONDS,
+        on_interval=None,
+    ):
+        self.job = job
+        self.name = name
+        self.pipeline = pipeline
+        self.db_engine = db_engine or get_engine()
+        self.owner = owner_id()
+        self.interval = interval
+        self.on_interval = on_interval
+        self.running = threading.Lock()
+
+    # The etl_runs id, or None when the run was skipped
+    def run_once(self):
+        if not self.running.acquire(blocking=False):
+            logger.info(f"{self.name} run skipped: the previous one is still running")
+            RUNS.inc(status="skipped")
+            return None
+        try:
+            lock = db_lock(self.db_engine, self.name, self.owner)
+            if not lock.acquire():
+                logger.info(f"{self.name} run skipped: another process holds the lock")
+                RUNS.inc(status="skipped")
+                return None
+            try:
+                with heartbeat(lock):
+                    return self.run_locked(lock)
+            finally:
+                lock.release()
+        finally:
+            self.running.release()
+
+    def run_locked(self, lock=None):
+        record = RunRecord(lock)
+        with self.db_engine.begin() as conn:
+            run_id = conn.execute(
+                insert(etl_runs).values(
+                    owner=self.owner, pipeline=self.pipeline, status="running", started_at=utcnow()
+                )
+            ).inserted_primary_key[0]
+
+        start = time.perf_counter()
+        status, error = "succeeded", None
+        try:
+            self.job(record)
+        except Exception as exc:
+            # Recorded rather than raised: the scheduler keeps going
+            logger.exception(f"{self.name} run failed")
+            status, error = "failed", record.error(exc)
+        duration = time.perf_counter() - start
+
+        self.interval = next_interval(self.interval, duration, record.changed)
+        RUNS.inc(status=status)
+        RUN_SECONDS.observe(duration, status=status)
+        NEXT_INTERVAL.set(self.interval)
+        if status == "succeeded":
+            LAST_SUCCESS.set(time.time())
+        with self.db_engine.begin() as conn:
+            conn.execute(
+                update(etl_runs)
+                .where(etl_runs.c.id == run_id)
+                .values(
+                    status=status,
+                    finished_at=utcnow(),
+                    duration_s=duration,
+                    stages=json.dumps(record.stages),
+                    error=error,
+                    next_interval_s=self.interval,
+                    **{name: record.rows.get(name) for name in ROW_COUNTS},
+                )
+            )
+
+        if self.on_interval is not None:
+            self.on_interval(self.interval)
+        return run_id
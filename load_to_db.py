@@ -1,57 +1,559 @@
-from sqlalchemy import insert, text
-from db import engine
-from model import planets, characters
+import csv
+import io
+import json
+import re
+import sys
+from datetime import datetime, timezone
+
+from sqlalchemy import (
+    Column,
+    MetaData,
+    Table,
+    Text,
+    insert,
+    select,
+    update,
+    delete,
+    bindparam,
+    func,
+    inspect,
+    literal,
+    text,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from config import LOAD_MODE, SNAPSHOT_KEEP_GENERATIONS, SNAPSHOT_MIN_RATIO
+from db import get_engine
+from generation import bump_generation
+from model import planets, characters, load_runs, define_planets, define_characters
 import pandas as pd
 
-def load_data(final_df: pd.DataFrame):
-    with engine.begin() as conn:
-        conn.execute(text("DELETE FROM characters"))
-        conn.execute(text("DELETE FROM planets"))
-
-        planet_map = {}
-
-        # Insert planets
-        for _, row in final_df.iterrows():
-            planet_name = row.get("homeworld_name")
-
-            if not planet_name or pd.isna(planet_name):
-                continue
-
-            if planet_name not in planet_map:
-                result = conn.execute(
-                    insert(planets)
-                    .values(
-                        name=planet_name,
-                        climate=row.get("climate"),
-                        terrain=row.get("terrain"),
-                        population=row.get("population"),
-                        rotation_period=row.get("rotation_period"),
-                        orbital_period=row.get("orbital_period"),
-                        diameter=row.get("diameter"),
-                        gravity=row.get("gravity"),
-                        surface_water=row.get("surface_water"),
-                        
-                    )
-                    .returning(planets.c.id)
-                )
-
-                planet_id = result.scalar_one()
-                planet_map[planet_name] = planet_id
-
-        # Insert characters
-        for _, row in final_df.iterrows():
-            planet_id = planet_map.get(row.get("homeworld_name"))
-
-            if planet_id is None:
-                continue
-
-            conn.execute(
-                insert(characters).values(
-                    name=row.get("name"),
-                    height=row.get("height"),
-                    mass=row.get("mass"),
-                    gender=row.get("gender"),
-                    birth_year=row.get("birth_year"),
-                    planet_id=planet_id,
-                )
+PLANET_FIELDS = [
+    "climate",
+    "terrain",
+    "population",
+    "rotation_period",
+    "orbital_period",
+    "diameter",
+    "gravity",
+    "surface_water",
+]
+CHARACTER_FIELDS = ["name", "height", "mass", "gender", "birth_year"]
+
+# Measures stored as numbers; anything unparseable ("unknown", "n/a") is NULL
+NUMERIC_FIELDS = {
+    "height": "Float64",
+    "mass": "Float64",
+    "population": "Int64",
+    "rotation_period": "Int64",
+    "orbital_period": "Int64",
+    "diameter": "Int64",
+    "surface_water": "Float64",
+}
+
+# SQLite caps bound parameters per statement (32766 since 3.32)
+MAX_BIND_PARAMS = 32000
+
+
+def to_records(df: pd.DataFrame):
+    return df.astype(object).where(df.notna(), None).to_dict("records")
+
+
+def chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+# Hashes the values, not their storage: categorical and Arrow-backed columns
+# hash exactly like the same strings in an object column
+def content_hash(df: pd.DataFrame) -> pd.Series:
+    hashed = pd.util.hash_pandas_object(df, index=False)
+    return hashed.map("{:016x}".format)
+
+
+def parse_numeric(series: pd.Series, dtype="Float64") -> pd.Series:
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Each distinct value is parsed once, then spread through the codes
+        parsed = parse_numeric(pd.Series(series.cat.categories), dtype).array
+        codes = series.cat.codes.to_numpy()
+        return pd.Series(parsed.take(codes, allow_fill=True), index=series.index)
+
+    cleaned = series.astype("string").str.replace(",", "", regex=False).str.strip()
+    values = pd.to_numeric(cleaned, errors="coerce").astype("Float64")
+    if dtype == "Int64":
+        values = values.round().astype("Int64")
+    return values
+
+
+def parse_measures(df: pd.DataFrame) -> pd.DataFrame:
+    return df.assign(
+        **{
+            col: parse_numeric(df[col], dtype)
+            for col, dtype in NUMERIC_FIELDS.items()
+            if col in df
+        }
+    )
+
+
+# =========================
+# FRAMES
+# =========================
+# Columns are selected before rows are filtered, so only they are copied
+def planet_frame(final_df: pd.DataFrame) -> pd.DataFrame:
+    planet_df = final_df[["homeworld", "homeworld_name", *PLANET_FIELDS]]
+    planet_df = planet_df[planet_df["homeworld_name"].notna() & (planet_df["homeworld_name"] != "")]
+    planet_df = planet_df.drop_duplicates("homeworld").drop_duplicates("homeworld_name")
+    planet_df = planet_df.rename(columns={"homeworld": "url", "homeworld_name": "name"})
+    # Hash the delivered strings so parsing changes never look like data changes
+    planet_df["content_hash"] = content_hash(planet_df)
+    return parse_measures(planet_df).reset_index(drop=True)
+
+
+def character_frame(final_df: pd.DataFrame) -> pd.DataFrame:
+    has_planet = final_df["homeworld_name"].notna()
+    uid = final_df["uid"] if "uid" in final_df else pd.Series(None, index=final_df.index)
+    character_df = final_df.loc[has_planet, [*CHARACTER_FIELDS, "homeworld"]]
+    uid = uid[has_planet]
+    keys = uid.where(uid.notna(), "name:" + character_df["name"].astype(str))
+
+    character_df = character_df.assign(uid=keys)
+    character_df = character_df.drop_duplicates("uid", keep="last")
+    character_df["content_hash"] = content_hash(character_df[[*CHARACTER_FIELDS, "homeworld"]])
+    return parse_measures(character_df).reset_index(drop=True)
+
+
+def with_planet_ids(character_df: pd.DataFrame, planet_map: dict) -> pd.DataFrame:
+    character_df = character_df.assign(planet_id=character_df["homeworld"].map(planet_map))
+    character_df = character_df[character_df["planet_id"].notna()]
+    character_df["planet_id"] = character_df["planet_id"].astype("int64")
+    return character_df.drop(columns="homeworld")
+
+
+# =========================
+# BULK WRITES
+# =========================
+def insert_rows(conn, table, df: pd.DataFrame):
+    records = to_records(df)
+    size = max(1, MAX_BIND_PARAMS // max(1, len(df.columns)))
+    for chunk in chunks(records, size):
+        # One multi-row VALUES statement per chunk
+        conn.execute(insert(table).values(chunk))
+
+
+def copy_rows(conn, table, df: pd.DataFrame):
+    buf = io.StringIO()
+    df.to_csv(buf, index=False, header=False, quoting=csv.QUOTE_MINIMAL)
+    buf.seek(0)
+
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(df.columns)}) FROM STDIN WITH (FORMAT csv)",
+            buf,
+        )
+    finally:
+        cursor.close()
+
+
+def insert_characters(conn, character_df: pd.DataFrame, table=characters):
+    if character_df.empty:
+        return
+
+    if conn.dialect.name == "postgresql":
+        copy_rows(conn, table, character_df)
+    else:
+        conn.execute(insert(table), to_records(character_df))
+
+
+def update_rows(conn, table, key, df: pd.DataFrame):
+    if df.empty:
+        return
+    records = [
+        {**rec, "b_key": rec.pop(key)} for rec in to_records(df)
+    ]
+    conn.execute(update(table).where(table.c[key] == bindparam("b_key")), records)
+
+
+def delete_rows(conn, table, key, keys):
+    for chunk in chunks(list(keys), MAX_BIND_PARAMS):
+        conn.execute(delete(table).where(table.c[key].in_(chunk)))
+
+
+def new_and_changed(incoming: pd.DataFrame, existing: pd.DataFrame, key):
+    merged = incoming.merge(
+        existing, on=key, how="left", suffixes=("", "_old"), indicator=True
+    )
+    is_new = merged["_merge"] == "left_only"
+    is_changed = ~is_new & (merged["content_hash"] != merged["content_hash_old"])
+    return incoming[is_new.to_numpy()], incoming[is_changed.to_numpy()]
+
+
+def diff(incoming: pd.DataFrame, existing: pd.DataFrame, key):
+    inserted, updated = new_and_changed(incoming, existing, key)
+    gone = existing.loc[~existing[key].isin(incoming[key]), key]
+    return inserted, updated, gone
+
+
+def existing_hashes(conn, table, key):
+    rows = conn.execute(select(table.c[key], table.c.content_hash)).all()
+    return pd.DataFrame(rows, columns=[key, "content_hash"])
+
+
+def planet_ids(conn, table=planets):
+    return dict(conn.execute(select(table.c.url, table.c.id)).all())
+
+
+# =========================
+# LOAD MODES
+# =========================
+def load_full(conn, final_df: pd.DataFrame, run_id):
+    conn.execute(text("DELETE FROM characters"))
+    conn.execute(text("DELETE FROM planets"))
+
+    planet_df = planet_frame(final_df)
+    insert_rows(conn, planets, planet_df)
+
+    character_df = with_planet_ids(character_frame(final_df), planet_ids(conn))
+    insert_characters(conn, character_df)
+
+    return {
+        "inserted": len(planet_df) + len(character_df),
+        "updated": 0,
+        "unchanged": 0,
+        "deleted": 0,
+    }
+
+
+def load_incremental(conn, final_df: pd.DataFrame, run_id):
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+
+    # Planets first so characters can reference new ids
+    planet_df = planet_frame(final_df)
+    new_planets, changed_planets, gone_planets = diff(
+        planet_df, existing_hashes(conn, planets, "url"), "url"
+    )
+    insert_rows(conn, planets, new_planets)
+    update_rows(conn, planets, "url", changed_planets)
+
+    character_df = with_planet_ids(character_frame(final_df), planet_ids(conn))
+    new_characters, changed_characters, gone_characters = diff(
+        character_df, existing_hashes(conn, characters, "uid"), "uid"
+    )
+    insert_characters(conn, new_characters)
+    update_rows(conn, characters, "uid", changed_characters)
+
+    # Disappeared rows go in batches, characters before the planets they reference
+    delete_rows(conn, characters, "uid", gone_characters)
+    delete_rows(conn, planets, "url", gone_planets)
+
+    for df, new, changed, gone in (
+        (planet_df, new_planets, changed_planets, gone_planets),
+        (character_df, new_characters, changed_characters, gone_characters),
+    ):
+        counts["inserted"] += len(new)
+        counts["updated"] += len(changed)
+        counts["unchanged"] += len(df) - len(new) - len(changed)
+        counts["deleted"] += len(gone)
+
+    return counts
+
+
+# =========================
+# SNAPSHOT GENERATIONS
+# =========================
+# Live tables are always named planets/characters. A snapshot load builds
+# planets_g<run>/characters_g<run>, validates them, then in one transaction
+# renames the live pair to *_prev_<run> and the new pair to the live names.
+PREV_PATTERN = re.compile(r"^characters_prev_(\d+)$")
+
+
+def count_rows(conn, table_name):
+    return conn.execute(text(f"SELECT count(*) FROM {table_name}")).scalar()
+
+
+def retained_generations(conn):
+    names = inspect(conn).get_table_names()
+    return sorted(
+        int(m.group(1)) for m in map(PREV_PATTERN.match, names) if m
+    )
+
+
+def rename_table(conn, old, new):
+    conn.execute(text(f"ALTER TABLE {old} RENAME TO {new}"))
+
+
+def drop_generation(conn, gen):
+    conn.execute(text(f"DROP TABLE IF EXISTS characters_prev_{gen}"))
+    conn.execute(text(f"DROP TABLE IF EXISTS planets_prev_{gen}"))
+
+
+def validate_snapshot(conn, planet_table, character_table, expected_characters):
+    staged = count_rows(conn, character_table.name)
+    if staged != expected_characters or count_rows(conn, planet_table.name) == 0:
+        raise ValueError(
+            f"snapshot rejected: staged {staged} of {expected_characters} characters"
+        )
+
+    live = count_rows(conn, "characters")
+    if live and staged < live * SNAPSHOT_MIN_RATIO:
+        raise ValueError(
+            f"snapshot rejected: {staged} characters would replace {live}"
+        )
+
+    orphans = conn.execute(
+        select(func.count())
+        .select_from(character_table)
+        .where(~character_table.c.planet_id.in_(select(planet_table.c.id)))
+    ).scalar()
+    if orphans:
+        raise ValueError(f"snapshot rejected: {orphans} characters without a planet")
+
+
+def load_snapshot(conn, final_df: pd.DataFrame, run_id):
+    staging = MetaData()
+    planet_table = define_planets(staging, f"planets_g{run_id}")
+    character_table = define_characters(
+        staging, f"characters_g{run_id}", planets_name=planet_table.name
+    )
+    staging.create_all(conn)
+
+    planet_df = planet_frame(final_df)
+    insert_rows(conn, planet_table, planet_df)
+    character_df = with_planet_ids(
+        character_frame(final_df), planet_ids(conn, planet_table)
+    )
+    insert_characters(conn, character_df, table=character_table)
+
+    validate_snapshot(conn, planet_table, character_table, len(character_df))
+
+    # Swap: planets before characters so foreign keys follow on SQLite too
+    rename_table(conn, "planets", f"planets_prev_{run_id}")
+    rename_table(conn, planet_table.name, "planets")
+    rename_table(conn, "characters", f"characters_prev_{run_id}")
+    rename_table(conn, character_table.name, "characters")
+
+    kept = retained_generations(conn)
+    for gen in kept[: max(0, len(kept) - SNAPSHOT_KEEP_GENERATIONS)]:
+        drop_generation(conn, gen)
+
+    return {
+        "inserted": len(planet_df) + len(character_df),
+        "updated": 0,
+        "unchanged": 0,
+        "deleted": 0,
+    }
+
+
+# Recorded as a load_runs row like any load, so the rollback is a new data
+# generation: caches, ETags and the read model drop the data it replaced
+def rollback_snapshot(db_engine=None, after_load=None):
+    db_engine = db_engine or get_engine()
+
+    with db_engine.begin() as conn:
+        kept = retained_generations(conn)
+        if not kept:
+            raise ValueError("no previous generation to roll back to")
+        gen = kept[-1]
+
+        run_id = conn.execute(
+            insert(load_runs).values(mode="rollback", started_at=datetime.now(timezone.utc))
+        ).inserted_primary_key[0]
+        deleted = count_rows(conn, "planets") + count_rows(conn, "characters")
+        restored = count_rows(conn, f"planets_prev_{gen}") + count_rows(
+            conn, f"characters_prev_{gen}"
+        )
+
+        conn.execute(text("DROP TABLE characters"))
+        conn.execute(text("DROP TABLE planets"))
+        rename_table(conn, f"planets_prev_{gen}", "planets")
+        rename_table(conn, f"characters_prev_{gen}", "characters")
+
+        finished_at = datetime.now(timezone.utc)
+        conn.execute(
+            update(load_runs)
+            .where(load_runs.c.id == run_id)
+            .values(
+                finished_at=finished_at,
+                inserted=restored,
+                updated=0,
+                unchanged=0,
+                deleted=deleted,
+            )
+        )
+
+        if after_load is not None:
+            after_load(conn)
+
+    if restored or deleted:
+        bump_generation(run_id, finished_at)
+    return gen
+
+
+# =========================
+# STREAMED LOAD
+# =========================
+# An incremental load applied one final_df chunk at a time: each chunk is
+# diffed against the stored rows with its own keys only, and the keys seen
+# so far live in a temporary table instead of memory. Rows the stream never
+# delivered are deleted at the end; the whole run is still one transaction.
+def seen_table():
+    return Table(
+        "stream_seen",
+        MetaData(),
+        Column("kind", Text, primary_key=True),
+        Column("key", Text, primary_key=True),
+        prefixes=["TEMPORARY"],
+    )
+
+
+# A chunk's keys as one parameter, unnest(:array) on PostgreSQL and
+# json_each(:json) elsewhere, instead of one bound parameter per row
+def key_table(conn, keys):
+    keys = list(keys)
+    if conn.dialect.name == "postgresql":
+        keys = func.unnest(bindparam("keys", keys, type_=ARRAY(Text)))
+        return keys.table_valued("value").render_derived()
+    return func.json_each(bindparam("keys", json.dumps(keys))).table_valued("value")
+
+
+def hashes_for(conn, table, key, keys):
+    rows = conn.execute(
+        select(table.c[key], table.c.content_hash).where(
+            table.c[key].in_(select(key_table(conn, keys).c.value))
+        )
+    ).all()
+    return pd.DataFrame(rows, columns=[key, "content_hash"])
+
+
+def planet_ids_for(conn, urls):
+    return dict(
+        conn.execute(
+            select(planets.c.url, planets.c.id).where(
+                planets.c.url.in_(select(key_table(conn, urls).c.value))
+            )
+        ).all()
+    )
+
+
+def seen_keys(conn, seen, kind, keys):
+    return set(
+        conn.execute(
+            select(seen.c.key).where(
+                seen.c.kind == kind, seen.c.key.in_(select(key_table(conn, keys).c.value))
+            )
+        ).scalars()
+    )
+
+
+def mark_seen(conn, seen, kind, keys):
+    keys = key_table(conn, keys)
+    conn.execute(
+        insert(seen).from_select(["kind", "key"], select(literal(kind), keys.c.value))
+    )
+
+
+def upsert_chunk(conn, table, key, df, counts, insert_new=insert_rows):
+    new, changed = new_and_changed(df, hashes_for(conn, table, key, df[key]), key)
+    insert_new(conn, table, new)
+    update_rows(conn, table, key, changed)
+    counts["inserted"] += len(new)
+    counts["updated"] += len(changed)
+    counts["unchanged"] += len(df) - len(new) - len(changed)
+
+
+def delete_unseen(conn, table, key, seen, kind):
+    delivered = select(seen.c.key).where(seen.c.kind == kind)
+    return conn.execute(delete(table).where(table.c[key].not_in(delivered))).rowcount
+
+
+def load_stream(conn, final_chunks, run_id):
+    if isinstance(final_chunks, pd.DataFrame):
+        final_chunks = [final_chunks]
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+
+    seen = seen_table()
+    seen.drop(conn, checkfirst=True)
+    seen.create(conn)
+    # Planets repeat across chunks and there are few of them: the first
+    # chunk naming a planet decides it, as planet_frame does within a frame
+    planet_urls, planet_names = set(), set()
+
+    for final_df in final_chunks:
+        planet_df = planet_frame(final_df[~final_df["homeworld"].isin(planet_urls)])
+        planet_df = planet_df[~planet_df["name"].isin(planet_names)]
+        planet_urls.update(planet_df["url"])
+        planet_names.update(planet_df["name"])
+        if len(planet_df):
+            upsert_chunk(conn, planets, "url", planet_df, counts)
+            mark_seen(conn, seen, "planet", planet_df["url"])
+
+        character_df = character_frame(final_df)
+        character_df = character_df[
+            ~character_df["uid"].isin(seen_keys(conn, seen, "character", character_df["uid"]))
+        ]
+        character_df = with_planet_ids(
+            character_df, planet_ids_for(conn, character_df["homeworld"].unique())
+        )
+        if len(character_df):
+            upsert_chunk(
+                conn,
+                characters,
+                "uid",
+                character_df,
+                counts,
+                insert_new=lambda conn, table, df: insert_characters(conn, df, table),
             )
+            mark_seen(conn, seen, "character", character_df["uid"])
+
+    # Characters before the planets they reference
+    counts["deleted"] += delete_unseen(conn, characters, "uid", seen, "character")
+    counts["deleted"] += delete_unseen(conn, planets, "url", seen, "planet")
+    seen.drop(conn)
+    return counts
+
+
+LOADERS = {
+    "full": load_full,
+    "incremental": load_incremental,
+    "snapshot": load_snapshot,
+    "stream": load_stream,
+}
+
+
+# final_df may also be an iterable of final_df chunks for mode="stream".
+# after_load(conn) runs last inside the load's transaction, for writes that
+# must become visible together with the new rows (the /stats documents).
+def load_data(final_df: pd.DataFrame, db_engine=None, mode=LOAD_MODE, after_load=None):
+    db_engine = db_engine or get_engine()
+    loader = LOADERS[mode]
+
+    with db_engine.begin() as conn:
+        run_id = conn.execute(
+            insert(load_runs).values(mode=mode, started_at=datetime.now(timezone.utc))
+        ).inserted_primary_key[0]
+
+        counts = loader(conn, final_df, run_id)
+
+        finished_at = datetime.now(timezone.utc)
+        conn.execute(
+            update(load_runs)
+            .where(load_runs.c.id == run_id)
+            .values(finished_at=finished_at, **counts)
+        )
+
+        if after_load is not None:
+            after_load(conn)
+
+    # Committed: let in-process readers drop anything cached for older data
+    if counts["inserted"] or counts["updated"] or counts["deleted"]:
+        bump_generation(run_id, finished_at)
+
+    return counts
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["rollback"]:
+        # Imported here: precompute itself imports this module
+        from precompute import stats_from_conn, store_stats
+
+        gen = rollback_snapshot(after_load=lambda conn: store_stats(conn, stats_from_conn(conn)))
+        print(f"Rolled back to generation {gen}")
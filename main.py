@@ -1,46 +1,160 @@
-import pandas as pd
+import sys
+
 import uvicorn
 from apscheduler.schedulers.background import BackgroundScheduler
 
-from char_info import char_info
-from new_char_info import new_char_info
-from fetch_homeworld import fetch_homeworld, load_homeworld_cache
+from config import ETL_LIMIT, ETL_PIPELINE
+from extract import extract_characters
+from fetch_homeworld import load_homeworld_cache, resolve_homeworlds
+from frames import add_planets, merge_sources
 from load_to_db import load_data
+from pipeline import stream_final
+from precompute import compute_stats, stats_from_conn, store_stats
+from outputs import OutputWriter, write_outputs
+from http_client import host_stats
+from db import get_engine
+from model import ensure_schema
+from jobs import JobRunner, RunRecord
+from metrics import Counter
 
-LIMIT = 30
-HOMEWORLD_CACHE_FILE = "homeworld_cache.json"
-FINAL_CSV_FILE = "star_wars_characters_complete.csv"
-FINAL_JSON_FILE = "star_wars_characters_complete.json"
+# Characters taken from each source; None ingests the whole catalog
+LIMIT = ETL_LIMIT
+HOMEWORLD_CACHE_FILE = "homeworld_cache.db"
 
-def run_etl():
-    print("ETL job started")
+HOMEWORLD_LOOKUPS = Counter(
+    "etl_homeworld_cache_lookups_total", "Homeworld cache lookups, by result", ["result"]
+)
+
+def report_cache(planet_cache):
+    stats = planet_cache.stats()
+    print(f"Homeworld cache: {stats}")
+    HOMEWORLD_LOOKUPS.inc(stats["hits"], result="hit")
+    HOMEWORLD_LOOKUPS.inc(stats["misses"], result="miss")
 
-    df_old = pd.DataFrame(char_info(LIMIT))
-    df_new = pd.DataFrame(new_char_info(LIMIT))
+# Runs last in the load's transaction (load_data's after_load): the /stats
+# documents commit together with the rows, and the job lock is renewed,
+# since on SQLite its heartbeat cannot commit while the load writes
+def finish_load(record, stats):
+    def after_load(conn):
+        store_stats(conn, stats(conn))
+        record.renew_lock(conn)
 
-    merge_df = pd.merge(df_old, df_new, on="name", how="outer")
+    return after_load
+
+def run_batch(record):
+    # Both sources are paged concurrently instead of back to back
+    # and go straight into typed frames (frames.py)
+    with record.stage("extract"):
+        merge_df = merge_sources(*extract_characters(LIMIT))
 
     planet_cache = load_homeworld_cache(HOMEWORLD_CACHE_FILE)
 
-    planet_df = (
-        merge_df["homeworld"]
-        .apply(lambda url: fetch_homeworld(url, planet_cache, HOMEWORLD_CACHE_FILE))
-        .apply(pd.Series)
-    )
+    # One lookup per distinct planet, then joined in place by category codes
+    with record.stage("homeworlds"):
+        planet_df = resolve_homeworlds(merge_df["homeworld"], planet_cache)
+
+    report_cache(planet_cache)
+    planet_cache.close()
+
+    final_df = add_planets(merge_df, planet_df)
+    record.count(characters=len(final_df), planets=len(planet_df))
+
+    # Typed Parquet/Arrow by default; CSV/JSON via OUTPUT_FORMATS
+    with record.stage("outputs"):
+        print(f"Wrote {', '.join(write_outputs(final_df))}")
+
+    # Aggregates for /stats, from the same frame; stored in the load's
+    # transaction so they change together with the rows
+    with record.stage("stats"):
+        stats = compute_stats(final_df)
+
+    with record.stage("load"):
+        record.count(**load_data(final_df, after_load=finish_load(record, lambda conn: stats)))
 
-    final_df = pd.concat([merge_df, planet_df], axis=1)
+def counted(final_chunks, record):
+    for final_df in final_chunks:
+        record.count(characters=len(final_df))
+        yield final_df
 
-    final_df.to_csv(FINAL_CSV_FILE, index=False)
-    final_df.to_json(FINAL_JSON_FILE, orient="records", indent=2)
+# Extract, enrich and load overlap chunk by chunk; memory stays at a few
+# chunks instead of the whole catalog several times over
+def run_streaming(record):
+    # No full frame exists here: the aggregates are read back from the
+    # tables the load just wrote, before it commits
+    def stats(conn):
+        with record.stage("stats"):
+            return stats_from_conn(conn)
 
-    load_data(final_df)
-    print("ETL completed")
+    planet_cache = load_homeworld_cache(HOMEWORLD_CACHE_FILE)
+    writer = OutputWriter()
+    final_chunks = stream_final(LIMIT, planet_cache)
+    try:
+        # The stages overlap, so they are timed as one; the stats stage
+        # inside the load's transaction is counted apart from it
+        with record.stage("pipeline"):
+            record.count(
+                **load_data(
+                    map(writer.write, counted(final_chunks, record)),
+                    mode="stream",
+                    after_load=finish_load(record, stats),
+                )
+            )
+    except BaseException:
+        writer.abort()
+        raise
+    finally:
+        # Stops and joins the stage threads before the cache goes away
+        final_chunks.close()
+        report_cache(planet_cache)
+        planet_cache.close()
+
+    with record.stage("outputs"):
+        print(f"Wrote {', '.join(writer.close())}")
+
+def run_etl(record=None):
+    print("ETL job started")
+    record = record or RunRecord()
+
+    if ETL_PIPELINE == "streaming":
+        run_streaming(record)
+    else:
+        run_batch(record)
+
+    for host, s in host_stats().items():
+        print(
+            f"HTTP {host}: requests={s['requests']} retries={s['retries']} "
+            f"failures={s['failures']} avg_ms={s['avg_ms']:.1f} "
+            f"max_ms={s['max_ms']:.1f} circuit={s['circuit']}"
+        )
+    print(f"ETL completed: {record.rows}")
 
 def start_scheduler():
     scheduler = BackgroundScheduler()
-    scheduler.add_job(run_etl, "interval", minutes=1)
+
+    # Each run moves the next trigger to the interval it settled on
+    def reschedule(seconds):
+        scheduler.reschedule_job("etl", trigger="interval", seconds=seconds)
+
+    runner = JobRunner(run_etl, pipeline=ETL_PIPELINE, on_interval=reschedule)
+    # One run at a time; triggers missed while it ran collapse into one
+    scheduler.add_job(
+        runner.run_once,
+        "interval",
+        seconds=runner.interval,
+        id="etl",
+        max_instances=1,
+        coalesce=True,
+    )
     scheduler.start()
+    return scheduler
 
 if __name__ == "__main__":
-    start_scheduler()
-    uvicorn.run("api:app", host="0.0.0.0", port=8000)
+    # Tables (etl_runs, job_locks included) exist before the first run
+    ensure_schema(get_engine())
+
+    # `python main.py once`: a single locked, recorded run (cron, manual reloads)
+    if sys.argv[1:] == ["once"]:
+        JobRunner(run_etl, pipeline=ETL_PIPELINE).run_once()
+    else:
+        start_scheduler()
+        uvicorn.run("api:app", host="0.0.0.0", port=8000)
@@ -1,36 +1,201 @@
-from sqlalchemy import Table, Column, Integer, Text, MetaData, ForeignKey
-from db import engine
+from sqlalchemy import (
+    Table,
+    Column,
+    Index,
+    Integer,
+    BigInteger,
+    Float,
+    Text,
+    DateTime,
+    MetaData,
+    ForeignKey,
+    DDL,
+    event,
+    func,
+    inspect,
+)
+
+from config import SCHEMA_REBUILD_STALE
+from logger_config import setup_logger
 
 metadata = MetaData()
 
-planets = Table(
-    "planets",
+
+# PostgreSQL name search (search_index.py) runs on a pg_trgm GIN index over
+# lower(name); it serves ILIKE/LIKE substring and prefix as well as fuzzy
+# similarity. Other dialects use the in-process n-gram index instead.
+def trigram_ddl(table):
+    return [
+        DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"),
+        DDL(
+            f"CREATE INDEX IF NOT EXISTS ix_{table.name}_name_trgm "
+            f"ON {table.name} USING gin (lower(name) gin_trgm_ops)"
+        ),
+    ]
+
+
+def add_trigram_index(table):
+    for ddl in trigram_ddl(table):
+        event.listen(table, "after_create", ddl.execute_if(dialect="postgresql"))
+
+
+# Factories so the loader can build identically shaped staging tables
+def define_planets(metadata, name="planets"):
+    table = Table(
+        name,
+        metadata,
+        Column("id", Integer, primary_key=True, autoincrement=True),
+        Column("name", Text, unique=True),
+        # Stable SWAPI identity (homeworld URL) and a hash of the loaded fields
+        Column("url", Text, unique=True),
+        Column("content_hash", Text),
+
+        Column("climate", Text),
+        Column("terrain", Text),
+        # Measures are parsed at load time; "unknown"/"n/a" become NULL
+        Column("population", BigInteger),
+
+        Column("rotation_period", Integer),
+        Column("orbital_period", Integer),
+        Column("diameter", Integer),
+        # Free text such as "1 standard", kept as delivered
+        Column("gravity", Text),
+        Column("surface_water", Float),
+    )
+    Index(f"ix_{name}_name_lower", func.lower(table.c.name))
+    add_trigram_index(table)
+    return table
+
+
+def define_characters(metadata, name="characters", planets_name="planets"):
+    table = Table(
+        name,
+        metadata,
+        Column("id", Integer, primary_key=True, autoincrement=True),
+        # SWAPI uid, or "name:<name>" for characters only the new source knows
+        Column("uid", Text, unique=True),
+        Column("content_hash", Text),
+        Column("name", Text),
+        Column("height", Float),
+        Column("mass", Float),
+        Column("gender", Text),
+        # Era-relative strings such as "19BBY", kept as delivered
+        Column("birth_year", Text),
+        Column("planet_id", Integer, ForeignKey(f"{planets_name}.id")),
+    )
+    # Index names carry the table name so snapshot generations never collide
+    Index(f"ix_{name}_planet_id", table.c.planet_id)
+    Index(f"ix_{name}_name_lower", func.lower(table.c.name))
+    add_trigram_index(table)
+    return table
+
+
+planets = define_planets(metadata)
+characters = define_characters(metadata)
+
+
+# One row per load_data call
+load_runs = Table(
+    "load_runs",
     metadata,
     Column("id", Integer, primary_key=True, autoincrement=True),
-    Column("name", Text, unique=True),
-
-    Column("climate", Text),
-    Column("terrain", Text),
-    Column("population", Text),
+    Column("mode", Text),
+    Column("started_at", DateTime),
+    Column("finished_at", DateTime),
+    Column("inserted", Integer),
+    Column("updated", Integer),
+    Column("unchanged", Integer),
+    Column("deleted", Integer),
+)
 
-    Column("rotation_period", Text),
-    Column("orbital_period", Text),
-    Column("diameter", Text),
-    Column("gravity", Text),
-    Column("surface_water", Text),
+# Aggregates computed once per ETL run (precompute.py); body is the ready-to-send
+# JSON document, so a stats request is one primary-key read
+summary_stats = Table(
+    "summary_stats",
+    metadata,
+    Column("name", Text, primary_key=True),
+    Column("generation", Integer),
+    Column("computed_at", DateTime),
+    Column("body", Text),
 )
 
+# Cross-process ETL lock where there are no advisory locks (jobs.py): one
+# row per lock name, held by owner until expires_at unless it heartbeats
+job_locks = Table(
+    "job_locks",
+    metadata,
+    Column("name", Text, primary_key=True),
+    Column("owner", Text),
+    Column("acquired_at", DateTime),
+    Column("expires_at", DateTime),
+)
 
-characters = Table(
-    "characters",
+# One row per ETL run the job runner started (jobs.py)
+etl_runs = Table(
+    "etl_runs",
     metadata,
     Column("id", Integer, primary_key=True, autoincrement=True),
-    Column("name", Text),
-    Column("height", Text),
-    Column("mass", Text),
-    Column("gender", Text),
-    Column("birth_year", Text),
-    Column("planet_id", Integer, ForeignKey("planets.id")),
+    # host:pid of the process that held the lock
+    Column("owner", Text),
+    Column("pipeline", Text),
+    # running, succeeded or failed
+    Column("status", Text),
+    Column("started_at", DateTime),
+    Column("finished_at", DateTime),
+    Column("duration_s", Float),
+    # JSON object of stage name -> seconds, in the order the stages ran
+    Column("stages", Text),
+    Column("characters", Integer),
+    Column("planets", Integer),
+    Column("inserted", Integer),
+    Column("updated", Integer),
+    Column("unchanged", Integer),
+    Column("deleted", Integer),
+    # "<stage>: <exception>" for failed runs
+    Column("error", Text),
+    Column("next_interval_s", Float),
 )
 
-metadata.create_all(engine)
+# Tables whose rows are rebuilt from SWAPI on every run, so an outdated
+# layout can simply be dropped and recreated
+DERIVED_TABLES = [characters, planets]
+
+
+def python_type(sql_type):
+    try:
+        return sql_type.python_type
+    except NotImplementedError:
+        return None
+
+
+def is_stale(existing, table):
+    if not existing.has_table(table.name):
+        return False
+    reflected = {c["name"]: python_type(c["type"]) for c in existing.get_columns(table.name)}
+    declared = {c.name: python_type(c.type) for c in table.columns}
+    return reflected != declared
+
+
+def ensure_schema(db_engine, rebuild_stale=SCHEMA_REBUILD_STALE):
+    existing = inspect(db_engine)
+    stale = [table.name for table in DERIVED_TABLES if is_stale(existing, table)]
+    if stale and not rebuild_stale:
+        raise RuntimeError(
+            f"Outdated layout for {', '.join(stale)}: set SCHEMA_REBUILD_STALE=1 or run "
+            "`python init_db.py --rebuild` to drop and recreate them (the ETL reloads them)"
+        )
+    if stale:
+        setup_logger().warning(
+            f"Dropping {', '.join(t.name for t in DERIVED_TABLES)} to rebuild the "
+            f"outdated layout of {', '.join(stale)}; the next ETL run reloads them"
+        )
+        metadata.drop_all(db_engine, tables=DERIVED_TABLES)
+    metadata.create_all(db_engine)
+
+    # Tables created before search existed get their trigram index here
+    if db_engine.dialect.name == "postgresql":
+        with db_engine.begin() as conn:
+            for table in DERIVED_TABLES:
+                for ddl in trigram_ddl(table):
+                    conn.execute(ddl)
+
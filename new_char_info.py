@@ -1,29 +1,15 @@
-import pandas as pd
-from config import New_Republic_DB
-import requests
-def new_char_info(limit):
-    characters = []
-    url = New_Republic_DB
-    while url and len(characters) < limit:
-        response = requests.get(url)
-        response.raise_for_status()
-        data2 = response.json()
-        for item in data2:
-            if len(characters) >= limit:
-                break
-            character_dict2 = {
-                "name": item["name"],
-                "height": item["height"],
-                "mass": item["mass"],
-                "hair_color": item["hair_color"],
-                "skin_color": item["skin_color"],
-                "eye_color": item["eye_color"],
-                "birth_year": item["birth_year"],
-                "gender": item["gender"],
-                "homeworld" : item["homeworld"]
-            }
+import asyncio
 
-            characters.append(character_dict2)
-        
-        
-    return characters 
\ No newline at end of file
+from config import EXTRACT_CONCURRENCY
+from extract import extract_new_republic
+from http_client import AsyncHTTPClient
+
+
+async def _new_char_info(limit, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    async with AsyncHTTPClient() as client:
+        return await extract_new_republic(client, semaphore, limit)
+
+
+def new_char_info(limit, concurrency=EXTRACT_CONCURRENCY):
+    return asyncio.run(_new_char_info(limit, concurrency))
@@ -0,0 +1,215 @@
+import os
+import shutil
+
+import pandas as pd
+
+from config import OUTPUT_FORMATS, OUTPUT_PARTITION_BY_HOMEWORLD, PARQUET_COMPRESSION
+from load_to_db import NUMERIC_FIELDS, parse_measures
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:  # optional: without it run_etl falls back to CSV/JSON
+    pa = feather = pq = None
+
+FINAL_CSV_FILE = "star_wars_characters_complete.csv"
+FINAL_JSON_FILE = "star_wars_characters_complete.json"
+FINAL_PARQUET_PATH = "star_wars_characters_complete.parquet"
+FINAL_ARROW_FILE = "star_wars_characters_complete.arrow"
+
+PARTITION_COLUMN = "homeworld_name"
+COLUMNAR_FORMATS = {"parquet", "arrow"}
+
+
+def as_strings(series: pd.Series) -> pd.Series:
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # One take through the codes instead of converting row by row
+        values = pd.array(series.cat.categories, dtype="string")
+        codes = series.cat.codes.to_numpy()
+        return pd.Series(values.take(codes, allow_fill=True), index=series.index)
+    return series.astype("string")
+
+
+# Measures as nullable numbers and everything else as strings, so the
+# columnar files carry real types instead of what the APIs delivered
+def typed_frame(final_df: pd.DataFrame) -> pd.DataFrame:
+    df = parse_measures(final_df)
+    return df.assign(**{c: as_strings(df[c]) for c in df.columns if c not in NUMERIC_FIELDS})
+
+
+# Each output is written next to its final path and renamed over it, so
+# readers never see a half-written file
+def remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def temp_path(path):
+    tmp = f"{path}.tmp"
+    remove_path(tmp)
+    return tmp
+
+
+def move_into_place(tmp, path):
+    # A directory (partitioned dataset) can't be renamed over a file or vice versa
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.isdir(tmp) and os.path.exists(path):
+        os.remove(path)
+    os.replace(tmp, path)
+
+
+def replace_path(path, write):
+    tmp = temp_path(path)
+    write(tmp)
+    move_into_place(tmp, path)
+
+
+def write_parquet(df, path=FINAL_PARQUET_PATH, partitioned=OUTPUT_PARTITION_BY_HOMEWORLD):
+    options = {}
+    if partitioned:
+        # A directory of homeworld_name=<planet>/ files, one per homeworld
+        options = {
+            "partition_cols": [PARTITION_COLUMN],
+            "max_partitions": max(1024, df[PARTITION_COLUMN].nunique(dropna=False)),
+        }
+    replace_path(
+        path,
+        lambda tmp: df.to_parquet(
+            tmp, index=False, compression=PARQUET_COMPRESSION, **options
+        ),
+    )
+
+
+def write_arrow(df, path=FINAL_ARROW_FILE):
+    # Uncompressed Arrow IPC (Feather v2) so memory-mapped reads are zero-copy
+    replace_path(path, lambda tmp: feather.write_feather(df, tmp, compression="uncompressed"))
+
+
+def read_arrow(path=FINAL_ARROW_FILE):
+    return feather.read_table(path, memory_map=True)
+
+
+def usable_formats(formats):
+    formats = set(formats)
+    if pa is None and formats & COLUMNAR_FORMATS:
+        print("pyarrow is not installed; writing CSV/JSON instead of Parquet/Arrow")
+        formats = (formats - COLUMNAR_FORMATS) | {"csv", "json"}
+    return formats
+
+
+# =========================
+# CHUNKED WRITES
+# =========================
+# Appends one final_df chunk at a time to every output: Parquet row groups
+# (or per-chunk files in the partitioned dataset), Arrow IPC record batches,
+# CSV rows and JSON records. Nothing is visible until close() renames the
+# finished files into place; abort() discards them.
+class OutputWriter:
+    def __init__(self, formats=OUTPUT_FORMATS, partitioned=OUTPUT_PARTITION_BY_HOMEWORLD):
+        self.formats = usable_formats(formats)
+        self.partitioned = partitioned
+        self.paths = [
+            path
+            for fmt, path in (
+                ("parquet", FINAL_PARQUET_PATH),
+                ("arrow", FINAL_ARROW_FILE),
+                ("csv", FINAL_CSV_FILE),
+                ("json", FINAL_JSON_FILE),
+            )
+            if fmt in self.formats
+        ]
+        self.tmp = {path: temp_path(path) for path in self.paths}
+        self.schema = None
+        self.parquet = self.arrow = self.csv = self.json = None
+        self.chunks = 0
+
+    def write(self, final_df: pd.DataFrame):
+        if self.formats & COLUMNAR_FORMATS:
+            self.write_columnar(typed_frame(final_df))
+        if "csv" in self.formats:
+            self.write_csv(final_df)
+        if "json" in self.formats and len(final_df):
+            self.write_json(final_df)
+        self.chunks += 1
+        return final_df
+
+    def write_columnar(self, df):
+        if self.schema is None:
+            self.schema = pa.Schema.from_pandas(df, preserve_index=False)
+        table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+
+        if "parquet" in self.formats:
+            tmp = self.tmp[FINAL_PARQUET_PATH]
+            if self.partitioned:
+                pq.write_to_dataset(
+                    table,
+                    tmp,
+                    partition_cols=[PARTITION_COLUMN],
+                    basename_template=f"part-{self.chunks}-{{i}}.parquet",
+                    max_partitions=max(1024, df[PARTITION_COLUMN].nunique(dropna=False)),
+                    compression=PARQUET_COMPRESSION,
+                )
+            else:
+                if self.parquet is None:
+                    self.parquet = pq.ParquetWriter(
+                        tmp, self.schema, compression=PARQUET_COMPRESSION
+                    )
+                self.parquet.write_table(table)
+
+        if "arrow" in self.formats:
+            if self.arrow is None:
+                self.arrow = pa.ipc.new_file(self.tmp[FINAL_ARROW_FILE], self.schema)
+            self.arrow.write_table(table)
+
+    def write_csv(self, final_df):
+        if self.csv is None:
+            self.csv = open(self.tmp[FINAL_CSV_FILE], "w", newline="")
+            final_df.to_csv(self.csv, index=False)
+        else:
+            final_df.to_csv(self.csv, index=False, header=False)
+
+    # to_json gives "[\n  {...},\n  {...}\n]": the records of every chunk
+    # are joined into one array with the same layout
+    def write_json(self, final_df):
+        records = final_df.to_json(orient="records", indent=2)[1:-2]
+        if self.json is None:
+            self.json = open(self.tmp[FINAL_JSON_FILE], "w")
+            self.json.write("[")
+        else:
+            self.json.write(",")
+        self.json.write(records)
+
+    def finish(self):
+        for handle in (self.parquet, self.arrow, self.csv):
+            if handle is not None:
+                handle.close()
+        if "json" in self.formats:
+            if self.json is None:
+                self.json = open(self.tmp[FINAL_JSON_FILE], "w")
+                self.json.write("[]")
+            else:
+                self.json.write("\n]")
+            self.json.close()
+        self.parquet = self.arrow = self.csv = self.json = None
+
+    def close(self):
+        self.finish()
+        for path in self.paths:
+            if os.path.exists(self.tmp[path]):
+                move_into_place(self.tmp[path], path)
+        return self.paths
+
+    def abort(self):
+        self.finish()
+        for tmp in self.tmp.values():
+            remove_path(tmp)
+
+
+def write_outputs(final_df: pd.DataFrame, formats=OUTPUT_FORMATS):
+    writer = OutputWriter(formats)
+    writer.write(final_df)
+    return writer.close()
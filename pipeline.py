@@ -0,0 +1,238 @@
+import asyncio
+import json
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+
+import pandas as pd
+
+from config import ETL_LIMIT, PIPELINE_CHUNK_ROWS, PIPELINE_QUEUE_CHUNKS
+from extract import open_sources
+from fetch_homeworld import resolve_homeworlds
+from frames import FINAL_COLUMNS, NEW_COLUMNS, OLD_COLUMNS, STRING_DTYPE, add_planets, source_frame
+
+DONE = object()
+POLL_SECONDS = 0.1
+
+
+# =========================
+# NAME INDEX
+# =========================
+# Old republic characters by name for the join, kept in a throwaway SQLite
+# file rather than in memory: the one per-character structure the pipeline
+# needs costs the same RSS for eighty characters or eight million.
+class NameIndex:
+    def __init__(self):
+        self.dir = tempfile.TemporaryDirectory(prefix="etl-names-")
+        path = os.path.join(self.dir.name, "names.db")
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # Scratch data: nothing to recover after a crash
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute(
+            "CREATE TABLE old ("
+            " name TEXT UNIQUE,"
+            " uid TEXT,"
+            " url TEXT,"
+            " matched INTEGER NOT NULL DEFAULT 0)"
+        )
+
+    # The first character with a name wins, as drop_duplicates does
+    def add(self, page):
+        self.conn.execute("BEGIN")
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO old (name, uid, url) VALUES (?, ?, ?)",
+            [(c["name"], c["uid"], c["url"]) for c in page],
+        )
+        self.conn.execute("COMMIT")
+
+    # uid and url for each name (missing where only the new republic has
+    # it), marking the names as matched
+    def match(self, names: pd.Series) -> pd.DataFrame:
+        wanted = json.dumps(names.dropna().unique().tolist())
+        self.conn.execute("BEGIN")
+        rows = self.conn.execute(
+            "SELECT name, uid, url FROM old WHERE name IN (SELECT value FROM json_each(?))",
+            (wanted,),
+        ).fetchall()
+        self.conn.execute(
+            "UPDATE old SET matched = 1 WHERE name IN (SELECT value FROM json_each(?))",
+            (wanted,),
+        )
+        self.conn.execute("COMMIT")
+        found = pd.DataFrame(rows, columns=["name", "uid", "url"])
+        return found.set_index("name").reindex(names)
+
+    # Characters the new republic never delivered, in arrival order
+    def unmatched(self, chunk_rows):
+        cursor = self.conn.execute(
+            "SELECT uid, name, url FROM old WHERE matched = 0 ORDER BY rowid"
+        )
+        while rows := cursor.fetchmany(chunk_rows):
+            yield pd.DataFrame(rows, columns=OLD_COLUMNS).astype(STRING_DTYPE)
+
+    def close(self):
+        self.conn.close()
+        self.dir.cleanup()
+
+
+# =========================
+# STREAMING ETL
+# =========================
+# Three stages on their own threads, joined by bounded queues:
+#
+#   extract (asyncio: both sources paged concurrently)
+#     -> pages ->  enrich (name join, homeworld resolution, rebatching)
+#     -> chunks -> the consumer (outputs + load, on the caller's thread)
+#
+# A full queue blocks the stage feeding it, so a slow database holds back
+# enrichment and enrichment holds back the HTTP paging. At most
+# queue_chunks pages and queue_chunks chunks are ever waiting.
+#
+# The batch merge is an outer join on name. Here the old republic side
+# (uid, url per name) goes into a NameIndex first and new republic pages
+# are joined against it as they arrive; old-only characters follow at the
+# end.
+class Pipeline:
+    def __init__(
+        self,
+        limit,
+        planet_cache,
+        chunk_rows=PIPELINE_CHUNK_ROWS,
+        queue_chunks=PIPELINE_QUEUE_CHUNKS,
+        sources=open_sources,
+        resolve=resolve_homeworlds,
+    ):
+        self.limit = limit
+        self.planet_cache = planet_cache
+        self.chunk_rows = chunk_rows
+        self.sources = sources
+        self.resolve = resolve
+
+        self.pages = queue.Queue(queue_chunks)
+        self.chunks = queue.Queue(queue_chunks)
+        self.stop = threading.Event()
+        self.old_ready = threading.Event()
+        self.error = None
+        self.names = NameIndex()
+
+    # Blocks while the next stage is behind; gives up once the run stops
+    def put(self, q, item):
+        while not self.stop.is_set():
+            try:
+                q.put(item, timeout=POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q):
+        while True:
+            try:
+                return q.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                if self.stop.is_set():
+                    return DONE
+
+    def fail(self, exc):
+        if self.error is None:
+            self.error = exc
+        self.stop.set()
+
+    def stage(self, work, output):
+        try:
+            work()
+            self.put(output, DONE)
+        except BaseException as exc:
+            self.fail(exc)
+
+    # =========================
+    # EXTRACT
+    # =========================
+    def extract(self):
+        asyncio.run(self.extract_sources())
+
+    async def extract_sources(self):
+        async with self.sources(self.limit) as (old_pages, new_pages):
+            await asyncio.gather(self.index_old(old_pages), self.forward_new(new_pages))
+
+    async def index_old(self, pages):
+        async for page in pages:
+            if self.stop.is_set():
+                return
+            if page:
+                self.names.add(page)
+        self.old_ready.set()
+
+    async def forward_new(self, pages):
+        async for page in pages:
+            if page and not await asyncio.to_thread(self.put, self.pages, page):
+                return
+
+    # =========================
+    # ENRICH
+    # =========================
+    def enrich(self):
+        while not self.old_ready.wait(POLL_SECONDS):
+            if self.stop.is_set():
+                return
+
+        buffered, rows = [], 0
+        while (page := self.get(self.pages)) is not DONE:
+            buffered.append(page)
+            rows += len(page)
+            if rows >= self.chunk_rows:
+                if not self.put(self.chunks, self.join_chunk(buffered)):
+                    return
+                buffered, rows = [], 0
+        if self.stop.is_set():
+            return
+        if buffered and not self.put(self.chunks, self.join_chunk(buffered)):
+            return
+
+        # Characters only the old republic knows, as the outer merge keeps them
+        for old_only in self.names.unmatched(self.chunk_rows):
+            if not self.put(self.chunks, old_only.reindex(columns=FINAL_COLUMNS)):
+                return
+
+    def join_chunk(self, pages):
+        new_df = source_frame([character for page in pages for character in page], NEW_COLUMNS)
+        old = self.names.match(new_df["name"])
+        merged = new_df.assign(
+            uid=pd.array(old["uid"].to_numpy(), dtype=STRING_DTYPE),
+            url=pd.array(old["url"].to_numpy(), dtype=STRING_DTYPE),
+        )
+
+        # One lookup per distinct planet in the chunk; the cache carries
+        # planets across chunks
+        planet_df = self.resolve(merged["homeworld"], self.planet_cache)
+        return add_planets(merged, planet_df).reindex(columns=FINAL_COLUMNS)
+
+    # =========================
+    # CONSUMER
+    # =========================
+    def __iter__(self):
+        threads = [
+            threading.Thread(target=self.stage, args=(self.extract, self.pages), daemon=True),
+            threading.Thread(target=self.stage, args=(self.enrich, self.chunks), daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while (chunk := self.get(self.chunks)) is not DONE:
+                yield chunk
+            if self.error is not None:
+                raise self.error
+        finally:
+            # Also reached when the consumer fails or stops early
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+            self.names.close()
+
+
+# final_df chunks for the whole catalog (or `limit` characters per source)
+def stream_final(limit=ETL_LIMIT, planet_cache=None, **options):
+    return iter(Pipeline(limit, planet_cache, **options))
@@ -0,0 +1,220 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, delete, insert, func
+
+import queries
+from config import PIPELINE_CHUNK_ROWS
+from db import get_engine
+from generation import read_generation
+from load_to_db import planet_frame, character_frame
+from model import characters, planets, summary_stats
+from queries import CHARACTER_WITH_PLANET
+from stats import (
+    GROUP_DIMENSIONS,
+    HISTOGRAM_BINS,
+    MEASURES,
+    PERCENTILES,
+    PRECOMPUTED_GROUPS,
+    group_by_query,
+    group_name,
+    plain as plain_value,
+    sorted_groups,
+    stat_body,
+)
+
+# The /stats aggregates, computed once per ETL run (run_etl) and stored in
+# summary_stats. Kept apart from stats.py, which serves them, so the API
+# never imports pandas or the loader.
+
+
+# pandas' missing value as None, everything else as stats.plain has it
+def plain(value):
+    return None if value is pd.NA else plain_value(value)
+
+
+# Computed from the same parsed frames load_data writes, so the numbers
+# describe exactly the rows in the database
+def stats_frames(final_df: pd.DataFrame):
+    planet_df = planet_frame(final_df)
+    character_df = character_frame(final_df)
+    joined = character_df.merge(
+        planet_df.add_prefix("planet_"), left_on="homeworld", right_on="planet_url"
+    )
+    return planet_df, joined
+
+
+def group_by_frame(joined, by, agg, field=None):
+    # Only groups that occur, as GROUP BY returns them, for categorical keys too
+    grouped = joined.groupby(GROUP_DIMENSIONS[by][1], dropna=False, observed=True)
+    if agg == "count":
+        values = grouped.size()
+    else:
+        column = grouped[MEASURES[field][1]]
+        if agg == "sum":
+            values = column.sum(min_count=1)
+        else:
+            values = getattr(column, "mean" if agg == "avg" else agg)()
+    return sorted_groups((plain(k), plain(v)) for k, v in values.items())
+
+
+def distribution(values: pd.Series):
+    known = values.dropna().to_numpy(dtype="float64")
+    summary = {"count": len(known), "missing": int(values.isna().sum())}
+    if not len(known):
+        return summary
+
+    counts, edges = np.histogram(known, bins=HISTOGRAM_BINS)
+    percentiles = np.percentile(known, PERCENTILES)
+    summary.update(
+        mean=float(known.mean()),
+        std=float(known.std()),
+        min=float(known.min()),
+        max=float(known.max()),
+        percentiles={f"p{p}": float(v) for p, v in zip(PERCENTILES, percentiles)},
+        histogram=[
+            {"lower": float(lo), "upper": float(hi), "count": int(c)}
+            for lo, hi, c in zip(edges[:-1], edges[1:], counts)
+        ],
+    )
+    return summary
+
+
+# Planets list several climates ("temperate, tropical"); each counts once.
+# residents maps planet url to its character count.
+def by_climate(planet_df, residents):
+    planets_per = planet_df.assign(
+        climate=planet_df["climate"]
+        .astype("string")
+        .fillna("unknown")
+        .str.split(r",\s*", regex=True)
+    ).explode("climate")
+    planets_per["residents"] = planets_per["url"].map(residents).fillna(0)
+
+    grouped = planets_per.groupby("climate")
+    table = pd.DataFrame(
+        {
+            "planets": grouped.size(),
+            "residents": grouped["residents"].sum(),
+            "population": grouped["population"].sum(min_count=1),
+        }
+    )
+    return [
+        {"climate": c, **{k: plain(v) for k, v in row.items()}}
+        for c, row in table.sort_index().iterrows()
+    ]
+
+
+# planet_df: one row per planet (url, name, climate, population);
+# residents: url -> characters; measures: character height/mass values;
+# group_by(by, agg, field): the grouped aggregates
+def assemble_stats(planet_df, residents, measures, group_by) -> dict:
+    population = planet_df["population"]
+    counts = planet_df[["url", "name"]].assign(
+        residents=planet_df["url"].map(residents).fillna(0).astype(int)
+    )
+    counts = counts.sort_values(["residents", "name"], ascending=[False, True])
+
+    stats = {
+        "overview": {"characters": int(residents.sum()), "planets": len(planet_df)},
+        "population": {
+            "total": plain(population.sum()),
+            "mean": plain(population.astype("Float64").mean()),
+            "median": plain(population.astype("Float64").median()),
+            "known_planets": int(population.notna().sum()),
+            "unknown_planets": int(population.isna().sum()),
+        },
+        "residents": [
+            {"planet": name, "residents": int(count)}
+            for name, count in zip(counts["name"], counts["residents"])
+        ],
+        "gender": group_by("gender", "count", None),
+        "height": distribution(measures["height"]),
+        "mass": distribution(measures["mass"]),
+        "climate": by_climate(planet_df, residents),
+    }
+    for by, agg, field in PRECOMPUTED_GROUPS:
+        stats[group_name(by, agg, field)] = group_by(by, agg, field)
+    return stats
+
+
+def compute_stats(final_df: pd.DataFrame) -> dict:
+    planet_df, joined = stats_frames(final_df)
+    return assemble_stats(
+        planet_df,
+        joined.groupby("planet_url").size(),
+        joined,
+        lambda by, agg, field: group_by_frame(joined, by, agg, field),
+    )
+
+
+# The same statistics read back from the loaded tables, for the streaming
+# pipeline where no full frame exists: group-bys run in SQL and only the
+# planets and the two character measures are held in memory
+def column_values(conn, column, chunk_rows=PIPELINE_CHUNK_ROWS):
+    result = conn.execution_options(yield_per=chunk_rows).execute(select(column))
+    parts = [np.array(part, dtype="float64") for part in result.scalars().partitions()]
+    return pd.Series(np.concatenate(parts) if parts else np.array([], dtype="float64"))
+
+
+# conn may be the load's own connection, mid-transaction (load_data's
+# after_load), so the aggregates describe the rows about to be committed
+def stats_from_conn(conn) -> dict:
+    planet_df = pd.DataFrame(
+        conn.execute(
+            select(planets.c.url, planets.c.name, planets.c.climate, planets.c.population)
+        ).all(),
+        columns=["url", "name", "climate", "population"],
+    )
+    planet_df["population"] = planet_df["population"].astype("Int64")
+    residents = pd.Series(
+        dict(
+            conn.execute(
+                select(planets.c.url, func.count())
+                .select_from(CHARACTER_WITH_PLANET)
+                .group_by(planets.c.url)
+            ).all()
+        ),
+        dtype="int64",
+    )
+    measures = {
+        "height": column_values(conn, characters.c.height),
+        "mass": column_values(conn, characters.c.mass),
+    }
+
+    def group_by(by, agg, field):
+        query = group_by_query(by, agg, field if agg != "count" else None)
+        return sorted_groups((r.key, r.value) for r in query.execute(conn))
+
+    return assemble_stats(planet_df, residents, measures, group_by)
+
+
+def stats_from_db(db_engine=None) -> dict:
+    with (db_engine or queries.current_engine()).connect() as conn:
+        return stats_from_conn(conn)
+
+
+# Replaces the previous aggregates. Run inside load_data's transaction
+# (after_load) they commit together with the rows they describe, so no
+# reader sees the new generation with the previous run's documents.
+def store_stats(conn, stats: dict):
+    generation, _ = read_generation(conn)
+    computed_at = datetime.now(timezone.utc)
+    rows = [
+        {
+            "name": name,
+            "generation": generation,
+            "computed_at": computed_at,
+            "body": stat_body(name, generation, computed_at, value),
+        }
+        for name, value in stats.items()
+    ]
+    conn.execute(delete(summary_stats))
+    conn.execute(insert(summary_stats), rows)
+    return generation
+
+
+def save_stats(stats: dict, db_engine=None):
+    with (db_engine or get_engine()).begin() as conn:
+        return store_stats(conn, stats)
@@ -0,0 +1,573 @@
+import json
+from functools import lru_cache
+
+from sqlalchemy import select, bindparam, func, and_, or_, any_, Integer, Text
+from sqlalchemy.dialects.postgresql import ARRAY
+from config import BATCH_CHUNK_SIZE
+from db import get_read_engine
+from model import characters, planets
+import search_index
+from search_index import MATCH_MODES
+
+# The engine every query here runs on, db.get_read_engine() unless a test
+# points it at its own database
+engine = None
+
+
+def current_engine():
+    global engine
+    if engine is None:
+        engine = get_read_engine()
+    return engine
+
+
+CHARACTER_FIELDS = ["id", "name", "height", "mass", "gender", "birth_year"]
+PLANET_FIELDS = [
+    "name",
+    "climate",
+    "terrain",
+    "population",
+    "rotation_period",
+    "orbital_period",
+    "diameter",
+    "gravity",
+    "surface_water",
+]
+SORT_COLUMNS = {
+    "id": characters.c.id,
+    "name": characters.c.name,
+    "height": characters.c.height,
+    "mass": characters.c.mass,
+    "population": planets.c.population,
+}
+RANGE_FILTERS = {
+    "min_height": (characters.c.height, ">="),
+    "max_height": (characters.c.height, "<="),
+    "min_mass": (characters.c.mass, ">="),
+    "max_mass": (characters.c.mass, "<="),
+    "min_population": (planets.c.population, ">="),
+    "max_population": (planets.c.population, "<="),
+}
+
+
+# =========================
+# COMPILED QUERIES
+# =========================
+# Statements are built and compiled once per dialect, then run straight
+# through the DBAPI cursor with only the parameter values changing.
+class CompiledQuery:
+    def __init__(self, statement):
+        self.statement = statement
+        self._compiled = {}
+
+    def _compile(self, dialect):
+        compiled = self._compiled.get(dialect.name)
+        if compiled is None:
+            compiled = self.statement.compile(dialect=dialect)
+            self._compiled[dialect.name] = compiled
+        return compiled
+
+    def execute(self, conn, **params):
+        compiled = self._compile(conn.dialect)
+        values = compiled.construct_params(params)
+        if compiled.positiontup is not None:
+            values = tuple(values[name] for name in compiled.positiontup)
+        return conn.exec_driver_sql(compiled.string, values)
+
+
+def fetch_all(query, **params):
+    with current_engine().connect() as conn:
+        return query.execute(conn, **params).fetchall()
+
+
+def fetch_one(query, **params):
+    with current_engine().connect() as conn:
+        return query.execute(conn, **params).first()
+
+
+# =========================
+# SHAPES
+# =========================
+# Every endpoint builds its JSON from these, so the character and planet
+# shapes cannot drift apart. They take any mapping (row._mapping or dict).
+def character_shape(m, fields=CHARACTER_FIELDS, planet_fields=PLANET_FIELDS, prefix=""):
+    character = {f: m[f"{prefix}{f}"] for f in fields}
+    if planet_fields:
+        character["planet"] = {f: m[f"planet_{f}"] for f in planet_fields}
+    return character
+
+
+def planet_shape(m, prefix=""):
+    planet = {"id": m[f"{prefix}id"]}
+    planet.update((f, m[f"{prefix}{f}"]) for f in PLANET_FIELDS)
+    return planet
+
+
+def character_columns(fields=CHARACTER_FIELDS, prefix=""):
+    return [characters.c[f].label(f"{prefix}{f}") for f in fields]
+
+
+def planet_columns(fields=PLANET_FIELDS, prefix="planet_"):
+    return [planets.c[f].label(f"{prefix}{f}") for f in fields]
+
+
+CHARACTER_WITH_PLANET = characters.join(
+    planets, characters.c.planet_id == planets.c.id, isouter=True
+)
+
+
+# =========================
+# KEY LISTS
+# =========================
+# A list of keys travels as one parameter, = ANY(:array) on PostgreSQL and
+# json_each(:json) elsewhere, so statements filtering on it still compile once
+def native_arrays():
+    return current_engine().dialect.name == "postgresql"
+
+
+def in_key_list(column, param, key_type=Integer):
+    if native_arrays():
+        return column == any_(bindparam(param, type_=ARRAY(key_type)))
+    keys = func.json_each(bindparam(param)).table_valued("value")
+    return column.in_(select(keys.c.value))
+
+
+def key_list(keys):
+    keys = list(keys)
+    return keys if native_arrays() else json.dumps(keys)
+
+
+# =========================
+# NAME SEARCH
+# =========================
+# PostgreSQL matches names in SQL on the pg_trgm index; elsewhere the
+# in-process n-gram index (search_index.py) finds the ids for a key list.
+def trigram_search():
+    return current_engine().dialect.name == "postgresql"
+
+
+def escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def name_condition(table, match):
+    if not trigram_search():
+        return in_key_list(table.c.id, "name_ids")
+    lowered = func.lower(table.c.name)
+    if match == "fuzzy":
+        return and_(
+            lowered.bool_op("%")(bindparam("name")),
+            func.similarity(lowered, bindparam("name")) >= bindparam("min_similarity"),
+        )
+    return lowered.like(bindparam("name_pattern"), escape="\\")
+
+
+def name_order(table):
+    # Fuzzy matches are ranked; without pg_trgm, ranked() orders them after the fetch
+    if trigram_search():
+        return [func.similarity(func.lower(table.c.name), bindparam("name")).desc(), table.c.id]
+    return [table.c.id]
+
+
+def name_params(table_name, name, match):
+    if match not in MATCH_MODES:
+        raise ValueError(f"Unknown match mode: {match}")
+    needle = name.lower()
+    if trigram_search():
+        if match == "fuzzy":
+            return {"name": needle, "min_similarity": search_index.FUZZY_MIN_SIMILARITY}
+        pattern = escape_like(needle)
+        return {"name_pattern": f"{pattern}%" if match == "prefix" else f"%{pattern}%"}
+
+    index = search_index.index_for(table_name, current_engine())
+    if match == "fuzzy":
+        keys = index.search(needle, "fuzzy")
+    else:
+        keys = index.matching_keys(needle, match)
+    return {"name_ids": key_list(keys.tolist())}
+
+
+def ranked(rows, params):
+    if "name_ids" not in params:
+        return rows
+    ids = params["name_ids"]
+    position = {key: i for i, key in enumerate(json.loads(ids) if isinstance(ids, str) else ids)}
+    return sorted(rows, key=lambda row: position[row._mapping["id"]])
+
+
+# =========================
+# CHARACTERS
+# =========================
+CHARACTER_BY_ID = CompiledQuery(
+    select(*character_columns(), *planet_columns())
+    .select_from(CHARACTER_WITH_PLANET)
+    .where(characters.c.id == bindparam("character_id"))
+)
+
+CHARACTER_BY_NAME = CompiledQuery(
+    select(*character_columns(), *planet_columns())
+    .select_from(CHARACTER_WITH_PLANET)
+    .where(func.lower(characters.c.name) == bindparam("name"))
+    .order_by(characters.c.id)
+)
+
+
+def character_by_id(character_id):
+    row = fetch_one(CHARACTER_BY_ID, character_id=character_id)
+    return character_shape(row._mapping) if row else None
+
+
+def character_by_name(name):
+    row = fetch_one(CHARACTER_BY_NAME, name=name.lower())
+    return character_shape(row._mapping) if row else None
+
+
+def keyset_condition(column, descending, cursor_is_null):
+    # Keyset over (column, id) with NULLs sorted last in either direction
+    after_id = characters.c.id > bindparam("cursor_id")
+    if cursor_is_null:
+        return and_(column.is_(None), after_id)
+    value = bindparam("cursor_value")
+    beyond = column < value if descending else column > value
+    return or_(beyond, and_(column == value, after_id), column.is_(None))
+
+
+@lru_cache(maxsize=256)
+def character_list_query(
+    character_fields, planet_fields, sort_key, descending, filters, page_mode, limited=True
+):
+    sort_column = SORT_COLUMNS[sort_key]
+
+    conditions = []
+    for match in MATCH_MODES:
+        if f"name_{match}" in filters:
+            conditions.append(name_condition(characters, match))
+    if "planet" in filters:
+        conditions.append(planets.c.name.ilike(bindparam("planet_pattern")))
+    for key in filters:
+        if key in RANGE_FILTERS:
+            column, op = RANGE_FILTERS[key]
+            param = bindparam(key)
+            conditions.append(column >= param if op == ">=" else column <= param)
+
+    if page_mode == "after_id":
+        after = bindparam("after_id")
+        conditions.append(characters.c.id < after if descending else characters.c.id > after)
+    elif page_mode in ("cursor", "cursor_null"):
+        conditions.append(
+            keyset_condition(sort_column, descending, page_mode == "cursor_null")
+        )
+
+    # Only join planets when the response, a filter or the sort needs them
+    needs_planets = bool(
+        planet_fields
+        or sort_column.table is planets
+        or any(k in RANGE_FILTERS and RANGE_FILTERS[k][0].table is planets for k in filters)
+        or "planet" in filters
+    )
+
+    order = sort_column.desc() if descending else sort_column.asc()
+    # id is never NULL; plain ORDER BY id lets the primary key drive the scan
+    order_by = [order] if sort_key == "id" else [order.nulls_last(), characters.c.id]
+    if "name_fuzzy" in filters:
+        order_by = name_order(characters)
+    statement = (
+        select(
+            *character_columns(character_fields),
+            *planet_columns(planet_fields),
+            sort_column.label("sort_value"),
+        )
+        .select_from(CHARACTER_WITH_PLANET if needs_planets else characters)
+        .where(*conditions)
+        .order_by(*order_by)
+    )
+    if limited:
+        statement = statement.limit(bindparam("limit"))
+    return CompiledQuery(statement)
+
+
+def parse_sort(sort):
+    descending = sort.startswith("-")
+    sort_key = sort.lstrip("-")
+    if sort_key not in SORT_COLUMNS:
+        raise ValueError(f"Cannot sort by: {sort_key}")
+    return sort_key, descending
+
+
+def character_filters(name, match, planet, ranges):
+    params = {}
+    filters = []
+    if name:
+        filters.append(f"name_{match}")
+        params.update(name_params("characters", name, match))
+    if planet:
+        filters.append("planet")
+        params["planet_pattern"] = f"%{planet}%"
+    for key, value in ranges.items():
+        if value is not None:
+            filters.append(key)
+            params[key] = value
+    return tuple(sorted(filters)), params
+
+
+def list_characters(
+    character_fields=CHARACTER_FIELDS,
+    planet_fields=PLANET_FIELDS,
+    sort="id",
+    name=None,
+    planet=None,
+    after_id=None,
+    cursor=None,
+    limit=100,
+    match="substring",
+    include=None,
+    **ranges,
+):
+    sort_key, descending = parse_sort(sort)
+    if include not in (None, "planet"):
+        raise ValueError(f"Cannot include: {include}")
+    if include:
+        # Planets come from their own query below instead of the join
+        character_fields, planet_fields = (*character_fields, "planet_id"), ()
+    fuzzy = bool(name) and match == "fuzzy"
+    if fuzzy and (sort != "id" or cursor is not None or after_id is not None):
+        raise ValueError("match=fuzzy is ranked by similarity; sort and paging do not apply")
+
+    filters, params = character_filters(name, match, planet, ranges)
+    params["limit"] = limit
+
+    page_mode = None
+    if cursor is not None:
+        value, params["cursor_id"] = cursor
+        page_mode = "cursor_null" if value is None else "cursor"
+        if value is not None:
+            params["cursor_value"] = value
+    elif after_id is not None:
+        if sort_key != "id":
+            raise ValueError("after_id requires sort=id; use cursor")
+        page_mode = "after_id"
+        params["after_id"] = after_id
+
+    query = character_list_query(
+        tuple(character_fields),
+        tuple(planet_fields),
+        sort_key,
+        descending,
+        filters,
+        page_mode,
+    )
+    if fuzzy and "name_ids" in params:
+        # Every candidate is fetched so the ranking, not id order, picks the page
+        params["limit"] = max(limit, search_index.SEARCH_MAX_CANDIDATES)
+        rows = ranked(fetch_all(query, **params), params)[:limit]
+    else:
+        rows = fetch_all(query, **params)
+
+    items = [character_shape(row._mapping, character_fields, planet_fields) for row in rows]
+    if include:
+        items = with_planets(items)
+    next_cursor = None
+    if len(rows) == limit and not fuzzy:
+        last = rows[-1]._mapping
+        next_cursor = (last["sort_value"], last["id"])
+    return items, next_cursor
+
+
+def with_planets(items):
+    planet_ids = list(dict.fromkeys(i["planet_id"] for i in items if i["planet_id"] is not None))
+    found = dict(zip(planet_ids, planets_by_ids(planet_ids)))
+    for item in items:
+        item["planet"] = found.get(item.pop("planet_id"))
+    return items
+
+
+# Unpaged statement and parameters for streaming every matching row
+def character_export_query(
+    character_fields=CHARACTER_FIELDS,
+    planet_fields=PLANET_FIELDS,
+    sort="id",
+    name=None,
+    planet=None,
+    match="substring",
+    **ranges,
+):
+    if name and match == "fuzzy":
+        raise ValueError("match=fuzzy is ranked and capped; exports take substring or prefix")
+    sort_key, descending = parse_sort(sort)
+    filters, params = character_filters(name, match, planet, ranges)
+    query = character_list_query(
+        tuple(character_fields), tuple(planet_fields), sort_key, descending, filters, None, False
+    )
+    return query, params
+
+
+# =========================
+# PLANETS
+# =========================
+PLANET_COLUMNS = [planets.c.id, *planet_columns(prefix="")]
+
+@lru_cache(maxsize=16)
+def planet_list_query(match=None, after=False, limited=False):
+    conditions = []
+    if match:
+        conditions.append(name_condition(planets, match))
+    if after:
+        conditions.append(planets.c.id > bindparam("after_id"))
+    order_by = name_order(planets) if match == "fuzzy" else [planets.c.id]
+
+    statement = select(*PLANET_COLUMNS).where(*conditions).order_by(*order_by)
+    if limited:
+        statement = statement.limit(bindparam("limit"))
+    return CompiledQuery(statement)
+
+
+PLANET_BY_ID = CompiledQuery(
+    select(*PLANET_COLUMNS).where(planets.c.id == bindparam("planet_id"))
+)
+
+PLANET_BY_NAME = CompiledQuery(
+    select(*PLANET_COLUMNS)
+    .where(func.lower(planets.c.name) == bindparam("name"))
+    .order_by(planets.c.id)
+)
+
+
+@lru_cache(maxsize=1)
+def residents_query():
+    return CompiledQuery(
+        select(
+            *character_columns(prefix="character_"),
+            characters.c.planet_id.label("character_planet_id"),
+        )
+        .where(in_key_list(characters.c.planet_id, "planet_ids"))
+        .order_by(characters.c.id)
+    )
+
+
+def list_planets(name=None, match="substring", include=None, after_id=None, limit=None):
+    if include not in (None, "characters"):
+        raise ValueError(f"Cannot include: {include}")
+    fuzzy = bool(name) and match == "fuzzy"
+    if fuzzy and after_id is not None:
+        raise ValueError("match=fuzzy is ranked by similarity; paging does not apply")
+
+    params = name_params("planets", name, match) if name else {}
+    if after_id is not None:
+        params["after_id"] = after_id
+    if limit is not None:
+        params["limit"] = limit
+    query = planet_list_query(match if name else None, after_id is not None, limit is not None)
+
+    if fuzzy and "name_ids" in params:
+        if limit is not None:
+            params["limit"] = max(limit, search_index.SEARCH_MAX_CANDIDATES)
+        rows = ranked(fetch_all(query, **params), params)[:limit]
+    else:
+        rows = fetch_all(query, **params)
+
+    items = [planet_shape(row._mapping) for row in rows]
+    if include == "characters":
+        items = with_residents(items)
+    return items
+
+
+def planet_export_query(name=None, match="substring"):
+    if not name:
+        return planet_list_query(), {}
+    if match == "fuzzy":
+        raise ValueError("match=fuzzy is ranked and capped; exports take substring or prefix")
+    return planet_list_query(match), name_params("planets", name, match)
+
+
+def planet_by_id(planet_id):
+    row = fetch_one(PLANET_BY_ID, planet_id=planet_id)
+    return planet_shape(row._mapping) if row else None
+
+
+def planet_by_name(name):
+    row = fetch_one(PLANET_BY_NAME, name=name.lower())
+    return planet_shape(row._mapping) if row else None
+
+
+def group_residents(planets_found, rows):
+    # Rows of character_* columns ordered by character id; each planet gets
+    # its residents in that order
+    by_id = {}
+    for planet in planets_found:
+        planet["characters"] = []
+        by_id[planet["id"]] = planet
+    for row in rows:
+        m = row._mapping
+        by_id[m["character_planet_id"]]["characters"].append(
+            character_shape(m, planet_fields=(), prefix="character_")
+        )
+    return planets_found
+
+
+# Parents and children in two set-based queries, however many planets
+def with_residents(planets_found):
+    planet_ids = key_list(p["id"] for p in planets_found)
+    rows = fetch_all(residents_query(), planet_ids=planet_ids) if planets_found else []
+    return group_residents(planets_found, rows)
+
+
+def planet_with_characters(name):
+    planet = planet_by_name(name)
+    return with_residents([planet])[0] if planet else None
+
+
+# =========================
+# BATCH LOOKUPS
+# =========================
+# Many ids or exact names answered by one key-list query per chunk. Results
+# follow the request order with None for keys that matched nothing; a name
+# shared by several rows resolves to the lowest id, like *_by_name.
+@lru_cache(maxsize=4)
+def batch_query(kind, by):
+    if kind == "characters":
+        table, columns = CHARACTER_WITH_PLANET, [*character_columns(), *planet_columns()]
+        key_table = characters
+    else:
+        table, columns, key_table = planets, PLANET_COLUMNS, planets
+    if by == "id":
+        condition = in_key_list(key_table.c.id, "keys")
+    else:
+        condition = in_key_list(func.lower(key_table.c.name), "keys", Text)
+    return CompiledQuery(
+        select(*columns)
+        .select_from(table)
+        .where(condition)
+        .order_by(key_table.c.id)
+    )
+
+
+def batch_lookup(kind, by, keys):
+    keys = [k.lower() for k in keys] if by == "name" else list(keys)
+    unique = list(dict.fromkeys(keys))
+    query = batch_query(kind, by)
+    shape = character_shape if kind == "characters" else planet_shape
+
+    found = {}
+    with current_engine().connect() as conn:
+        for start in range(0, len(unique), BATCH_CHUNK_SIZE):
+            chunk = unique[start : start + BATCH_CHUNK_SIZE]
+            for row in query.execute(conn, keys=key_list(chunk)):
+                m = row._mapping
+                found.setdefault(m["id"] if by == "id" else m["name"].lower(), shape(m))
+    return [found.get(k) for k in keys]
+
+
+def characters_by_ids(ids):
+    return batch_lookup("characters", "id", ids)
+
+
+def characters_by_names(names):
+    return batch_lookup("characters", "name", names)
+
+
+def planets_by_ids(ids):
+    return batch_lookup("planets", "id", ids)
+
+
+def planets_by_names(names):
+    return batch_lookup("planets", "name", names)
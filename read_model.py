@@ -0,0 +1,379 @@
+import sys
+import threading
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+from sqlalchemy import select
+
+from db import get_read_engine
+from model import characters, planets
+from search_index import MATCH_MODES, NgramIndex
+from queries import (
+    CHARACTER_FIELDS,
+    PLANET_FIELDS,
+    SORT_COLUMNS,
+    character_shape,
+    planet_shape,
+)
+
+INT_PLANET_FIELDS = {"population", "rotation_period", "orbital_period", "diameter"}
+FLOAT_PLANET_FIELDS = {"surface_water"}
+TEXT_PLANET_FIELDS = set(PLANET_FIELDS) - INT_PLANET_FIELDS - FLOAT_PLANET_FIELDS
+RANGE_COLUMNS = {
+    "min_height": ("height", ">="),
+    "max_height": ("height", "<="),
+    "min_mass": ("mass", ">="),
+    "max_mass": ("mass", "<="),
+    "min_population": ("population", ">="),
+    "max_population": ("population", "<="),
+}
+
+
+def intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def number(values):
+    return np.array([np.nan if v is None else v for v in values], dtype="float64")
+
+
+def scalar(value, as_int=False):
+    if value != value:  # NaN marks NULL
+        return None
+    return int(value) if as_int else float(value)
+
+
+# Immutable, array-backed snapshot of characters and planets. A new one is
+# built per data generation and swapped in with a single assignment.
+class ReadModel:
+    def __init__(self, character_rows, planet_rows, generation=None):
+        self.generation = generation
+
+        # Planets: columns indexed by planet row number
+        self.planet_ids = np.array([r.id for r in planet_rows], dtype="int64")
+        self.planet_text = {
+            f: [intern(getattr(r, f)) for r in planet_rows] for f in TEXT_PLANET_FIELDS
+        }
+        self.planet_numbers = {
+            f: number([getattr(r, f) for r in planet_rows])
+            for f in INT_PLANET_FIELDS | FLOAT_PLANET_FIELDS
+        }
+        self.planet_row_by_id = {int(pid): i for i, pid in enumerate(self.planet_ids)}
+        self.planet_row_by_name = {}
+        for i, name in enumerate(self.planet_text["name"]):
+            if name is not None:
+                self.planet_row_by_name.setdefault(name.lower(), i)
+
+        # Characters, ordered by id; planet foreign keys become row numbers
+        character_rows = sorted(character_rows, key=lambda r: r.id)
+        self.ids = np.array([r.id for r in character_rows], dtype="int64")
+        self.names = [intern(r.name) for r in character_rows]
+        self.names_lower = [n.lower() if n else "" for n in self.names]
+        self.genders = [intern(r.gender) for r in character_rows]
+        self.birth_years = [intern(r.birth_year) for r in character_rows]
+        self.height = number([r.height for r in character_rows])
+        self.mass = number([r.mass for r in character_rows])
+        self.planet_row = np.array(
+            [self.planet_row_by_id.get(r.planet_id, -1) for r in character_rows],
+            dtype="int32",
+        )
+
+        self.row_by_id = {int(cid): i for i, cid in enumerate(self.ids)}
+        self.row_by_name = {}
+        for i, name in enumerate(self.names_lower):
+            self.row_by_name.setdefault(name, i)
+
+        # planet row -> character rows (already in id order)
+        self.residents = [[] for _ in range(len(self.planet_ids))]
+        for i, p in enumerate(self.planet_row):
+            if p >= 0:
+                self.residents[p].append(i)
+
+        population = self.planet_numbers["population"]
+        if len(population):
+            self.population = np.where(self.planet_row >= 0, population[self.planet_row], np.nan)
+        else:
+            self.population = np.full(len(self.ids), np.nan)
+
+        # Name sort works on ranks into the sorted distinct names
+        self.sorted_names = sorted({n for n in self.names if n is not None})
+        self.name_rank = np.array(
+            [bisect_left(self.sorted_names, n) if n is not None else np.nan for n in self.names],
+            dtype="float64",
+        )
+
+        # Name search indexes are built on first use (see name_index)
+        self._name_indexes = {}
+        self._index_lock = threading.Lock()
+
+        # Precomputed orders (NULLs last, id as tie-breaker) for every sort key
+        self.orders = {}
+        for key in SORT_COLUMNS:
+            values = self.sort_values(key)
+            nulls = np.isnan(values)
+            self.orders[(key, False)] = np.lexsort((self.ids, values, nulls))
+            self.orders[(key, True)] = np.lexsort((self.ids, -values, nulls))
+
+    @classmethod
+    def load(cls, db_engine=None, generation=None):
+        with (db_engine or get_read_engine()).connect() as conn:
+            character_rows = conn.execute(
+                select(
+                    characters.c.id,
+                    *(characters.c[f] for f in CHARACTER_FIELDS if f != "id"),
+                    characters.c.planet_id,
+                )
+            ).fetchall()
+            planet_rows = conn.execute(
+                select(planets.c.id, *(planets.c[f] for f in PLANET_FIELDS))
+            ).fetchall()
+        return cls(character_rows, planet_rows, generation)
+
+    # Keys are row numbers, so matches index straight into the columns
+    def name_index(self, kind):
+        index = self._name_indexes.get(kind)
+        if index is None:
+            with self._index_lock:
+                index = self._name_indexes.get(kind)
+                if index is None:
+                    names = self.names if kind == "characters" else self.planet_text["name"]
+                    index = NgramIndex(np.arange(len(names)), names)
+                    self._name_indexes[kind] = index
+        return index
+
+    def search_rows(self, kind, name, match):
+        if match not in MATCH_MODES:
+            raise ValueError(f"Unknown match mode: {match}")
+        index = self.name_index(kind)
+        if match == "fuzzy":
+            return index.search(name, "fuzzy")
+        return index.matching_keys(name, match)
+
+    def sort_values(self, key):
+        if key == "id":
+            return self.ids.astype("float64")
+        if key == "name":
+            return self.name_rank
+        if key == "population":
+            return self.population
+        return getattr(self, key)
+
+    # =========================
+    # SHAPES
+    # =========================
+    def character_row(self, i):
+        return {
+            "id": int(self.ids[i]),
+            "name": self.names[i],
+            "height": scalar(self.height[i]),
+            "mass": scalar(self.mass[i]),
+            "gender": self.genders[i],
+            "birth_year": self.birth_years[i],
+        }
+
+    def planet_row_mapping(self, p, prefix=""):
+        m = {f"{prefix}id": int(self.planet_ids[p]) if p >= 0 else None}
+        for f in PLANET_FIELDS:
+            if p < 0:
+                value = None
+            elif f in TEXT_PLANET_FIELDS:
+                value = self.planet_text[f][p]
+            else:
+                value = scalar(self.planet_numbers[f][p], as_int=f in INT_PLANET_FIELDS)
+            m[f"{prefix}{f}"] = value
+        return m
+
+    def character(self, i, fields=CHARACTER_FIELDS, planet_fields=PLANET_FIELDS):
+        m = self.character_row(i)
+        if planet_fields:
+            m.update(self.planet_row_mapping(int(self.planet_row[i]), prefix="planet_"))
+        return character_shape(m, fields, planet_fields)
+
+    def character_with_planet(self, i, fields=CHARACTER_FIELDS):
+        character = self.character(i, fields, planet_fields=())
+        p = int(self.planet_row[i])
+        character["planet"] = self.planet(p) if p >= 0 else None
+        return character
+
+    def planet_with_residents(self, p):
+        planet = self.planet(p)
+        planet["characters"] = [
+            character_shape(self.character_row(i), planet_fields=()) for i in self.residents[p]
+        ]
+        return planet
+
+    # =========================
+    # CHARACTERS
+    # =========================
+    def character_by_id(self, character_id):
+        i = self.row_by_id.get(character_id)
+        return self.character(i) if i is not None else None
+
+    def character_by_name(self, name):
+        i = self.row_by_name.get(name.lower())
+        return self.character(i) if i is not None else None
+
+    def keyset_mask(self, sort_key, descending, cursor):
+        value, cursor_id = cursor
+        values = self.sort_values(sort_key)
+        after_id = self.ids > cursor_id
+        nulls = np.isnan(values)
+        if value is None:
+            return nulls & after_id
+
+        if sort_key == "name":
+            lo = bisect_left(self.sorted_names, value)
+            hi = bisect_right(self.sorted_names, value)
+            equal = (values >= lo) & (values < hi)
+            beyond = values < lo if descending else values >= hi
+        else:
+            equal = values == value
+            beyond = values < value if descending else values > value
+        return beyond | (equal & after_id) | nulls
+
+    def list_characters(
+        self,
+        character_fields=CHARACTER_FIELDS,
+        planet_fields=PLANET_FIELDS,
+        sort="id",
+        name=None,
+        planet=None,
+        after_id=None,
+        cursor=None,
+        limit=100,
+        match="substring",
+        include=None,
+        **ranges,
+    ):
+        descending = sort.startswith("-")
+        sort_key = sort.lstrip("-")
+        if sort_key not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by: {sort_key}")
+        if include not in (None, "planet"):
+            raise ValueError(f"Cannot include: {include}")
+        fuzzy = bool(name) and match == "fuzzy"
+        if fuzzy and (sort != "id" or cursor is not None or after_id is not None):
+            raise ValueError("match=fuzzy is ranked by similarity; sort and paging do not apply")
+
+        mask = np.ones(len(self.ids), dtype=bool)
+        matches = None
+        if name:
+            matches = self.search_rows("characters", name, match)
+            found = np.zeros(len(self.ids), dtype=bool)
+            found[matches] = True
+            mask &= found
+        if planet:
+            needle = planet.lower()
+            matching = [
+                p for p, n in enumerate(self.planet_text["name"]) if n and needle in n.lower()
+            ]
+            mask &= np.isin(self.planet_row, matching)
+        for key, value in ranges.items():
+            if value is None:
+                continue
+            column, op = RANGE_COLUMNS[key]
+            values = self.population if column == "population" else getattr(self, column)
+            mask &= values >= value if op == ">=" else values <= value
+
+        if cursor is not None:
+            mask &= self.keyset_mask(sort_key, descending, cursor)
+        elif after_id is not None:
+            if sort_key != "id":
+                raise ValueError("after_id requires sort=id; use cursor")
+            mask &= self.ids < after_id if descending else self.ids > after_id
+
+        # Fuzzy matches come back ranked; everything else follows the sort
+        order = matches if fuzzy else self.orders[(sort_key, descending)]
+        rows = order[mask[order]][:limit]
+
+        if include:
+            items = [self.character_with_planet(i, character_fields) for i in rows]
+        else:
+            items = [self.character(i, character_fields, planet_fields) for i in rows]
+        next_cursor = None
+        if len(rows) == limit and not fuzzy:
+            last = rows[-1]
+            if sort_key == "name":
+                value = self.names[last]
+            elif sort_key == "id":
+                value = int(self.ids[last])
+            else:
+                value = scalar(self.sort_values(sort_key)[last])
+            next_cursor = (value, int(self.ids[last]))
+        return items, next_cursor
+
+    # =========================
+    # PLANETS
+    # =========================
+    def planet(self, p):
+        return planet_shape(self.planet_row_mapping(p))
+
+    def list_planets(self, name=None, match="substring", include=None, after_id=None, limit=None):
+        if include not in (None, "characters"):
+            raise ValueError(f"Cannot include: {include}")
+        shape = self.planet_with_residents if include else self.planet
+
+        if name and match == "fuzzy":
+            if after_id is not None:
+                raise ValueError("match=fuzzy is ranked by similarity; paging does not apply")
+            rows = self.search_rows("planets", name, match)
+        else:
+            rows = range(len(self.planet_ids))
+            if name:
+                rows = self.search_rows("planets", name, match)
+            if after_id is not None:
+                rows = [p for p in rows if self.planet_ids[p] > after_id]
+            rows = sorted(rows, key=lambda p: self.planet_ids[p])
+        return [shape(int(p)) for p in rows[:limit]]
+
+    def planet_by_id(self, planet_id):
+        p = self.planet_row_by_id.get(planet_id)
+        return self.planet(p) if p is not None else None
+
+    def planet_by_name(self, name):
+        p = self.planet_row_by_name.get(name.lower())
+        return self.planet(p) if p is not None else None
+
+    def planet_with_characters(self, name):
+        p = self.planet_row_by_name.get(name.lower())
+        return self.planet_with_residents(p) if p is not None else None
+
+    # =========================
+    # BATCH LOOKUPS
+    # =========================
+    def characters_by_ids(self, ids):
+        return [self.character_by_id(i) for i in ids]
+
+    def characters_by_names(self, names):
+        return [self.character_by_name(n) for n in names]
+
+    def planets_by_ids(self, ids):
+        return [self.planet_by_id(i) for i in ids]
+
+    def planets_by_names(self, names):
+        return [self.planet_by_name(n) for n in names]
+
+
+# =========================
+# CURRENT MODEL
+# =========================
+_current = None
+_refresh_lock = threading.Lock()
+
+
+def current():
+    return _current
+
+
+def refresh(generation=None, db_engine=None):
+    global _current
+    with _refresh_lock:
+        if _current is not None and generation is not None and _current.generation == generation:
+            return _current
+        model = ReadModel.load(db_engine, generation)
+        _current = model  # atomic swap; readers keep whichever model they hold
+        return model
+
+
+def refresh_in_background(generation):
+    threading.Thread(target=refresh, args=(generation,), daemon=True).start()
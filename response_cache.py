@@ -0,0 +1,135 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from config import (
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_MAX_BYTES,
+    HTTP_CACHE_MAX_AGE,
+    HTTP_CACHE_S_MAXAGE,
+)
+
+
+# Size- and byte-bounded LRU of encoded responses for one data generation.
+# Seeing a newer generation drops everything at once.
+class ResponseCache:
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, max_bytes=RESPONSE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.generation = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(path, query_params, encoding="identity"):
+        return path, tuple(sorted(query_params)), encoding
+
+    def _sync(self, generation):
+        if generation != self.generation:
+            self._entries.clear()
+            self.bytes = 0
+            self.generation = generation
+
+    def get(self, key, generation):
+        with self._lock:
+            self._sync(generation)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, generation, status, headers, body):
+        size = len(body)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._sync(generation)
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old[2])
+
+            self._entries[key] = (status, headers, body)
+            self.bytes += size
+
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "generation": self.generation,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# =========================
+# CONDITIONAL REQUESTS
+# =========================
+# A response is fully determined by (generation, path, query), so that
+# triple makes a strong ETag that can be checked without the database.
+def make_etag(key, generation):
+    digest = hashlib.blake2b(repr((generation, key)).encode(), digest_size=12)
+    return f'"{digest.hexdigest()}"'
+
+
+def http_date(dt):
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return format_datetime(dt.astimezone(timezone.utc), usegmt=True)
+
+
+def validator_headers(key, generation, loaded_at):
+    headers = {
+        "ETag": make_etag(key, generation),
+        "Cache-Control": (
+            f"public, max-age={HTTP_CACHE_MAX_AGE}, "
+            f"s-maxage={HTTP_CACHE_S_MAXAGE}, must-revalidate"
+        ),
+    }
+    if loaded_at is not None:
+        headers["Last-Modified"] = http_date(loaded_at)
+    return headers
+
+
+# exists: whether a current representation is known to exist. Until then
+# only an ETag we handed out (with a 200, for this key and generation) can
+# answer 304; "*" and If-Modified-Since must not turn a 404 into a 304.
+def not_modified(request_headers, validators, exists=True):
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return validators["ETag"] in tags or (exists and "*" in tags)
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if exists and if_modified_since and "Last-Modified" in validators:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return parsedate_to_datetime(validators["Last-Modified"]) <= since
+    return False
@@ -0,0 +1,198 @@
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+import numpy as np
+from sqlalchemy import select
+
+from config import FUZZY_MIN_SIMILARITY, SEARCH_MAX_CANDIDATES
+from db import get_read_engine
+from generation import current_generation
+from model import characters, planets
+
+MATCH_MODES = ("substring", "prefix", "fuzzy")
+
+
+def normalize(name):
+    return (name or "").lower()
+
+
+def trigrams(text):
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+# Padded like pg_trgm, so short names and word starts/ends still get grams
+def padded_trigrams(text):
+    return trigrams(f"  {text} ")
+
+
+# =========================
+# N-GRAM INDEX
+# =========================
+# Trigram postings over lower-cased names. Postings are sorted numpy arrays
+# of document numbers (positions in the keys/names passed in), so lookups
+# are a handful of array intersections instead of a scan over every name.
+class NgramIndex:
+    def __init__(self, keys, names):
+        self.keys = np.asarray(keys, dtype="int64")
+        self.names = [normalize(n) for n in names]
+
+        postings = defaultdict(list)
+        for doc, name in enumerate(self.names):
+            for gram in padded_trigrams(name):
+                postings[gram].append(doc)
+        self.postings = {g: np.array(docs, dtype="int32") for g, docs in postings.items()}
+        self.gram_counts = np.array(
+            [len(padded_trigrams(n)) for n in self.names], dtype="int32"
+        )
+        self.lengths = np.array([len(n) for n in self.names], dtype="int32")
+
+        order = sorted(range(len(self.names)), key=self.names.__getitem__)
+        self.sorted_names = [self.names[i] for i in order]
+        self.sorted_docs = np.array(order, dtype="int32")
+
+    def __len__(self):
+        return len(self.names)
+
+    def scan(self, needle):
+        found = (needle in n for n in self.names)
+        return np.flatnonzero(np.fromiter(found, bool, len(self.names))).astype("int32")
+
+    def substring(self, query):
+        needle = normalize(query)
+        grams = trigrams(needle)
+        if not grams:
+            # Under three characters there is nothing to intersect
+            return self.scan(needle)
+
+        if any(g not in self.postings for g in grams):
+            return np.empty(0, dtype="int32")
+        lists = sorted((self.postings[g] for g in grams), key=len)
+
+        # Intersect from the rarest gram; once few candidates remain,
+        # checking them directly is cheaper than more intersections
+        docs = lists[0]
+        for postings in lists[1:]:
+            if len(docs) <= 32:
+                break
+            docs = np.intersect1d(docs, postings, assume_unique=True)
+        # Grams don't encode order, so every candidate is verified
+        return np.array([d for d in docs if needle in self.names[d]], dtype="int32")
+
+    def prefix(self, query):
+        needle = normalize(query)
+        lo = bisect_left(self.sorted_names, needle)
+        hi = bisect_left(self.sorted_names, needle + "\uffff")
+        return np.sort(self.sorted_docs[lo:hi])
+
+    def fuzzy(self, query, min_similarity=FUZZY_MIN_SIMILARITY):
+        grams = padded_trigrams(normalize(query))
+        lists = [self.postings[g] for g in grams if g in self.postings]
+        if not lists:
+            return np.empty(0, dtype="int32"), np.empty(0)
+
+        # One counting pass over the query's postings gives every name's
+        # shared gram count; similarity >= s needs at least ceil(s * |q|)
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.names))
+        docs = np.flatnonzero(shared >= max(1, np.ceil(min_similarity * len(grams))))
+        shared = shared[docs]
+
+        score = shared / (len(grams) + self.gram_counts[docs] - shared)
+        keep = score >= min_similarity
+        return docs[keep], score[keep]
+
+    # Ranked keys: exact, then prefix, then substring matches (shorter names
+    # first), or trigram similarity for fuzzy; capped at `limit`
+    def search(self, query, match="substring", limit=SEARCH_MAX_CANDIDATES):
+        if match not in MATCH_MODES:
+            raise ValueError(f"Unknown match mode: {match}")
+
+        needle = normalize(query)
+        if match == "fuzzy":
+            docs, score = self.fuzzy(needle)
+            order = np.lexsort((self.keys[docs], self.lengths[docs], -score))
+            return self.keys[docs[order[:limit]]]
+
+        prefixed = self.prefix(needle)
+        docs = prefixed if match == "prefix" else self.substring(needle)
+        lengths = self.lengths[docs]
+        # Every hit contains the needle, so equal length means an exact match
+        exact = lengths == len(needle)
+        starts = np.isin(docs, prefixed, assume_unique=True)
+        order = np.lexsort((self.keys[docs], lengths, ~starts, ~exact))
+        return self.keys[docs[order[:limit]]]
+
+    # Substring/prefix keys in key order, for callers that sort on their own
+    def matching_keys(self, query, match="substring"):
+        docs = self.prefix(query) if match == "prefix" else self.substring(query)
+        return np.sort(self.keys[docs])
+
+
+# =========================
+# PER-GENERATION INDEXES
+# =========================
+# SQL backends without pg_trgm search through an index of (id, name) built
+# once per data generation. Only the very first search of a table waits for
+# a build. After that a new generation is indexed in a background thread
+# (api.py starts it when a load commits, a search starts it when it sees
+# the generation first) and searches keep using the previous index until
+# the new one is swapped in: names loaded since are missed for that long,
+# and ids since deleted simply find no row.
+SEARCH_TABLES = {"characters": characters, "planets": planets}
+_indexes = {}
+_building = set()
+_lock = threading.Lock()
+_first_build_lock = threading.Lock()
+
+
+def build(table_name, db_engine):
+    table = SEARCH_TABLES[table_name]
+    with db_engine.connect() as conn:
+        rows = conn.execute(select(table.c.id, table.c.name)).fetchall()
+    return NgramIndex([r.id for r in rows], [r.name for r in rows])
+
+
+def index_for(table_name, db_engine=None):
+    db_engine = db_engine or get_read_engine()
+    generation, _ = current_generation(db_engine)
+    key = (table_name, db_engine.url)
+    built = _indexes.get(key)
+    if built is None:
+        with _first_build_lock:
+            built = _indexes.get(key)
+            if built is None:
+                built = _indexes[key] = (generation, build(table_name, db_engine))
+    elif built[0] != generation:
+        build_in_background(table_name, db_engine, generation)
+    return built[1]
+
+
+# The thread, or None when a build of this table is already running. The
+# generation is read before the rows, so the index is at least that new.
+def build_in_background(table_name, db_engine, generation):
+    key = (table_name, db_engine.url)
+    with _lock:
+        if key in _building:
+            return None
+        _building.add(key)
+
+    def run():
+        try:
+            index = build(table_name, db_engine)
+            with _lock:
+                built = _indexes.get(key)
+                if built is None or built[0] < generation:
+                    _indexes[key] = (generation, index)
+        finally:
+            with _lock:
+                _building.discard(key)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+# on_generation_change listener (api.py)
+def rebuild_in_background(generation, db_engine=None):
+    db_engine = db_engine or get_read_engine()
+    return [build_in_background(name, db_engine, generation) for name in SEARCH_TABLES]
@@ -0,0 +1,66 @@
+import gzip
+import json
+import zlib
+
+from fastapi import Response
+
+from config import COMPRESS_MIN_BYTES
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode()
+
+
+# Returned directly from endpoints, so FastAPI skips jsonable_encoder and
+# response validation and the bytes go out as encoded here
+class JSONBytesResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def negotiate_encoding(accept_encoding, allow_br=True):
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        token, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(token.strip().lower())
+
+    if allow_br and brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return "identity"
+
+
+def compress(body: bytes, encoding):
+    if encoding == "identity" or len(body) < COMPRESS_MIN_BYTES:
+        return body, "identity"
+    if encoding == "br":
+        return brotli.compress(body, quality=5), "br"
+    return gzip.compress(body, compresslevel=5), "gzip"
+
+
+# Incremental gzip for streamed bodies: each chunk goes out as soon as the
+# compressor emits it, so memory stays at one chunk
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(5, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
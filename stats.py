@@ -0,0 +1,144 @@
+import json
+from datetime import datetime, timezone
+from functools import lru_cache
+
+import numpy as np
+from sqlalchemy import select, bindparam, func
+
+import queries
+from generation import current_generation
+from model import characters, planets, summary_stats
+from queries import CHARACTER_WITH_PLANET, CompiledQuery, fetch_all, fetch_one
+
+# Ad-hoc group-by over characters joined to their planets. Keys are the
+# public names; the frame columns mirror the SQL columns for precomputing.
+GROUP_DIMENSIONS = {
+    "gender": (characters.c.gender, "gender"),
+    "planet": (planets.c.name, "planet_name"),
+    "climate": (planets.c.climate, "planet_climate"),
+    "terrain": (planets.c.terrain, "planet_terrain"),
+}
+MEASURES = {
+    "height": (characters.c.height, "height"),
+    "mass": (characters.c.mass, "mass"),
+    "population": (planets.c.population, "planet_population"),
+}
+AGGREGATES = {
+    "count": func.count,
+    "sum": func.sum,
+    "avg": func.avg,
+    "min": func.min,
+    "max": func.max,
+}
+
+# Group-bys stored by every ETL run; anything else runs in SQL on request
+PRECOMPUTED_GROUPS = [
+    ("gender", "count", None),
+    ("gender", "avg", "height"),
+    ("gender", "avg", "mass"),
+    ("planet", "count", None),
+    ("climate", "count", None),
+    ("terrain", "count", None),
+]
+PERCENTILES = [10, 25, 50, 75, 90]
+HISTOGRAM_BINS = 10
+
+
+def plain(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return float(value)
+    return value
+
+
+def group_name(by, agg, field=None):
+    return f"group_by.{by}.{agg}" + (f".{field}" if field else "")
+
+
+def check_group(by, agg, field):
+    if by not in GROUP_DIMENSIONS:
+        raise ValueError(f"Cannot group by: {by}")
+    if agg not in AGGREGATES:
+        raise ValueError(f"Unknown aggregate: {agg}")
+    if agg != "count" and field not in MEASURES:
+        raise ValueError(f"{agg} needs a field: {', '.join(MEASURES)}")
+
+
+# NULL keys last, the same on every backend
+def sorted_groups(pairs):
+    groups = [{"key": plain(k), "value": plain(v)} for k, v in pairs]
+    return sorted(groups, key=lambda g: (g["key"] is None, g["key"] or ""))
+
+
+def stat_body(name, generation, computed_at, value, precomputed=True):
+    return json.dumps(
+        {
+            "name": name,
+            "generation": generation,
+            "computed_at": computed_at.isoformat() if computed_at else None,
+            "precomputed": precomputed,
+            "value": value,
+        },
+        separators=(",", ":"),
+    )
+
+
+# =========================
+# READS (api.py)
+# =========================
+STAT_BY_NAME = CompiledQuery(
+    select(summary_stats.c.body).where(summary_stats.c.name == bindparam("name"))
+)
+
+STAT_NAMES = CompiledQuery(
+    select(
+        summary_stats.c.name, summary_stats.c.generation, summary_stats.c.computed_at
+    ).order_by(summary_stats.c.name)
+)
+
+
+# The stored JSON document, sent as-is
+def stat(name):
+    row = fetch_one(STAT_BY_NAME, name=name)
+    return row.body.encode() if row else None
+
+
+def list_stats():
+    return [
+        {"name": r.name, "generation": r.generation, "computed_at": r.computed_at}
+        for r in fetch_all(STAT_NAMES)
+    ]
+
+
+@lru_cache(maxsize=64)
+def group_by_query(by, agg, field):
+    dimension = GROUP_DIMENSIONS[by][0]
+    value = func.count() if agg == "count" else AGGREGATES[agg](MEASURES[field][0])
+    return CompiledQuery(
+        select(dimension.label("key"), value.label("value"))
+        .select_from(CHARACTER_WITH_PLANET)
+        .group_by(dimension)
+    )
+
+
+def group_by_sql(by, agg, field=None):
+    rows = fetch_all(group_by_query(by, agg, field if agg != "count" else None))
+    return sorted_groups((r.key, r.value) for r in rows)
+
+
+# Precomputed when the ETL stored it, otherwise one GROUP BY in SQL
+def group_by(by, agg="count", field=None):
+    check_group(by, agg, field)
+    if agg == "count":
+        field = None
+    name = group_name(by, agg, field)
+    body = stat(name)
+    if body is not None:
+        return body
+
+    generation, _ = current_generation(queries.current_engine())
+    value = group_by_sql(by, agg, field)
+    return stat_body(name, generation, datetime.now(timezone.utc), value, False).encode()
@@ -1,15 +1,31 @@
 import pytest
 from fastapi.testclient import TestClient
 
-from api import app
+from api import app, response_cache
+from benchmarks.bench_import import probe
+from generation import current_generation, bump_generation
 
 client = TestClient(app)
 
+
+# Entering the client runs the app's lifespan, which creates the schema
+@pytest.fixture(scope="module", autouse=True)
+def started():
+    with client:
+        yield
+
 def test_app_starts():
     response = client.get("/docs")
     assert response.status_code == 200
 
 
+def test_importing_the_api_loads_no_etl_and_touches_no_database():
+    _, etl_modules, stdout, created, _ = probe("api")
+    assert etl_modules == []
+    assert stdout == ""
+    assert not [name for name in created if name.endswith(".db")]
+
+
 
 # CHARACTERS
 
@@ -29,6 +45,57 @@ def test_get_characters():
         assert isinstance(character["planet"], dict)
 
 
+def test_get_characters_keyset_pagination():
+    first = client.get("/characters", params={"limit": 2})
+    assert first.status_code == 200
+    assert len(first.json()) <= 2
+
+    cursor = first.headers.get("X-Next-Cursor")
+    if not cursor:
+        pytest.skip("Not enough characters to paginate")
+
+    second = client.get("/characters", params={"limit": 2, "cursor": cursor})
+    assert second.status_code == 200
+
+    first_ids = {c["id"] for c in first.json()}
+    assert all(c["id"] > max(first_ids) for c in second.json())
+
+
+def test_get_characters_field_projection_and_filters():
+    response = client.get(
+        "/characters", params={"fields": "name,height", "min_height": 150, "sort": "-height"}
+    )
+    assert response.status_code == 200
+
+    data = response.json()
+    for character in data:
+        assert set(character) == {"id", "name", "height"}
+        assert character["height"] is None or character["height"] >= 150
+
+    heights = [c["height"] for c in data if c["height"] is not None]
+    assert heights == sorted(heights, reverse=True)
+
+
+def test_get_characters_name_search():
+    substring = client.get("/characters", params={"name": "SKYWALKER"})
+    assert substring.status_code == 200
+    assert all("skywalker" in c["name"].lower() for c in substring.json())
+
+    prefix = client.get("/characters", params={"name": "luke", "match": "prefix"})
+    assert all(c["name"].lower().startswith("luke") for c in prefix.json())
+
+    fuzzy = client.get("/characters", params={"name": "Luke Skywlaker", "match": "fuzzy"})
+    assert fuzzy.status_code == 200
+    if substring.json():
+        assert fuzzy.json()[0]["name"] == "Luke Skywalker"
+
+    assert client.get("/characters", params={"name": "x", "match": "regex"}).status_code == 422
+
+
+def test_get_characters_rejects_unknown_sort():
+    assert client.get("/characters", params={"sort": "hair_color"}).status_code == 400
+
+
 def test_get_character_by_id():
     response = client.get("/characters/1")
 
@@ -48,6 +115,28 @@ def test_get_character_not_found():
     assert response.status_code == 404
 
 
+def test_characters_batch_keeps_request_order():
+    ids = [3, 999999, 1, 3]
+    response = client.post("/characters/batch", json={"ids": ids})
+    assert response.status_code == 200
+
+    results = response.json()
+    assert [r["key"] for r in results] == ids
+    assert results[1] == {"key": 999999, "found": False, "data": None}
+    for result in results:
+        if result["found"]:
+            assert result["data"] == client.get(f"/characters/{result['key']}").json()
+
+    by_name = client.post("/characters/batch", json={"names": ["LUKE SKYWALKER", "nobody"]})
+    assert [r["found"] for r in by_name.json()][1] is False
+
+
+def test_batch_rejects_bad_requests():
+    assert client.post("/characters/batch", json={}).status_code == 400
+    assert client.post("/planets/batch", json={"ids": [1], "names": ["x"]}).status_code == 400
+    assert client.post("/planets/batch", json={"ids": list(range(5000))}).status_code == 422
+
+
 
 # PLANETS
 
@@ -64,6 +153,52 @@ def test_get_planets():
         assert "population" in planet
 
 
+def test_get_planets_include_characters_pages_parents():
+    first = client.get("/planets", params={"include": "characters", "limit": 2})
+    assert first.status_code == 200
+    planets = first.json()
+    assert len(planets) <= 2
+    for planet in planets:
+        nested = client.get(f"/planets/name/{planet['name']}/characters").json()
+        assert planet["characters"] == nested["characters"]
+
+    cursor = first.headers.get("X-Next-Cursor")
+    if cursor:
+        second = client.get("/planets", params={"include": "characters", "limit": 2, "cursor": cursor})
+        assert all(p["id"] > planets[-1]["id"] for p in second.json())
+
+
+def test_get_characters_include_planet():
+    response = client.get("/characters", params={"include": "planet", "limit": 5})
+    assert response.status_code == 200
+    for character in response.json():
+        if character["planet"] is not None:
+            assert character["planet"] == client.get(f"/planets/id/{character['planet']['id']}").json()
+
+    assert client.get("/characters", params={"include": "films"}).status_code == 422
+
+
+def test_get_planets_name_search():
+    for match in ("substring", "prefix", "fuzzy"):
+        response = client.get("/planets", params={"name": "tatooine", "match": match})
+        assert response.status_code == 200
+        assert all(p["name"] == "Tatooine" for p in response.json()[:1])
+
+    exact = client.get("/planets", params={"name": "Tatooine"}).json()
+    typo = client.get("/planets", params={"name": "Tatoine", "match": "fuzzy"}).json()
+    assert [p["name"] for p in typo[:1]] == [p["name"] for p in exact[:1]]
+
+
+def test_planets_batch_by_name():
+    response = client.post("/planets/batch", json={"names": ["tatooine", "Nowhere"]})
+    assert response.status_code == 200
+
+    tatooine, nowhere = response.json()
+    assert nowhere["found"] is False
+    if tatooine["found"]:
+        assert tatooine["data"] == client.get("/planets/name/Tatooine").json()
+
+
 def test_get_planet_by_id():
     response = client.get("/planets/id/1")
 
@@ -108,3 +243,74 @@ def test_get_planet_with_characters():
         character = data["characters"][0]
         assert "name" in character
         assert "gender" in character
+
+
+
+# RESPONSE CACHE
+
+def test_repeated_reads_are_served_from_cache():
+    first = client.get("/planets")
+    second = client.get("/planets")
+
+    assert second.status_code == 200
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.content == first.content
+
+    stats = client.get("/cache/stats").json()
+    assert stats["hits"] >= 1
+    assert stats["bytes"] > 0
+
+
+def test_new_generation_invalidates_cache():
+    client.get("/planets")
+
+    generation, loaded_at = current_generation()
+    bump_generation(generation + 1, loaded_at)
+    try:
+        response = client.get("/planets")
+        assert response.headers["X-Cache"] == "MISS"
+        assert response_cache.stats()["generation"] == generation + 1
+    finally:
+        bump_generation(generation, loaded_at)
+
+
+
+# CONDITIONAL REQUESTS
+
+def test_etag_revalidation_returns_304():
+    first = client.get("/characters")
+    etag = first.headers["ETag"]
+    assert "Cache-Control" in first.headers
+
+    response = client.get("/characters", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+    other = client.get("/characters", params={"limit": 1}, headers={"If-None-Match": etag})
+    assert other.status_code == 200
+
+
+# "*" and If-Modified-Since only match a resource that exists
+def test_wildcard_revalidation_of_a_missing_resource_is_404():
+    for headers in (
+        {"If-None-Match": "*"},
+        {"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"},
+    ):
+        assert client.get("/characters/999999", headers=headers).status_code == 404
+        assert client.get("/planets/name/Nowhere", headers=headers).status_code == 404
+        # Cached or not, an existing one still answers 304
+        assert client.get("/characters/1", headers=headers).status_code == 304
+        assert client.get("/characters/1", headers=headers).status_code == 304
+
+
+def test_large_responses_are_gzip_encoded():
+    response = client.get("/characters", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+
+    if len(response.content) < 1024:
+        pytest.skip("Response too small to be compressed")
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert isinstance(response.json(), list)
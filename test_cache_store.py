@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from cache_store import CacheStore, SQLiteCacheStore, MemoryCacheStore, open_cache_store
+
+
+def test_sqlite_store_persists_batched_writes(tmp_path):
+    path = tmp_path / "cache.db"
+    store = SQLiteCacheStore(str(path), flush_every=10)
+    store.set("a", {"homeworld_name": "Tatooine"})
+
+    assert store.get("a") == {"homeworld_name": "Tatooine"}
+    store.close()
+
+    reopened = SQLiteCacheStore(str(path))
+    assert reopened.get("a") == {"homeworld_name": "Tatooine"}
+    assert reopened.get("b") is None
+    assert reopened.stats()["hits"] == 1
+    assert reopened.stats()["misses"] == 1
+    reopened.close()
+
+
+def test_ttl_expires_entries(tmp_path):
+    store = SQLiteCacheStore(str(tmp_path / "cache.db"))
+    store.set("a", {"x": 1}, ttl=-1)
+    assert "a" not in store
+    store.close()
+
+
+def test_lru_bound_evicts_oldest():
+    store = MemoryCacheStore(max_entries=2)
+    store.set("a", 1)
+    store.set("b", 2)
+    store.get("a")
+    store.set("c", 3)
+
+    assert "b" not in store
+    assert store.get("a") == 1
+    assert store.get("c") == 3
+
+
+def test_migrates_legacy_json_once(tmp_path):
+    legacy = tmp_path / "homeworld_cache.json"
+    legacy.write_text(json.dumps({"url1": {"homeworld_name": "Naboo"}}))
+
+    store = open_cache_store(str(tmp_path / "cache.db"), backend="sqlite", legacy_json=str(legacy))
+    assert store.get("url1") == {"homeworld_name": "Naboo"}
+    assert store.migrate_json(str(legacy)) == 0
+    store.close()
+
+
+def test_base_store_cannot_be_instantiated():
+    with pytest.raises(TypeError):
+        CacheStore()
@@ -0,0 +1,46 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from db import sqlite_engine
+from model import ensure_schema
+
+
+def test_sqlite_readers_see_the_last_commit_while_a_load_writes(tmp_path):
+    path = tmp_path / "tuned.db"
+    writer = sqlite_engine(path)
+    with writer.begin() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        conn.execute(text("CREATE TABLE t (x INTEGER)"))
+        conn.execute(text("INSERT INTO t VALUES (1)"))
+
+    reader = sqlite_engine(path, readonly=True)
+    with writer.begin() as write:
+        write.execute(text("INSERT INTO t VALUES (2)"))
+        # Not blocked, and not seeing the uncommitted row
+        with reader.connect() as read:
+            assert read.execute(text("SELECT count(*) FROM t")).scalar() == 1
+            assert read.execute(text("PRAGMA busy_timeout")).scalar() > 0
+
+    with reader.connect() as read:
+        assert read.execute(text("SELECT count(*) FROM t")).scalar() == 2
+        with pytest.raises(OperationalError, match="readonly"):
+            read.execute(text("INSERT INTO t VALUES (3)"))
+
+
+def test_outdated_tables_are_only_dropped_on_request(tmp_path, caplog):
+    engine = sqlite_engine(str(tmp_path / "old.db"))
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE planets (id INTEGER PRIMARY KEY, name TEXT)"))
+        conn.execute(text("INSERT INTO planets VALUES (1, 'Tatooine')"))
+
+    with pytest.raises(RuntimeError, match="SCHEMA_REBUILD_STALE"):
+        ensure_schema(engine, rebuild_stale=False)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT name FROM planets")).scalar() == "Tatooine"
+
+    ensure_schema(engine, rebuild_stale=True)
+    assert "Dropping characters, planets" in caplog.text
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM planets")).scalar() == 0
@@ -0,0 +1,91 @@
+import csv
+import io
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import export
+import queries
+from api import app
+from benchmarks.synthetic import make_final_df
+
+client = TestClient(app)
+
+
+@pytest.fixture(scope="module")
+def sources(served_module):
+    served_module(make_final_df(250, n_planets=12))
+    return queries
+
+
+def every_page(sql, **params):
+    items, cursor = sql.list_characters(limit=1000, **params)
+    assert cursor is None
+    return items
+
+
+def test_ndjson_export_matches_list(sources):
+    params = {"sort": "-height", "min_mass": 50, "name": "character 1"}
+    body = b"".join(export.export_characters("ndjson", ["id", "name", "height"], [], **params))
+    rows = [json.loads(line) for line in body.splitlines()]
+    assert rows == every_page(sources, character_fields=["id", "name", "height"], planet_fields=[], **params)
+
+
+def test_export_streams_in_chunks(sources):
+    query, params = sources.character_export_query()
+    chunks = list(export.stream_chunks(query, params, chunk_rows=40))
+    assert [len(c) for c in chunks] == [40] * 6 + [10]
+
+
+def test_csv_export_is_flat(sources):
+    body = b"".join(export.export_characters("csv", ["id", "name"], ["name", "population"]))
+    rows = list(csv.DictReader(io.StringIO(body.decode())))
+    assert list(rows[0]) == ["id", "name", "planet_name", "planet_population"]
+    assert len(rows) == 250
+
+
+def test_planet_export_filters_by_name(sources):
+    body = b"".join(export.export_planets("ndjson", "planet 1", "prefix"))
+    rows = [json.loads(line) for line in body.splitlines()]
+    assert rows == sources.list_planets("planet 1", "prefix")
+
+
+def test_fuzzy_export_is_rejected(sources):
+    with pytest.raises(ValueError):
+        export.export_characters("ndjson", ["id"], [], name="charcter", match="fuzzy")
+
+
+def test_parquet_export_round_trips(sources):
+    pq = pytest.importorskip("pyarrow.parquet")
+    body = b"".join(export.export_characters("parquet", ["id", "name", "mass"], ["population"]))
+    table = pq.read_table(io.BytesIO(body))
+    assert table.column_names == ["id", "name", "mass", "planet_population"]
+    assert table.num_rows == 250
+
+
+def test_export_endpoint_streams_gzip():
+    response = client.get(
+        "/export/characters",
+        params={"format": "csv", "fields": "name"},
+        headers={"Accept-Encoding": "gzip"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.headers["content-disposition"] == 'attachment; filename="characters.csv"'
+    # httpx already decoded the gzip body
+    assert response.text.splitlines()[0] == "id,name"
+
+
+def test_export_endpoint_ndjson_planets():
+    response = client.get("/export/planets", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    planets = [json.loads(line) for line in response.text.splitlines()]
+    assert planets == client.get("/planets").json()
+
+
+def test_export_endpoint_rejects_bad_requests():
+    assert client.get("/export/characters", params={"format": "xml"}).status_code == 422
+    assert client.get("/export/characters", params={"sort": "eye_color"}).status_code == 400
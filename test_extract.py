@@ -0,0 +1,88 @@
+import asyncio
+
+import httpx
+
+from config import Old_Republic_DB, New_Republic_DB
+from extract import extract_all
+from http_client import AsyncHTTPClient
+
+
+def make_transport(total_records, new_people):
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        url = str(request.url.copy_with(query=None))
+
+        if url == Old_Republic_DB:
+            page = int(request.url.params["page"])
+            limit = int(request.url.params["limit"])
+            start = (page - 1) * limit
+            uids = range(start + 1, min(start + limit, total_records) + 1)
+            return httpx.Response(
+                200,
+                json={
+                    "total_records": total_records,
+                    "next": None,
+                    "results": [
+                        {"uid": str(u), "name": f"Person {u}", "url": f"{url}/{u}"}
+                        for u in uids
+                    ],
+                },
+            )
+
+        if url == New_Republic_DB:
+            return httpx.Response(200, json=new_people)
+
+        return httpx.Response(404)
+
+    return httpx.MockTransport(handler), calls
+
+
+def new_person(n):
+    return {
+        "name": f"Person {n}",
+        "height": "172",
+        "mass": "77",
+        "hair_color": "blond",
+        "skin_color": "fair",
+        "eye_color": "blue",
+        "birth_year": "19BBY",
+        "gender": "male",
+        "homeworld": "https://swapi.info/api/planets/1",
+    }
+
+
+def test_extract_all_fans_out_pages_and_stops_at_limit():
+    transport, calls = make_transport(
+        total_records=25, new_people=[new_person(n) for n in range(1, 40)]
+    )
+
+    async def run():
+        async with AsyncHTTPClient(transport=transport) as client:
+            return await extract_all(22, concurrency=4, client=client)
+
+    old, new = asyncio.run(run())
+
+    assert [c["uid"] for c in old] == [str(u) for u in range(1, 23)]
+    assert len(new) == 22
+    assert new[0]["homeworld"] == "https://swapi.info/api/planets/1"
+
+    # 3 pages from the old source + 1 list from the new one, no re-fetching
+    assert len(calls) == 4
+
+
+def test_extract_without_limit_takes_whole_catalog():
+    transport, calls = make_transport(
+        total_records=95, new_people=[new_person(n) for n in range(1, 90)]
+    )
+
+    async def run():
+        async with AsyncHTTPClient(transport=transport) as client:
+            return await extract_all(None, concurrency=4, client=client)
+
+    old, new = asyncio.run(run())
+
+    assert [c["uid"] for c in old] == [str(u) for u in range(1, 96)]
+    assert len(new) == 89
+    assert len(calls) == 10 + 1
@@ -0,0 +1,71 @@
+import pandas as pd
+
+import fetch_homeworld
+from cache_store import MemoryCacheStore
+from fetch_homeworld import resolve_homeworlds, PLANET_COLUMNS
+
+
+def planet(name):
+    return {col: None for col in PLANET_COLUMNS} | {"homeworld_name": name}
+
+
+def test_resolve_homeworlds_fetches_each_distinct_miss_once(monkeypatch):
+    fetched = []
+
+    def fake_fetch_planets(urls):
+        fetched.extend(urls)
+        return {url: planet(url.rsplit("/", 1)[-1]) for url in urls}
+
+    monkeypatch.setattr(fetch_homeworld, "fetch_planets", fake_fetch_planets)
+
+    cache = MemoryCacheStore()
+    cache.set("https://swapi.info/api/planets/1", planet("Tatooine"))
+
+    homeworlds = pd.Series(
+        [
+            "https://swapi.info/api/planets/1",
+            "https://swapi.info/api/planets/8",
+            "https://swapi.info/api/planets/8",
+            None,
+        ]
+    )
+    planet_df = resolve_homeworlds(homeworlds, cache, bulk_threshold=100)
+
+    assert fetched == ["https://swapi.info/api/planets/8"]
+    assert planet_df.loc["https://swapi.info/api/planets/1", "homeworld_name"] == "Tatooine"
+
+    merged = pd.DataFrame({"homeworld": homeworlds}).merge(
+        planet_df, left_on="homeworld", right_index=True, how="left"
+    )
+    assert merged["homeworld_name"].tolist()[:3] == ["Tatooine", "8", "8"]
+    assert pd.isna(merged["homeworld_name"].iloc[3])
+
+
+def test_resolve_homeworlds_switches_to_bulk_listing(monkeypatch):
+    monkeypatch.setattr(
+        fetch_homeworld,
+        "fetch_all_planets",
+        lambda: {f"https://swapi.info/api/planets/{n}": planet(str(n)) for n in range(1, 61)},
+    )
+    monkeypatch.setattr(fetch_homeworld, "fetch_planets", lambda urls: {})
+
+    urls = [f"https://swapi.info/api/planets/{n}" for n in range(1, 20)]
+    planet_df = resolve_homeworlds(pd.Series(urls), MemoryCacheStore(), bulk_threshold=5)
+
+    assert len(planet_df) == 19
+
+
+def test_fetch_all_planets_follows_pages(monkeypatch):
+    base = "https://swapi.dev/api/planets/"
+    pages = {
+        base: {"next": f"{base}?page=2", "results": [{"url": f"{base}1/", "name": "Tatooine"}]},
+        f"{base}?page=2": {"next": None, "results": [{"url": f"{base}2/", "name": "Alderaan"}]},
+    }
+    monkeypatch.setattr(fetch_homeworld, "get_json", pages.__getitem__)
+
+    planets = fetch_homeworld.fetch_all_planets(base)
+
+    assert {url: p["homeworld_name"] for url, p in planets.items()} == {
+        f"{base}1/": "Tatooine",
+        f"{base}2/": "Alderaan",
+    }
@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+
+from benchmarks.synthetic import new_pages, old_pages, synthetic_resolve
+from frames import FINAL_COLUMNS, add_planets, merge_sources
+from load_to_db import content_hash, load_data
+from model import metadata
+from outputs import typed_frame
+from precompute import compute_stats
+
+UNRESOLVED = "https://swapi.info/api/planets/999"
+
+
+@pytest.fixture(scope="module")
+def sources():
+    old = [c for page in old_pages(600, 50) for c in page][:500]
+    new = [c for page in new_pages(600, 12, 50) for c in page][:550]
+    new[3]["homeworld"] = None
+    new[4]["gender"] = None
+    new[5]["homeworld"] = UNRESOLVED
+    return old, new
+
+
+def resolve(homeworlds):
+    return synthetic_resolve(homeworlds).drop(UNRESOLVED)
+
+
+@pytest.fixture(scope="module")
+def object_df(sources):
+    old, new = sources
+    merge_df = pd.merge(pd.DataFrame(old), pd.DataFrame(new), on="name", how="outer")
+    planet_df = resolve(merge_df["homeworld"])
+    return merge_df.merge(planet_df, left_on="homeworld", right_index=True, how="left")
+
+
+@pytest.fixture(scope="module")
+def typed_df(sources):
+    merge_df = merge_sources(*sources)
+    return add_planets(merge_df, resolve(merge_df["homeworld"]))
+
+
+def plain(df):
+    return df.astype(object).where(df.notna(), None)
+
+
+def test_typed_frames_hold_the_same_values(object_df, typed_df):
+    assert list(typed_df.columns) == FINAL_COLUMNS == list(object_df.columns)
+    assert plain(typed_df).equals(plain(object_df))
+    assert isinstance(typed_df["gender"].dtype, pd.CategoricalDtype)
+    assert isinstance(typed_df["climate"].dtype, pd.CategoricalDtype)
+    assert typed_df.memory_usage(deep=True).sum() < object_df.memory_usage(deep=True).sum() / 2
+
+
+def test_typed_frames_hash_load_and_aggregate_alike(tmp_path, object_df, typed_df):
+    # Same content hashes, so a typed run finds nothing changed
+    assert content_hash(typed_df).equals(content_hash(object_df))
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'frames.db'}")
+    metadata.create_all(engine)
+    load_data(object_df, db_engine=engine, mode="incremental")
+    counts = load_data(typed_df, db_engine=engine, mode="incremental")
+    assert counts["inserted"] == counts["updated"] == counts["deleted"] == 0
+
+    assert compute_stats(typed_df) == compute_stats(object_df)
+    assert typed_frame(typed_df).equals(typed_frame(object_df))
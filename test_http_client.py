@@ -0,0 +1,37 @@
+import httpx
+import pytest
+
+import http_client
+from http_client import HTTPClient, CircuitOpenError, host_stats, reset_stats
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    reset_stats()
+    monkeypatch.setattr(http_client, "_retry_delay", lambda attempt, response=None: 0)
+    yield
+    reset_stats()
+
+
+def test_retries_5xx_then_succeeds():
+    responses = iter([httpx.Response(503), httpx.Response(429), httpx.Response(200, json={"ok": True})])
+    client = HTTPClient(transport=httpx.MockTransport(lambda request: next(responses)))
+
+    assert client.get_json("https://swapi.test/api/planets/1") == {"ok": True}
+
+    stats = host_stats()["swapi.test"]
+    assert stats["requests"] == 3
+    assert stats["retries"] == 2
+    assert stats["circuit"] == "closed"
+
+
+def test_circuit_opens_after_repeated_failures():
+    client = HTTPClient(transport=httpx.MockTransport(lambda request: httpx.Response(500)))
+
+    with pytest.raises(httpx.HTTPStatusError):
+        client.get_json("https://down.test/api/people")
+
+    with pytest.raises(CircuitOpenError):
+        client.get_json("https://down.test/api/people")
+
+    assert host_stats()["down.test"]["circuit"] == "open"
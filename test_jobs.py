@@ -0,0 +1,153 @@
+import json
+import time
+
+import pytest
+from sqlalchemy import create_engine, insert, select, update
+from sqlalchemy.exc import OperationalError
+
+import db
+from db import sqlite_engine
+from jobs import STAGE_SECONDS, JobRunner, RowLock, RunRecord, db_lock, next_interval
+from model import etl_runs, job_locks, metadata
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    metadata.create_all(engine)
+    return engine
+
+
+def runs(engine):
+    with engine.connect() as conn:
+        return conn.execute(select(etl_runs).order_by(etl_runs.c.id)).mappings().all()
+
+
+def test_next_interval_backs_off_while_nothing_changes():
+    options = dict(base=60, maximum=600, factor=4, backoff=2)
+    assert next_interval(60, 1, changed=False, **options) == 120
+    assert next_interval(480, 1, changed=False, **options) == 600
+    assert next_interval(480, 1, changed=True, **options) == 60
+    # A slow run stretches the wait even when data changed
+    assert next_interval(60, 50, changed=True, **options) == 200
+
+
+def test_row_lock_excludes_other_owners_until_released_or_expired(engine):
+    first = RowLock(engine, "etl", "host:1")
+    second = RowLock(engine, "etl", "host:2")
+    assert first.acquire()
+    assert not second.acquire()
+
+    first.release()
+    assert second.acquire()
+
+    # A holder that stopped heartbeating loses the lock
+    with engine.begin() as conn:
+        conn.execute(update(job_locks).values(expires_at=job_locks.c.acquired_at))
+    assert first.acquire()
+    assert not second.heartbeat()
+
+
+def test_runner_records_stages_counts_and_failures(engine):
+    intervals = []
+
+    def job(record):
+        with record.stage("extract"):
+            record.count(characters=10, planets=3)
+        with record.stage("load"):
+            record.count(inserted=13, updated=0, unchanged=0, deleted=0)
+
+    def failing(record):
+        with record.stage("load"):
+            raise RuntimeError("boom")
+
+    runner = JobRunner(job, pipeline="batch", db_engine=engine, interval=60, on_interval=intervals.append)
+    runner.run_once()
+    runner.job = failing
+    runner.run_once()
+
+    ok, failed = runs(engine)
+    assert ok["status"] == "succeeded" and ok["pipeline"] == "batch"
+    assert list(json.loads(ok["stages"])) == ["extract", "load"]
+    assert (ok["characters"], ok["planets"], ok["inserted"]) == (10, 3, 13)
+    assert failed["status"] == "failed"
+    assert failed["error"] == "load: RuntimeError: boom"
+    assert failed["finished_at"] is not None
+    assert intervals == [ok["next_interval_s"], failed["next_interval_s"]]
+    assert {("extract",), ("load",)} <= set(STAGE_SECONDS.values())
+
+    # The lock went with the runs
+    with engine.connect() as conn:
+        assert conn.execute(select(job_locks)).first() is None
+
+
+def test_overlapping_runs_are_skipped(engine):
+    nested = []
+
+    def job(record):
+        nested.append(runner.run_once())
+
+    runner = JobRunner(job, db_engine=engine)
+    runner.run_once()
+    assert nested == [None]
+    assert len(runs(engine)) == 1
+
+    # Another process holding the lock keeps this one out entirely
+    assert RowLock(engine, "etl", "elsewhere:1").acquire()
+    assert runner.run_once() is None
+    assert len(runs(engine)) == 1
+
+
+# On the tuned SQLite backend the load holds the one writer connection and
+# the write lock for its whole transaction
+def test_row_lock_survives_a_load_holding_the_writer(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "SQLITE_BUSY_TIMEOUT_MS", 100)
+    writer = sqlite_engine(str(tmp_path / "jobs.db"))
+    metadata.create_all(writer)
+    lock = db_lock(writer, "etl", "host:1")
+    assert lock.acquire()
+
+    with writer.begin() as conn:
+        conn.execute(update(job_locks).values(expires_at=job_locks.c.acquired_at))
+        # The lock has connections of its own: the heartbeat waits on the
+        # write lock instead of the pool, and so does any other process
+        with pytest.raises(OperationalError, match="locked"):
+            lock.heartbeat()
+        assert not db_lock(writer, "etl", "host:2").acquire()
+        # Renewed before the commit that releases the write lock
+        RunRecord(lock).renew_lock(conn)
+
+    with writer.connect() as conn:
+        row = conn.execute(select(job_locks)).one()
+    assert row.owner == "host:1" and row.expires_at > row.acquired_at
+    assert lock.heartbeat()
+
+
+def test_load_rolls_back_when_the_lock_was_taken_over(engine):
+    lock = RowLock(engine, "etl", "host:1")
+    assert lock.acquire()
+    with engine.begin() as conn:
+        conn.execute(update(job_locks).values(owner="host:2"))
+
+    with pytest.raises(RuntimeError, match="taken over"):
+        with engine.begin() as conn:
+            conn.execute(insert(etl_runs).values(owner="host:1", status="running"))
+            RunRecord(lock).renew_lock(conn)
+    assert runs(engine) == []
+
+
+def test_nested_stages_are_timed_apart_from_the_outer_one():
+    record = RunRecord()
+    start = time.perf_counter()
+    with pytest.raises(RuntimeError):
+        with record.stage("pipeline"):
+            time.sleep(0.02)
+            with record.stage("stats"):
+                time.sleep(0.05)
+                raise RuntimeError("boom")
+    runtime = time.perf_counter() - start
+
+    assert record.stages["stats"] >= 0.05
+    assert 0.02 <= record.stages["pipeline"] < 0.05
+    assert sum(record.stages.values()) <= runtime
+    assert record.failed_stage == "stats"
@@ -0,0 +1,116 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select, func, inspect
+
+from api import app
+from benchmarks.synthetic import make_final_df
+from generation import current_generation
+from load_to_db import load_data, rollback_snapshot
+from model import metadata, planets, characters, load_runs
+
+
+def make_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'load.db'}")
+    metadata.create_all(engine)
+    return engine
+
+
+def test_load_data_bulk_inserts_planets_and_characters(tmp_path):
+    engine = make_engine(tmp_path)
+    final_df = make_final_df(500, n_planets=12)
+
+    load_data(final_df, db_engine=engine)
+    load_data(final_df, db_engine=engine)
+
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(planets)).scalar() == final_df[
+            "homeworld_name"
+        ].nunique()
+        assert conn.execute(select(func.count()).select_from(characters)).scalar() == 500
+
+        row = conn.execute(
+            select(characters.c.name, planets.c.name)
+            .join(planets, characters.c.planet_id == planets.c.id)
+            .where(characters.c.name == "Character 1")
+        ).one()
+        expected = final_df.loc[final_df["name"] == "Character 1", "homeworld_name"].item()
+        assert row[1] == expected
+
+
+def test_incremental_load_only_touches_changed_rows(tmp_path):
+    engine = make_engine(tmp_path)
+    final_df = make_final_df(200, n_planets=10)
+
+    first = load_data(final_df, db_engine=engine, mode="incremental")
+    assert first["inserted"] == 200 + final_df["homeworld_name"].nunique()
+
+    with engine.connect() as conn:
+        ids_before = dict(conn.execute(select(characters.c.uid, characters.c.id)).all())
+
+    assert load_data(final_df, db_engine=engine, mode="incremental") == {
+        "inserted": 0,
+        "updated": 0,
+        "unchanged": first["inserted"],
+        "deleted": 0,
+    }
+
+    changed = final_df.iloc[:-1].copy()
+    changed.loc[0, "mass"] = "999"
+    counts = load_data(changed, db_engine=engine, mode="incremental")
+    assert counts["updated"] == 1
+    assert counts["deleted"] >= 1
+
+    with engine.connect() as conn:
+        ids_after = dict(conn.execute(select(characters.c.uid, characters.c.id)).all())
+        assert conn.execute(
+            select(characters.c.mass).where(characters.c.uid == changed.loc[0, "uid"])
+        ).scalar() == 999.0
+        assert conn.execute(select(func.count()).select_from(load_runs)).scalar() == 3
+
+    assert all(ids_after[uid] == ids_before[uid] for uid in ids_after)
+
+
+def test_snapshot_load_swaps_generations_and_rolls_back(tmp_path):
+    engine = make_engine(tmp_path)
+    small = make_final_df(100, n_planets=5)
+    large = make_final_df(150, n_planets=5)
+
+    load_data(small, db_engine=engine, mode="snapshot")
+    load_data(large, db_engine=engine, mode="snapshot")
+
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(characters)).scalar() == 150
+        assert "characters_prev_2" in inspect(conn).get_table_names()
+
+    with pytest.raises(ValueError):
+        load_data(large.iloc[:10], db_engine=engine, mode="snapshot")
+
+    assert rollback_snapshot(db_engine=engine) == 2
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(characters)).scalar() == 100
+
+
+# A rollback is a new generation: cached responses and ETags for the data it
+# replaced are not served again
+def test_rollback_changes_cached_responses(served):
+    engine = served(make_final_df(100, n_planets=5), mode="snapshot")
+    load_data(make_final_df(150, n_planets=5), db_engine=engine, mode="snapshot")
+
+    client = TestClient(app)
+    params = {"limit": 1000}
+    before = client.get("/characters", params=params)
+    assert len(before.json()) == 150
+    assert client.get("/characters", params=params).headers["X-Cache"] == "HIT"
+
+    rollback_snapshot(db_engine=engine)
+
+    assert current_generation(engine)[0] == 3
+    after = client.get("/characters", params=params)
+    assert after.headers["X-Cache"] == "MISS"
+    assert after.headers["ETag"] != before.headers["ETag"]
+    assert len(after.json()) == 100
+
+    with engine.connect() as conn:
+        run = conn.execute(select(load_runs).order_by(load_runs.c.id.desc())).mappings().first()
+    assert run["mode"] == "rollback"
+    assert (run["inserted"], run["deleted"]) == (105, 155)
@@ -0,0 +1,105 @@
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+from api import app, route_template
+from jobs import JobRunner
+from metrics import Counter, Histogram, REGISTRY
+from model import metadata
+
+client = TestClient(app)
+
+
+# Entering the client runs the app's lifespan, which creates the schema
+@pytest.fixture(scope="module", autouse=True)
+def started():
+    with client:
+        yield
+
+
+def sample(text, name, **labels):
+    wanted = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    pattern = "^" + re.escape(name + (f"{{{wanted}}}" if labels else "")) + r" (\S+)$"
+    match = re.search(pattern, text, re.MULTILINE)
+    return float(match.group(1)) if match else None
+
+
+def test_histograms_render_cumulative_buckets():
+    histogram = Histogram("test_latency_seconds", "Test", ["route"], buckets=(0.1, 1))
+    counter = Counter("test_events_total", "Test", ["kind"])
+    try:
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.observe(value, route='/a"b')
+        counter.inc(kind="x")
+        counter.inc(2, kind="x")
+
+        text = "\n".join(histogram.render() + counter.render())
+        assert "# TYPE test_latency_seconds histogram" in text
+        assert sample(text, "test_latency_seconds_bucket", route='/a\\"b', le="0.1") == 2
+        assert sample(text, "test_latency_seconds_bucket", route='/a\\"b', le="1") == 3
+        assert sample(text, "test_latency_seconds_bucket", route='/a\\"b', le="+Inf") == 4
+        assert sample(text, "test_latency_seconds_sum", route='/a\\"b') == 3.65
+        assert sample(text, "test_latency_seconds_count", route='/a\\"b') == 4
+        assert sample(text, "test_events_total", kind="x") == 3
+    finally:
+        REGISTRY.remove(histogram)
+        REGISTRY.remove(counter)
+
+
+def test_routes_are_labelled_by_template():
+    assert route_template("GET", "/characters/12") == "/characters/{character_id}"
+    assert route_template("GET", "/planets/name/Tatooine/characters") == (
+        "/planets/name/{planet_name}/characters"
+    )
+    assert route_template("GET", "/nowhere/at/all") == "unmatched"
+
+
+def test_metrics_endpoint_reports_routes_cache_and_pools():
+    route = "/characters/{character_id}"
+    before = client.get("/metrics").text
+    count_before = sample(before, "http_request_duration_seconds_count", method="GET", route=route) or 0
+    hits_before = sample(before, "response_cache_hits_total")
+
+    client.get("/characters/1", params={"m": "1"})
+    client.get("/characters/1", params={"m": "1"})
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+
+    assert sample(text, "http_request_duration_seconds_count", method="GET", route=route) == (
+        count_before + 2
+    )
+    assert sample(text, "http_requests_in_flight", route="/metrics") == 1
+    assert sample(text, "response_cache_hits_total") >= hits_before
+    assert sample(text, "db_pool_size", pool="main") is not None
+    assert "db_pool_checkout_wait_seconds_bucket" in text
+
+
+# The ETL series live in the process that runs the jobs (the scheduler),
+# whose /metrics serves them next to the API's own
+def test_etl_series_after_a_job_run(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    metadata.create_all(engine)
+    text = client.get("/metrics").text
+    runs_before = sample(text, "etl_runs_total", status="succeeded") or 0
+    stages_before = sample(text, "etl_stage_duration_seconds_count", stage="metrics-test") or 0
+
+    def job(record):
+        with record.stage("metrics-test"):
+            record.count(inserted=7)
+
+    JobRunner(job, db_engine=engine, interval=60).run_once()
+
+    text = client.get("/metrics").text
+    assert sample(text, "etl_runs_total", status="succeeded") == runs_before + 1
+    assert sample(text, "etl_stage_duration_seconds_count", stage="metrics-test") == (
+        stages_before + 1
+    )
+    assert sample(text, "etl_rows_total", kind="inserted") >= 7
+    assert sample(text, "etl_run_duration_seconds_count", status="succeeded") >= 1
+    assert sample(text, "etl_last_success_timestamp_seconds") > 0
+    assert sample(text, "etl_next_interval_seconds") >= 60
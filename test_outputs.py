@@ -0,0 +1,76 @@
+import json
+
+import pandas as pd
+import pytest
+
+import outputs
+from benchmarks.synthetic import make_final_df
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+@pytest.fixture
+def final_df():
+    df = make_final_df(120, n_planets=6)
+    df.loc[::5, "mass"] = "unknown"
+    return df
+
+
+@pytest.fixture(autouse=True)
+def in_tmp(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+
+def test_default_outputs_are_typed_columnar(final_df):
+    written = outputs.write_outputs(final_df, ["parquet", "arrow"])
+    assert written == [outputs.FINAL_PARQUET_PATH, outputs.FINAL_ARROW_FILE]
+
+    table = pq.read_table(outputs.FINAL_PARQUET_PATH)
+    assert table.schema.field("mass").type == "double"
+    assert table.schema.field("population").type == "int64"
+    assert table.num_rows == 120
+    assert table.column("mass").null_count == len(range(0, 120, 5))
+
+    arrow = outputs.read_arrow()
+    assert arrow.equals(table)
+
+
+def test_partitioned_parquet_by_homeworld(final_df, monkeypatch):
+    outputs.write_parquet(outputs.typed_frame(final_df), partitioned=True)
+    # Rewriting replaces the dataset instead of adding files to it
+    outputs.write_parquet(outputs.typed_frame(final_df), partitioned=True)
+
+    table = pq.read_table(outputs.FINAL_PARQUET_PATH)
+    assert table.num_rows == 120
+    names = set(table.column("homeworld_name").to_pylist())
+    assert names == set(final_df["homeworld_name"])
+
+
+def test_legacy_formats_behind_flag(final_df):
+    written = outputs.write_outputs(final_df, ["csv", "json"])
+    assert written == [outputs.FINAL_CSV_FILE, outputs.FINAL_JSON_FILE]
+    assert len(pd.read_csv(outputs.FINAL_CSV_FILE)) == 120
+    assert len(json.load(open(outputs.FINAL_JSON_FILE))) == 120
+
+
+def test_chunked_writes_match_single_frame(final_df, tmp_path):
+    formats = ["parquet", "arrow", "csv", "json"]
+    outputs.write_outputs(final_df, formats)
+    single = {
+        "parquet": pq.read_table(outputs.FINAL_PARQUET_PATH),
+        "csv": open(outputs.FINAL_CSV_FILE).read(),
+        "json": open(outputs.FINAL_JSON_FILE).read(),
+    }
+
+    writer = outputs.OutputWriter(formats)
+    for start in range(0, len(final_df), 50):
+        writer.write(final_df.iloc[start : start + 50])
+    # Nothing replaces the previous files before close()
+    assert pq.read_table(outputs.FINAL_PARQUET_PATH).equals(single["parquet"])
+    writer.close()
+
+    assert pq.read_table(outputs.FINAL_PARQUET_PATH).equals(single["parquet"])
+    assert outputs.read_arrow().equals(single["parquet"])
+    assert open(outputs.FINAL_CSV_FILE).read() == single["csv"]
+    assert open(outputs.FINAL_JSON_FILE).read() == single["json"]
+    assert not list(tmp_path.glob("*.tmp"))
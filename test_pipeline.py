@@ -0,0 +1,139 @@
+import time
+from contextlib import asynccontextmanager
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, select
+
+from benchmarks.synthetic import (
+    as_async,
+    new_pages,
+    old_pages,
+    synthetic_resolve,
+    synthetic_sources,
+)
+from load_to_db import load_data
+from model import metadata, characters, planets
+from pipeline import FINAL_COLUMNS, Pipeline, stream_final
+
+
+def make_engine(tmp_path, name):
+    engine = create_engine(f"sqlite:///{tmp_path / name}")
+    metadata.create_all(engine)
+    return engine
+
+
+def dump(engine):
+    with engine.connect() as conn:
+        return (
+            sorted(
+                tuple(r)
+                for r in conn.execute(
+                    select(
+                        characters.c.uid,
+                        characters.c.name,
+                        characters.c.height,
+                        characters.c.mass,
+                        characters.c.gender,
+                        planets.c.url,
+                    ).join(planets)
+                )
+            ),
+            sorted(tuple(r[1:]) for r in conn.execute(select(planets))),
+        )
+
+
+# run_etl's batch path over the same pages
+def batch_final_df(n_characters, n_planets, limit):
+    def collect(pages):
+        taken, rows = 0, []
+        for page in pages:
+            page = page[: limit - taken]
+            taken += len(page)
+            rows += page
+        return pd.DataFrame(rows)
+
+    merge_df = pd.merge(
+        collect(old_pages(n_characters, 25)),
+        collect(new_pages(n_characters, n_planets, 25)),
+        on="name",
+        how="outer",
+    )
+    planet_df = synthetic_resolve(merge_df["homeworld"])
+    return merge_df.merge(planet_df, left_on="homeworld", right_index=True, how="left")
+
+
+def test_streamed_load_matches_batch_load(tmp_path):
+    # The limit leaves characters only one source knows on both sides
+    final_df = batch_final_df(400, 15, limit=300)
+    batch = make_engine(tmp_path, "batch.db")
+    load_data(final_df, db_engine=batch, mode="incremental")
+
+    chunks = list(
+        stream_final(
+            300,
+            None,
+            chunk_rows=60,
+            queue_chunks=2,
+            sources=synthetic_sources(400, 15, page_rows=25),
+            resolve=synthetic_resolve,
+        )
+    )
+    assert all(list(c.columns) == FINAL_COLUMNS for c in chunks)
+    assert max(len(c) for c in chunks) <= 60 + 25
+    assert sum(len(c) for c in chunks) == len(final_df)
+
+    streamed = make_engine(tmp_path, "streamed.db")
+    load_data(iter(chunks), db_engine=streamed, mode="stream")
+    assert dump(streamed) == dump(batch)
+
+    # A second pass over unchanged data is a no-op
+    counts = load_data(iter(chunks), db_engine=streamed, mode="stream")
+    assert counts["inserted"] == counts["updated"] == counts["deleted"] == 0
+
+
+def test_slow_consumer_holds_back_extraction():
+    produced = []
+
+    def counted(pages):
+        for page in pages:
+            produced.append(len(page))
+            yield page
+
+    @asynccontextmanager
+    async def sources(limit):
+        yield (
+            as_async(old_pages(500, 10), limit),
+            as_async(counted(new_pages(500, 5, 10)), limit),
+        )
+
+    stream = stream_final(
+        None, None, chunk_rows=10, queue_chunks=1, sources=sources, resolve=synthetic_resolve
+    )
+    next(stream)
+    time.sleep(0.5)
+    # Bounded by the two queues and the page each stage holds, not 50 pages
+    assert len(produced) <= 8
+    assert sum(len(c) for c in stream) + 10 == 500
+
+
+def test_source_failure_stops_every_stage():
+    async def failing(pages):
+        async for page in pages:
+            yield page
+            raise ConnectionError("swapi.info went away")
+
+    @asynccontextmanager
+    async def sources(limit):
+        yield (
+            as_async(old_pages(500, 10), limit),
+            failing(as_async(new_pages(500, 5, 10), limit)),
+        )
+
+    pipeline = Pipeline(
+        None, None, chunk_rows=5, queue_chunks=1, sources=sources, resolve=synthetic_resolve
+    )
+    with pytest.raises(ConnectionError):
+        for _ in pipeline:
+            pass
+    assert pipeline.stop.is_set()
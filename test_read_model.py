@@ -0,0 +1,110 @@
+import pytest
+
+import queries
+from benchmarks.synthetic import make_final_df
+from read_model import ReadModel
+
+
+@pytest.fixture(scope="module")
+def sources(served_module):
+    final_df = make_final_df(300, n_planets=15)
+    final_df.loc[::7, "height"] = "unknown"
+    final_df.loc[::11, "mass"] = "n/a"
+    engine = served_module(final_df)
+    return queries, ReadModel.load(engine)
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {},
+        {"limit": 25, "sort": "-height"},
+        {"limit": 10, "sort": "name", "name": "character 1"},
+        {"sort": "population", "min_population": 10**11, "planet_fields": ["population"]},
+        {"min_height": 100, "max_mass": 150, "character_fields": ["id", "name"], "planet_fields": []},
+        {"planet": "planet 1", "after_id": 50, "limit": 20},
+        {"name": "ACTER 2", "match": "substring", "sort": "-mass"},
+        {"name": "character 1", "match": "prefix", "limit": 30},
+        {"name": "charcter 12", "match": "fuzzy", "limit": 5},
+        {"include": "planet", "sort": "-population", "limit": 30},
+        {"include": "planet", "character_fields": ["id", "name"], "min_height": 200},
+    ],
+)
+def test_read_model_matches_sql(sources, params):
+    sql, model = sources
+    assert model.list_characters(**params) == sql.list_characters(**params)
+
+
+@pytest.mark.parametrize("sort", ["height", "-mass", "name", "-population"])
+def test_read_model_cursor_pages_match_sql(sources, sort):
+    sql, model = sources
+    cursor = None
+    for _ in range(50):
+        expected = sql.list_characters(sort=sort, limit=40, cursor=cursor)
+        assert model.list_characters(sort=sort, limit=40, cursor=cursor) == expected
+        cursor = expected[1]
+        if cursor is None:
+            break
+
+
+def test_read_model_point_lookups_match_sql(sources):
+    sql, model = sources
+    assert model.character_by_id(5) == sql.character_by_id(5)
+    assert model.character_by_name("CHARACTER 7") == sql.character_by_name("CHARACTER 7")
+    assert model.list_planets("planet 1") == sql.list_planets("planet 1")
+    assert model.planet_by_id(3) == sql.planet_by_id(3)
+    assert model.planet_with_characters("Planet 4") == sql.planet_with_characters("Planet 4")
+    assert model.character_by_id(10**6) is None
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"include": "characters"},
+        {"include": "characters", "after_id": 4, "limit": 5},
+        {"name": "planet 1", "match": "prefix", "include": "characters", "limit": 3},
+        {"name": "planet 1", "after_id": 10},
+    ],
+)
+def test_read_model_planet_pages_match_sql(sources, params):
+    sql, model = sources
+    assert model.list_planets(**params) == sql.list_planets(**params)
+
+
+def test_included_residents_match_planet_with_characters(sources):
+    sql, _ = sources
+    for planet in sql.list_planets(include="characters"):
+        assert planet == sql.planet_with_characters(planet["name"])
+
+
+def test_read_model_batch_lookups_match_sql(sources):
+    sql, model = sources
+    ids = [7, 0, 300, 301, 7, 42]
+    assert model.characters_by_ids(ids) == sql.characters_by_ids(ids)
+    assert model.planets_by_ids(ids) == sql.planets_by_ids(ids)
+
+    names = ["Character 9", "CHARACTER 9", "nobody", "Planet 3"]
+    assert model.characters_by_names(names) == sql.characters_by_names(names)
+    assert model.planets_by_names(names) == sql.planets_by_names(names)
+
+
+def test_batch_lookups_are_chunked(sources, monkeypatch):
+    sql, _ = sources
+    ids = list(range(1, 301))
+    expected = sql.characters_by_ids(ids)
+    monkeypatch.setattr(sql, "BATCH_CHUNK_SIZE", 7)
+    assert sql.characters_by_ids(ids) == expected
+    assert all(c["id"] == i for c, i in zip(expected, ids))
+
+
+@pytest.mark.parametrize("match", ["substring", "prefix", "fuzzy"])
+def test_read_model_planet_search_matches_sql(sources, match):
+    sql, model = sources
+    assert model.list_planets("planet 1", match) == sql.list_planets("planet 1", match)
+
+
+def test_fuzzy_search_rejects_paging(sources):
+    sql, model = sources
+    for source in (sql, model):
+        with pytest.raises(ValueError):
+            source.list_characters(name="character", match="fuzzy", sort="-height")
@@ -0,0 +1,108 @@
+import threading
+
+import numpy as np
+import pytest
+
+import search_index
+from benchmarks.synthetic import make_final_df
+from generation import current_generation
+from load_to_db import load_data
+from search_index import NgramIndex, padded_trigrams
+
+NAMES = [
+    "Luke Skywalker",
+    "Anakin Skywalker",
+    "Shmi Skywalker",
+    "Leia Organa",
+    "Bail Prestor Organa",
+    "Han Solo",
+    "Obi-Wan Kenobi",
+    "Darth Vader",
+    "Darth Maul",
+    "R2-D2",
+    "C-3PO",
+    None,
+]
+
+
+@pytest.fixture(scope="module")
+def index():
+    return NgramIndex(range(100, 100 + len(NAMES)), NAMES)
+
+
+def brute_force(needle, test):
+    return [100 + i for i, n in enumerate(NAMES) if test((n or "").lower(), needle.lower())]
+
+
+@pytest.mark.parametrize("needle", ["sky", "SKYWALKER", "organa", "a", "d2", "-", "wan k", "xyz", ""])
+def test_substring_matches_brute_force(index, needle):
+    expected = brute_force(needle, lambda name, q: q in name)
+    assert index.matching_keys(needle, "substring").tolist() == expected
+
+
+@pytest.mark.parametrize("needle", ["darth", "l", "Han Solo", "han solo!", "r2"])
+def test_prefix_matches_brute_force(index, needle):
+    expected = brute_force(needle, lambda name, q: name.startswith(q))
+    assert index.matching_keys(needle, "prefix").tolist() == expected
+
+
+def test_search_ranks_exact_then_prefix_then_substring():
+    index = NgramIndex([1, 2, 3, 4], ["Ben Kenobi", "Kenobi", "Kenobi Sr", "Obi-Wan Kenobi"])
+    assert index.search("kenobi").tolist() == [2, 3, 1, 4]
+    assert index.search("kenobi", limit=2).tolist() == [2, 3]
+
+
+def test_fuzzy_tolerates_typos(index):
+    assert index.search("Luke Skywlaker", "fuzzy")[0] == 100
+    assert index.search("Darth Vadr", "fuzzy")[0] == 107
+    assert index.search("qqqqqq", "fuzzy").tolist() == []
+
+
+def test_fuzzy_scores_match_trigram_similarity(index):
+    query = "skywalker"
+    docs, scores = index.fuzzy(query, min_similarity=0.0)
+    grams = padded_trigrams(query)
+    for doc, score in zip(docs, scores):
+        name_grams = padded_trigrams((NAMES[doc] or "").lower())
+        expected = len(grams & name_grams) / len(grams | name_grams)
+        assert score == pytest.approx(expected)
+
+
+def test_unknown_match_mode_is_rejected(index):
+    with pytest.raises(ValueError):
+        index.search("luke", "regex")
+
+
+def test_empty_index():
+    index = NgramIndex(np.empty(0, dtype="int64"), [])
+    assert index.matching_keys("luke").tolist() == []
+    assert index.search("luke", "fuzzy").tolist() == []
+
+
+# After a load, searches keep the previous index while the new one builds
+def test_new_generation_is_indexed_off_the_request_path(served, monkeypatch):
+    engine = served(make_final_df(50, n_planets=5))
+    first = search_index.index_for("characters", engine)
+    assert first.matching_keys("character 60").size == 0
+
+    load_data(make_final_df(60, n_planets=5), db_engine=engine, mode="full")
+    release = threading.Event()
+    build = search_index.build
+
+    def slow_build(table_name, db_engine):
+        release.wait(5)
+        return build(table_name, db_engine)
+
+    monkeypatch.setattr(search_index, "build", slow_build)
+    generation, _ = current_generation(engine)
+    threads = search_index.rebuild_in_background(generation, engine)
+
+    # Served at once from the previous generation's index
+    assert search_index.index_for("characters", engine) is first
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    rebuilt = search_index.index_for("characters", engine)
+    assert rebuilt is not first
+    assert rebuilt.matching_keys("character 60").size == 1
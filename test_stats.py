@@ -0,0 +1,130 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import generation
+import precompute
+import queries
+import stats
+from api import app
+from benchmarks.synthetic import make_final_df
+from generation import on_generation_change
+from load_to_db import load_data
+
+client = TestClient(app)
+
+
+@pytest.fixture(scope="module")
+def final_df():
+    df = make_final_df(400, n_planets=20, seed=3)
+    df.loc[::9, "height"] = "unknown"
+    df.loc[::13, "gender"] = None
+    df.loc[df["homeworld_name"] == "Planet 4", "population"] = "unknown"
+    df.loc[df["homeworld_name"] == "Planet 5", "climate"] = "arid, temperate"
+    return df
+
+
+@pytest.fixture(scope="module")
+def loaded(served_module, final_df):
+    engine = served_module(final_df)
+    computed = precompute.compute_stats(final_df)
+    precompute.save_stats(computed, db_engine=engine)
+    return computed
+
+
+def approx_groups(groups):
+    return [{"key": g["key"], "value": pytest.approx(g["value"])} for g in groups]
+
+
+@pytest.mark.parametrize("by", list(stats.GROUP_DIMENSIONS))
+@pytest.mark.parametrize(
+    "agg, field",
+    [("count", None), ("sum", "population"), ("avg", "height"), ("min", "mass"), ("max", "population")],
+)
+def test_precomputed_groups_match_sql(loaded, final_df, by, agg, field):
+    _, joined = precompute.stats_frames(final_df)
+    expected = stats.group_by_sql(by, agg, field)
+    assert precompute.group_by_frame(joined, by, agg, field) == approx_groups(expected)
+
+
+def test_computed_stats(loaded):
+    assert loaded["overview"] == {"characters": 400, "planets": 20}
+    assert loaded["population"]["unknown_planets"] == 1
+    assert sum(p["residents"] for p in loaded["residents"]) == 400
+    assert loaded["height"]["missing"] == len(range(0, 400, 9))
+    assert sum(b["count"] for b in loaded["height"]["histogram"]) == loaded["height"]["count"]
+
+    climates = {c["climate"]: c for c in loaded["climate"]}
+    assert climates["arid"]["planets"] >= 1 and climates["temperate"]["planets"] >= 1
+    assert loaded["gender"][-1]["key"] is None
+
+
+def rounded(value):
+    if isinstance(value, float):
+        return float(f"{value:.9g}")
+    if isinstance(value, dict):
+        return {k: rounded(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [rounded(v) for v in value]
+    return value
+
+
+# The streaming pipeline reads the same numbers back from the tables
+def test_stats_from_db_match_frame(loaded):
+    assert rounded(precompute.stats_from_db(queries.engine)) == rounded(loaded)
+
+
+def test_stat_endpoints(loaded):
+    response = client.get("/stats/residents")
+    assert response.status_code == 200
+    body = response.json()
+    assert body["precomputed"] is True
+    assert body["value"] == loaded["residents"]
+
+    names = {s["name"] for s in client.get("/stats").json()}
+    assert {"overview", "population", "height", "group_by.gender.count"} <= names
+    assert client.get("/stats/unknown").status_code == 404
+
+
+def test_group_by_endpoint_uses_precomputed_then_sql(loaded):
+    stored = client.get("/stats/group-by", params={"by": "gender", "agg": "avg", "field": "height"})
+    assert stored.json()["precomputed"] is True
+
+    adhoc = client.get("/stats/group-by", params={"by": "terrain", "agg": "max", "field": "mass"})
+    assert adhoc.status_code == 200
+    assert adhoc.json()["precomputed"] is False
+    assert adhoc.json()["value"] == json.loads(json.dumps(stats.group_by_sql("terrain", "max", "mass")))
+
+    assert client.get("/stats/group-by", params={"by": "eye_color"}).status_code == 400
+    assert client.get("/stats/group-by", params={"by": "gender", "agg": "avg"}).status_code == 400
+
+
+# A /stats request at the moment a load's generation becomes visible must
+# already see that load's documents, or the stale one is cached under it
+def test_stats_change_with_the_generation_that_loaded_them(served, monkeypatch):
+    engine = served()
+
+    def load(n):
+        final_df = make_final_df(n, n_planets=5, seed=n)
+        computed = precompute.compute_stats(final_df)
+        load_data(
+            final_df,
+            db_engine=engine,
+            mode="full",
+            after_load=lambda conn: precompute.store_stats(conn, computed),
+        )
+
+    seen = []
+
+    def request_stats(generation):
+        seen.append(client.get("/stats/overview").json()["value"]["characters"])
+
+    load(30)
+    assert client.get("/stats/overview").json()["value"]["characters"] == 30
+
+    monkeypatch.setattr(generation, "_listeners", [*generation._listeners])
+    on_generation_change(request_stats)
+    load(40)
+    assert seen == [40]
+    assert client.get("/stats/overview").json()["value"]["characters"] == 40